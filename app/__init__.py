@@ -33,6 +33,26 @@ def create_app():
     login_manager.init_app(app)
     app.register_blueprint(main)
 
+    # Background AI categorization of newly fetched tickets
+    from .categorization_queue import categorization_queue
+    categorization_queue.init_app(app)
+
+    # Background pre-warming of stored template recommendations
+    from .template_recommendations import template_recommendations
+    template_recommendations.init_app(app)
+
+    # Queued audit log writes
+    from .audit_log import audit_log
+    audit_log.init_app(app)
+
+    # Archiving of old audit log entries
+    from .audit_archive import audit_retention
+    audit_retention.init_app(app)
+
+    # Login throttling, with counters written in batches
+    from .login_throttle import login_throttle
+    login_throttle.init_app(app)
+
     # --- CSRF error handler ---
     from flask_wtf.csrf import CSRFError
     from .routes import LoginForm
@@ -46,7 +66,8 @@ def create_app():
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # session.get uses the identity map, so later lookups of this user in the request are free
+        return db.session.get(User, int(user_id))
 
     return app
 
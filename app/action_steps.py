@@ -0,0 +1,180 @@
+"""
+Template action steps for TeBSTrack
+Handles compiling each template's action steps (configured, or AI-suggested and stored) into a cached plan
+per template version, and filling in ticket variables in a single pass
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Placeholders that step titles and descriptions may contain
+VARIABLE_PATTERN = re.compile(r"\{(user_email|username|ticket_id|subject|category)\}")
+
+
+def ticket_variables(ticket_context: Dict[str, any]) -> Dict[str, str]:
+    """Values for each placeholder, from the ticket the steps are shown for"""
+    sender = ticket_context.get("sender", "user@example.com")
+    return {
+        "user_email": sender,
+        "username": sender.split("@")[0] if "@" in (ticket_context.get("sender") or "") else "username",
+        "ticket_id": str(ticket_context.get("id", "N/A")),
+        "subject": ticket_context.get("subject", ""),
+        "category": ticket_context.get("category", ""),
+    }
+
+
+class CompiledText:
+    """Text split once into literal parts and placeholders, so filling it in is a single join"""
+
+    __slots__ = ('parts',)
+
+    def __init__(self, text: str):
+        # re.split with one group alternates literal, variable name, literal, ...
+        self.parts = VARIABLE_PATTERN.split(text or '')
+
+    def render(self, variables: Dict[str, str]) -> str:
+        if len(self.parts) == 1:
+            return self.parts[0]
+        return ''.join(variables[part] if index % 2 else part for index, part in enumerate(self.parts))
+
+
+class CompiledStep:
+    """One action step with its text precompiled and its config parsed"""
+
+    __slots__ = ('fields', 'title', 'description')
+
+    def __init__(self, fields: Dict[str, any], title: str, description: str):
+        self.fields = fields
+        self.title = CompiledText(title)
+        self.description = CompiledText(description)
+
+    def render(self, variables: Dict[str, str]) -> Dict[str, any]:
+        step = dict(self.fields, title=self.title.render(variables), description=self.description.render(variables))
+        if 'config' in step:
+            step['config'] = dict(step['config'])
+        return step
+
+
+def template_content_hash(template) -> str:
+    """Changes when the template text AI-suggested steps were generated from changes"""
+    content = '\x1f'.join((template.name or '', template.subject or '', template.use_case_description or ''))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class ActionPlanCache:
+    """
+    Compiled step plans, kept in the settings cache under ('action_plan', template name). A plan
+    is reused while its template version (template row, and the IDs, order and text of its
+    steps) is unchanged; routes that edit a template or its steps call invalidate, which also
+    clears the plans other processes hold.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generate_locks = {}  # template id -> lock, so one LLM call per template however many panels open at once
+        self.stats = {'hits': 0, 'compiled': 0, 'generated': 0}
+
+    def invalidate(self, template_name: Optional[str] = None) -> None:
+        from .settings_cache import settings_cache
+        settings_cache.invalidate(None if template_name is None else ('action_plan', template_name))
+
+    @staticmethod
+    def _template_version(template_name: str) -> Tuple[Optional[object], List[object], Optional[Tuple]]:
+        """The active template, its configured steps and its version"""
+        from .models import EmailTemplate, TemplateActionStep
+        template = EmailTemplate.query.filter_by(name=template_name, is_active=True).first()
+        if template is None:
+            return None, [], None
+        configured = TemplateActionStep.query.filter_by(template_id=template.id).order_by(TemplateActionStep.step_order).all()
+        steps_hash = hashlib.sha256(json.dumps([
+            (step.id, step.step_order, step.step_type, step.is_automated,
+             step.step_title, step.step_description, step.step_config)
+            for step in configured
+        ]).encode('utf-8')).hexdigest()
+        return template, configured, (template.id, str(template.updated_at), steps_hash)
+
+    def get_steps(self, template_name: str, ticket_context: Dict[str, any]) -> List[Dict[str, any]]:
+        """Action steps for a template with the ticket's variables filled in ([] for unknown templates)"""
+        from .settings_cache import settings_cache, MISSING
+        template, configured, version = self._template_version(template_name)
+        if template is None:
+            return []
+        key = ('action_plan', template_name)
+        cached = settings_cache.get(key, lambda: MISSING)
+        if cached is not MISSING and cached[0] == version:
+            with self.lock:
+                self.stats['hits'] += 1
+            plan = cached[1]
+        else:
+            plan, cacheable = self._compile(template, configured)
+            if cacheable:
+                settings_cache.store(key, (version, plan))
+                with self.lock:
+                    self.stats['compiled'] += 1
+        variables = ticket_variables(ticket_context)
+        return [step.render(variables) for step in plan]
+
+    def _compile(self, template, configured) -> Tuple[List[CompiledStep], bool]:
+        """Compile configured steps, or stored (else newly generated) AI steps; False if the plan is a fallback"""
+        if configured:
+            return [
+                CompiledStep({
+                    "id": step.id,
+                    "order": step.step_order,
+                    "type": step.step_type,
+                    "is_automated": step.is_automated,
+                    "config": json.loads(step.step_config) if step.step_config else {},
+                }, step.step_title, step.step_description)
+                for step in configured
+            ], True
+
+        steps, generated = self._suggested_steps(template)
+        return [
+            CompiledStep({key: value for key, value in step.items() if key not in ('title', 'description')},
+                         str(step.get('title') or ''), str(step.get('description') or ''))
+            for step in steps
+        ], generated
+
+    def _suggested_steps(self, template) -> Tuple[List[Dict[str, any]], bool]:
+        """AI-suggested steps stored for this template, generating and storing them on first use"""
+        from .ai_service import get_ai_service
+        from .models import db, GeneratedActionSteps
+        content_hash = template_content_hash(template)
+        stored = GeneratedActionSteps.query.filter_by(template_id=template.id).first()
+        if stored and stored.template_hash == content_hash:
+            return json.loads(stored.steps_json), True
+
+        with self.lock:
+            generate_lock = self.generate_locks.setdefault(template.id, threading.Lock())
+        with generate_lock:
+            # Another panel may have generated them while this one waited
+            stored = GeneratedActionSteps.query.filter_by(template_id=template.id).populate_existing().first()
+            if stored and stored.template_hash == content_hash:
+                return json.loads(stored.steps_json), True
+
+            ai_service = get_ai_service()
+            steps = ai_service.generate_ai_action_steps(template)
+            if steps is None:
+                return ai_service.fallback_action_steps(template), False
+            if stored is None:
+                stored = GeneratedActionSteps(template_id=template.id)
+                db.session.add(stored)
+            stored.template_hash = content_hash
+            stored.steps_json = json.dumps(steps)
+            db.session.commit()
+        with self.lock:
+            self.stats['generated'] += 1
+        logging.info(f"Stored {len(steps)} AI-suggested action steps for template '{template.name}'")
+        return steps, True
+
+    def get_status(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+
+# Global compiled action plan cache
+action_plans = ActionPlanCache()
@@ -3,22 +3,74 @@ AI Service for TeBSTrack
 Handles ticket categorization, urgency prediction, template recommendation, and chatbot functionality
 """
 
-import openai
 import os
 import json
 import logging
 import shutil
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from .models import Category, db
+from .action_steps import action_plans
+from .chatbot_cache import chatbot_cache
+from .intent_matcher import analyze_intent, answer_from_ticket
+from .knowledge_cache import knowledge_cache
+from .knowledge_library import KnowledgeLibrary
+from .llm_backend import create_chat_backend
+from .llm_executor import llm_executor
+from .local_classifier import predict_confident
+from .prompt_layout import PromptLayout, prompt_cache_stats
+from .template_index import TEMPLATE_SHORTLIST_SIZE, is_decisive, local_confidence, template_index
+from .token_budget import (BATCH_BODY_MAX_TOKENS, BODY_MAX_TOKENS, KNOWLEDGE_MAX_TOKENS, QUESTION_MAX_TOKENS,
+                           SUBJECT_MAX_TOKENS, TokenBudget)
+
+# Number of knowledge base chunks injected per prompt (0 sends the whole document)
+KB_RETRIEVAL_TOP_K = int(os.getenv('KB_RETRIEVAL_TOP_K', 3))
+
+# Tickets packed into one batched categorization request
+AI_CATEGORIZATION_BATCH_SIZE = int(os.getenv('AI_CATEGORIZATION_BATCH_SIZE', 10))
+
+URGENCY_RUBRIC = """- Low: Minor issues, cosmetic problems, feature requests
+- Medium: Standard requests, non-critical issues affecting single user
+- High: Issues affecting multiple users or business processes
+- Urgent: System down, security issues, blocking business operations"""
 
 class TeBSTrackAI:
     def __init__(self):
-        # Get API key from system settings or environment
-        from .models import SystemSettings
-        api_key = SystemSettings.get_openai_api_key()
-        self.client = openai.OpenAI(api_key=api_key)
-        self.model = "gpt-4o-mini"  # Cost-effective for categorization
+        # Backend, model and API key come from system settings or environment
+        self.backend = create_chat_backend()
+        self.client = self.backend.client
+        self.model = self.backend.model
+        self.knowledge_library = KnowledgeLibrary()
         self.knowledge_base = self._load_knowledge_base()
+        self._rebuild_knowledge_index()
+        
+    def _rebuild_knowledge_index(self):
+        """Reload every knowledge document and its search index (cached artifacts are reused)"""
+        self.knowledge_library.refresh(fallback_text=self.knowledge_base or "")
+    
+    def search_knowledge(self, query: str, top_k: int = KB_RETRIEVAL_TOP_K) -> List[Dict[str, any]]:
+        """Search all knowledge documents; each hit carries its source document"""
+        return self.knowledge_library.search(query, top_k)
+    
+    def _get_relevant_knowledge(self, query: str, top_k: Optional[int] = None) -> str:
+        """Return only the knowledge base sections relevant to the query"""
+        if KB_RETRIEVAL_TOP_K <= 0 or not len(self.knowledge_library):
+            return self.knowledge_library.full_text() or self.knowledge_base
+        context = self.knowledge_library.get_context(query, top_k or KB_RETRIEVAL_TOP_K)
+        return context or "No knowledge base sections matched this request."
+    
+    def _add_knowledge(self, layout: PromptLayout, heading: str, query: str, top_k: Optional[int] = None,
+                       budget: Optional[TokenBudget] = None):
+        """
+        Add knowledge base context to a prompt: the whole document (retrieval off) is the
+        same on every call and joins the cacheable prefix, retrieved sections vary per request
+        """
+        knowledge = self._get_relevant_knowledge(query, top_k)
+        if budget:
+            knowledge = budget.fit('knowledge', knowledge, head_only=True)
+        if KB_RETRIEVAL_TOP_K <= 0 or not len(self.knowledge_library):
+            layout.add_static(heading, knowledge)
+        else:
+            layout.add_variable(heading, knowledge)
         
     def _load_knowledge_base(self) -> str:
         """Load the Infra Knowledge Transfer document content"""
@@ -54,7 +106,7 @@ class TeBSTrackAI:
             for path in copy_paths:
                 if os.path.exists(path):
                     try:
-                        content = DocumentLoader.load_knowledge_document(path)
+                        content = knowledge_cache.load_document(path)
                         if content:
                             logging.info(f"Loaded knowledge base from edited copy {path}")
                             return content
@@ -91,7 +143,7 @@ class TeBSTrackAI:
             for path in original_paths:
                 if os.path.exists(path):
                     try:
-                        content = DocumentLoader.load_knowledge_document(path)
+                        content = knowledge_cache.load_document(path)
                         if content:
                             logging.info(f"Loaded knowledge base from original document {path}")
                             return content
@@ -162,7 +214,8 @@ class TeBSTrackAI:
     
     def get_available_categories(self) -> List[str]:
         """Get current categories from database"""
-        categories = Category.query.all()
+        # Stable order keeps the category list byte-identical between prompts
+        categories = Category.query.order_by(Category.id).all()
         return [cat.name for cat in categories]
     
     def get_knowledge_base_status(self) -> Dict[str, any]:
@@ -246,6 +299,7 @@ class TeBSTrackAI:
             "source_path": current_source_path,
             "is_fallback_content": is_fallback,
             "has_document": source_type in ["original_document", "edited_document_copy"],
+            "documents": self.knowledge_library.sources(),
             "preview": self.knowledge_base[:200] + "..." if self.knowledge_base else "No knowledge base loaded"
         }
     
@@ -266,6 +320,7 @@ class TeBSTrackAI:
         try:
             old_kb_length = len(self.knowledge_base) if self.knowledge_base else 0
             self.knowledge_base = self._load_knowledge_base()
+            self._rebuild_knowledge_index()
             new_kb_length = len(self.knowledge_base) if self.knowledge_base else 0
             
             logging.info(f"Knowledge base refreshed: {old_kb_length} -> {new_kb_length} characters")
@@ -292,6 +347,7 @@ class TeBSTrackAI:
             if success:
                 # Update in-memory knowledge base
                 self.knowledge_base = new_content.strip()
+                self._rebuild_knowledge_index()
                 logging.info(f"Knowledge base updated via edited copy: {len(self.knowledge_base)} characters")
                 return True
             else:
@@ -348,6 +404,7 @@ class TeBSTrackAI:
             
             # Reload knowledge base from original document
             self.knowledge_base = self._load_knowledge_base()
+            self._rebuild_knowledge_index()
             logging.info("Knowledge base reset to original document")
             return True
             
@@ -408,6 +465,7 @@ class TeBSTrackAI:
             
             # Update in-memory knowledge base
             self.knowledge_base = content.strip()
+            self._rebuild_knowledge_index()
             logging.info(f"Saved custom knowledge as text: {len(content)} characters")
             return True
             
@@ -420,24 +478,12 @@ class TeBSTrackAI:
         Categorize ticket and predict urgency using OpenAI
         Returns: {category_name: str, urgency: str, confidence: float, reasoning: str}
         """
-        categories = self.get_available_categories()
-        urgency_levels = ["Low", "Medium", "High", "Urgent"]
-        
-        prompt = self._build_categorization_prompt(subject, body, sender, categories, urgency_levels)
+        local_result = self._local_categorization(subject, body, self.get_available_categories())
+        if local_result:
+            return local_result
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": self._get_system_prompt()},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.3,  # Lower temperature for more consistent categorization
-                response_format={"type": "json_object"}
-            )
-            
-            result = json.loads(response.choices[0].message.content)
-            return result
+            return self.request_categorization(subject, body, sender)
             
         except Exception as e:
             logging.error(f"AI categorization failed: {e}")
@@ -448,38 +494,184 @@ class TeBSTrackAI:
                 "reasoning": "AI categorization failed, using defaults"
             }
     
-    def _build_categorization_prompt(self, subject: str, body: str, sender: str, categories: List[str], urgency_levels: List[str]) -> str:
-        """Build the categorization prompt"""
-        return f"""
-Analyze this support ticket and categorize it:
-
-TICKET DETAILS:
-Subject: {subject}
-Description: {body}
-Sender: {sender}
-
-AVAILABLE CATEGORIES:
-{', '.join(categories)}
-
-URGENCY LEVELS:
-- Low: Minor issues, cosmetic problems, feature requests
-- Medium: Standard requests, non-critical issues affecting single user
-- High: Issues affecting multiple users or business processes
-- Urgent: System down, security issues, blocking business operations
-
-KNOWLEDGE BASE CONTEXT:
-{self.knowledge_base}
+    def request_categorization(self, subject: str, body: str, sender: str = "") -> Dict[str, any]:
+        """
+        Categorize ticket like categorize_ticket, but raise on API or parsing errors
+        instead of returning defaults (lets callers retry)
+        """
+        categories = self.get_available_categories()
+        urgency_levels = ["Low", "Medium", "High", "Urgent"]
+        
+        response = self.backend.create(
+            messages=self._build_categorization_messages(subject, body, sender, categories, urgency_levels),
+            temperature=0.3,  # Lower temperature for more consistent categorization
+            response_format={"type": "json_object"}
+        )
+        
+        content = response.choices[0].message.content
+        result = self._valid_categorization(json.loads(content), categories, urgency_levels)
+        if result is None:
+            raise ValueError(f"Categorization response has no valid category, urgency or confidence: {content[:200]}")
+        return result
+    
+    def _local_categorization(self, subject: str, body: str, categories: List[str]) -> Optional[Dict[str, any]]:
+        """Result from the local classifier when it is confident, else None (use the LLM)"""
+        prediction = predict_confident(subject, body)
+        # The model may predate a category being renamed or removed
+        if not prediction or prediction["category"] not in categories:
+            return None
+        return {
+            "category": prediction["category"],
+            "urgency": prediction["urgency"],
+            "confidence": prediction["confidence"],
+            "reasoning": f"Local classifier prediction ({prediction['confidence']:.0%} confident), LLM not consulted",
+            "source": "local"
+        }
+    
+    def categorize_tickets_batch(self, tickets: List[Dict[str, str]], batch_size: int = None) -> List[Optional[Dict[str, any]]]:
+        """
+        Categorize several tickets with one request per batch, sharing the category
+        list, urgency rubric and knowledge context. Tickets the local classifier is
+        confident about are not sent; items missing or invalid in the batched
+        response are retried one at a time.
+        tickets: [{subject: str, body: str, sender: str}]
+        Returns: one result per ticket, in order ({category, urgency, confidence, reasoning}),
+        or None where even the single-ticket retry failed. Raises if a batch request fails.
+        """
+        batch_size = max(1, batch_size or AI_CATEGORIZATION_BATCH_SIZE)
+        categories = self.get_available_categories()
+        urgency_levels = ["Low", "Medium", "High", "Urgent"]
+        results = [self._local_categorization(t.get('subject', ''), t.get('body', ''), categories) for t in tickets]
+        escalated = [i for i, result in enumerate(results) if result is None]
+        
+        for start in range(0, len(escalated), batch_size):
+            batch_indexes = escalated[start:start + batch_size]
+            batch = [tickets[i] for i in batch_indexes]
+            if len(batch) == 1:
+                parsed = [None]
+            else:
+                response = self.backend.create(
+                    messages=self._build_batch_categorization_messages(batch, categories, urgency_levels),
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                )
+                parsed = self._parse_batch_categorization(response.choices[0].message.content, len(batch), categories, urgency_levels)
+            
+            for index, ticket, result in zip(batch_indexes, batch, parsed):
+                if result is None:
+                    # Malformed or missing item: fall back to a single-ticket request
+                    try:
+                        result = self.request_categorization(ticket.get('subject', ''), ticket.get('body', ''), ticket.get('sender', ''))
+                    except Exception as e:
+                        logging.error(f"AI categorization failed for '{ticket.get('subject', '')}': {e}")
+                results[index] = result
+        
+        return results
+    
+    def _build_batch_categorization_messages(self, tickets: List[Dict[str, str]], categories: List[str], urgency_levels: List[str]) -> List[Dict[str, str]]:
+        """Build one categorization request covering several tickets"""
+        # Each body gets a smaller allowance so one long email cannot crowd out the rest
+        budget = TokenBudget('categorize_batch', subject=SUBJECT_MAX_TOKENS, body=BATCH_BODY_MAX_TOKENS, knowledge=KNOWLEDGE_MAX_TOKENS)
+        ticket_blocks = []
+        retrieval_parts = []
+        for index, ticket in enumerate(tickets):
+            subject = budget.fit('subject', ticket.get('subject', ''))
+            body = budget.fit('body', ticket.get('body'))
+            ticket_blocks.append(
+                f"[Ticket {index}]\nSubject: {subject}\nDescription: {body}\nSender: {ticket.get('sender', '')}"
+            )
+            retrieval_parts.append(f"{subject}\n{body}")
+        retrieval_query = "\n".join(retrieval_parts)
+        
+        layout = self._categorization_layout(categories)
+        layout.add_static(None, """
+Please respond with a JSON object containing one result per ticket, using the ticket numbers given:
+{
+    "results": [
+        {
+            "ticket": 0,
+            "category": "exact category name from available list",
+            "urgency": "exact urgency level from list",
+            "confidence": 0.85,
+            "reasoning": "brief explanation of categorization logic"
+        }
+    ]
+}
 
-Please analyze and respond with a JSON object containing:
-{{
+Consider the business impact, number of affected users, and urgency keywords in your analysis.
+""")
+        self._add_knowledge(layout, "KNOWLEDGE BASE CONTEXT", retrieval_query, KB_RETRIEVAL_TOP_K * min(len(tickets), 3), budget)
+        layout.add_variable(None, f"Analyze each of these {len(tickets)} support tickets and categorize it independently:")
+        layout.add_variable(None, "\n\n".join(ticket_blocks))
+        budget.log()
+        return layout.messages()
+    
+    @staticmethod
+    def _parse_batch_categorization(content: str, count: int, categories: List[str], urgency_levels: List[str]) -> List[Optional[Dict[str, any]]]:
+        """Map a batched response back to its tickets; invalid or missing items become None"""
+        parsed = [None] * count
+        try:
+            items = json.loads(content).get("results", [])
+        except (ValueError, AttributeError) as e:
+            logging.warning(f"Batched categorization response was not valid JSON: {e}")
+            return parsed
+        
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            index = item.get("ticket")
+            if not isinstance(index, int) or not 0 <= index < count or parsed[index] is not None:
+                continue
+            parsed[index] = TeBSTrackAI._valid_categorization(item, categories, urgency_levels)
+        return parsed
+    
+    @staticmethod
+    def _valid_categorization(item, categories: List[str], urgency_levels: List[str]) -> Optional[Dict[str, any]]:
+        """The categorization in one response item, or None if its category, urgency or confidence is invalid"""
+        if not isinstance(item, dict):
+            return None
+        if item.get("category") not in categories or item.get("urgency") not in urgency_levels:
+            return None
+        try:
+            confidence = float(item.get("confidence", 0))
+        except (TypeError, ValueError):
+            return None
+        return {
+            "category": item["category"],
+            "urgency": item["urgency"],
+            "confidence": confidence,
+            "reasoning": item.get("reasoning", "")
+        }
+    
+    def _categorization_layout(self, categories: List[str]) -> PromptLayout:
+        """Prompt prefix shared by single and batched categorization"""
+        layout = PromptLayout(self._get_system_prompt())
+        layout.add_static("AVAILABLE CATEGORIES", ', '.join(categories))
+        layout.add_static("URGENCY LEVELS", URGENCY_RUBRIC)
+        return layout
+    
+    def _build_categorization_messages(self, subject: str, body: str, sender: str, categories: List[str], urgency_levels: List[str]) -> List[Dict[str, str]]:
+        """Build the categorization request (static instructions first, the ticket last)"""
+        budget = TokenBudget('categorize', subject=SUBJECT_MAX_TOKENS, body=BODY_MAX_TOKENS, knowledge=KNOWLEDGE_MAX_TOKENS)
+        subject = budget.fit('subject', subject)
+        body = budget.fit('body', body)
+        layout = self._categorization_layout(categories)
+        layout.add_static(None, """
+Please analyze the ticket and respond with a JSON object containing:
+{
     "category": "exact category name from available list",
     "urgency": "exact urgency level from list", 
     "confidence": 0.85,
     "reasoning": "brief explanation of categorization logic"
-}}
+}
 
 Consider the business impact, number of affected users, and urgency keywords in your analysis.
-"""
+""")
+        self._add_knowledge(layout, "KNOWLEDGE BASE CONTEXT", f"{subject}\n{body}", budget=budget)
+        layout.add_variable(None, "Analyze this support ticket and categorize it:")
+        layout.add_variable("TICKET DETAILS", f"Subject: {subject}\nDescription: {body}\nSender: {sender}")
+        budget.log()
+        return layout.messages()
 
     def _get_system_prompt(self) -> str:
         """System prompt for AI categorization"""
@@ -495,107 +687,106 @@ Always respond with valid JSON. Choose only from the provided categories and urg
 Be conservative with "Urgent" - reserve for true emergencies.
 """
 
-    def recommend_email_template(self, subject: str, description: str, category: str) -> Dict[str, any]:
+    def chatbot_response(self, user_message: str, ticket_context: Optional[Dict] = None, user_context: Optional[Dict] = None) -> str:
         """
-        Recommend email template based on ticket content
-        Returns: {template_name: str, confidence: float, reasoning: str, recommended: bool}
+        Generate intelligent, context-aware chatbot response for user questions
         """
-        # Get available templates from database
-        from .models import EmailTemplate
-        
-        active_templates = EmailTemplate.query.filter_by(is_active=True).all()
-        if not active_templates:
-            return {
-                "template_name": None,
-                "confidence": 0.0,
-                "reasoning": "No active email templates available in the database",
-                "recommended": False
-            }
-        
-        # Build templates dictionary with their use cases
-        templates = {}
-        for template in active_templates:
-            use_case = template.use_case_description if template.use_case_description else f"Email template for general use"
-            templates[template.name] = use_case
+        # Check if OpenAI is available, if not provide fallback responses
+        if not self.client:
+            return self._fallback_response(user_message, ticket_context, user_context)
         
-        prompt = f"""
-Analyze this support ticket and recommend the most appropriate email template:
+        intent, direct_answer = self._direct_chatbot_answer(user_message, ticket_context)
+        if direct_answer:
+            return direct_answer
 
-TICKET DETAILS:
-Subject: {subject}
-Description: {description}
-Category: {category}
+        cached = chatbot_cache.get(user_message, ticket_context, user_context, self.knowledge_library.version)
+        if cached is not None:
+            return cached
 
-AVAILABLE TEMPLATES:
-{json.dumps(templates, indent=2)}
+        request_args = self._prepare_chatbot_request(user_message, ticket_context, user_context, intent)
+        try:
+            response = self.backend.create(**request_args)
+            
+            answer = response.choices[0].message.content
+            chatbot_cache.put(user_message, ticket_context, user_context, self.knowledge_library.version, answer)
+            return answer
+            
+        except Exception as e:
+            logging.error(f"Chatbot response failed: {e}")
+            return self._fallback_response(user_message, ticket_context, user_context, f"AI service error: {str(e)}")
 
-TEMPLATE SELECTION GUIDELINES:
-- Match the ticket content to template purpose and use case
-- Consider the specific request type and category
-- Look for keywords that indicate template relevance
-- If no specific template fits well, set template_name to null and explain why
+    def chatbot_response_stream(self, user_message: str, ticket_context: Optional[Dict] = None, user_context: Optional[Dict] = None) -> Iterator[str]:
+        """
+        Same as chatbot_response, but yields the reply in pieces as the completion streams in
+        """
+        if not self.client:
+            yield self._fallback_response(user_message, ticket_context, user_context)
+            return
 
-Respond with JSON:
-{{
-    "template_name": "exact template name or null",
-    "confidence": 0.85,
-    "reasoning": "why this template fits or why no template is suitable",
-    "recommended": true
-}}
-"""
+        intent, direct_answer = self._direct_chatbot_answer(user_message, ticket_context)
+        if direct_answer:
+            yield direct_answer
+            return
 
+        cached = chatbot_cache.get(user_message, ticket_context, user_context, self.knowledge_library.version)
+        if cached is not None:
+            yield cached
+            return
+
+        request_args = self._prepare_chatbot_request(user_message, ticket_context, user_context, intent)
+
+        stream = None
+        parts = []
+        emitted = False
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an email template recommendation expert. Analyze tickets and suggest the most appropriate response template."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.2,
-                response_format={"type": "json_object"}
-            )
-            
-            return json.loads(response.choices[0].message.content)
-            
+            stream = self.backend.create(stream=True, **request_args)
+            for chunk in stream:
+                if getattr(chunk, 'usage', None):
+                    prompt_cache_stats.record(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    emitted = True
+                    parts.append(delta)
+                    yield delta
+            chatbot_cache.put(user_message, ticket_context, user_context, self.knowledge_library.version, ''.join(parts))
         except Exception as e:
-            logging.error(f"Template recommendation failed: {e}")
-            # Try to find a general purpose template from database
-            from .models import EmailTemplate
-            
-            general_template = EmailTemplate.query.filter_by(is_active=True).filter(
-                db.or_(
-                    EmailTemplate.name.ilike('%general%'),
-                    EmailTemplate.name.ilike('%response%'),
-                    EmailTemplate.use_case_description.ilike('%general%')
-                )
-            ).first()
-            
-            if general_template:
-                return {
-                    "template_name": general_template.name,
-                    "confidence": 0.0,
-                    "reasoning": "AI recommendation failed, using available general template",
-                    "recommended": False
-                }
+            logging.error(f"Chatbot stream failed: {e}")
+            if not emitted:
+                yield self._fallback_response(user_message, ticket_context, user_context, f"AI service error: {str(e)}")
             else:
-                return {
-                    "template_name": None,
-                    "confidence": 0.0,
-                    "reasoning": "AI recommendation failed and no general template available",
-                    "recommended": False
-                }
+                yield "\n\n_(The response was interrupted. Please try again.)_"
+        finally:
+            # Stop reading from the API if the browser went away mid-answer
+            if stream is not None:
+                stream.close()
 
-    def chatbot_response(self, user_message: str, ticket_context: Optional[Dict] = None, user_context: Optional[Dict] = None) -> str:
+    def _direct_chatbot_answer(self, user_message: str, ticket_context: Optional[Dict]) -> Tuple[Dict[str, any], Optional[str]]:
         """
-        Generate intelligent, context-aware chatbot response for user questions
+        The question's intent, and its answer when it can be given without calling the AI (else None);
+        cheap enough to run before the response cache is checked
         """
-        # Check if OpenAI is available, if not provide fallback responses
-        if not self.client:
-            return self._fallback_response(user_message, ticket_context, user_context)
-        
         # Analyze the user's intent to determine response type
         intent = self._analyze_user_intent(user_message)
         
+        # Questions that only ask for ticket fields (status, requester, dates...) are answered without the AI
+        if ticket_context:
+            return intent, answer_from_ticket(intent['fields'], ticket_context)
+        return intent, None
+
+    def _prepare_chatbot_request(self, user_message: str, ticket_context: Optional[Dict], user_context: Optional[Dict],
+                                 intent: Dict[str, any]) -> Dict[str, any]:
+        """
+        Build the chat completion arguments for a chatbot question (knowledge retrieval and prompt
+        assembly), only once it is known the answer is neither direct nor cached
+        """
+        # Cap the question and the email body (forwarded threads, pasted logs) before they reach the prompt
+        budget = TokenBudget('chatbot', question=QUESTION_MAX_TOKENS, body=BODY_MAX_TOKENS, knowledge=KNOWLEDGE_MAX_TOKENS)
+        question = budget.fit('question', user_message)
+        if ticket_context and ticket_context.get('body'):
+            ticket_context = dict(ticket_context, body=budget.fit('body', ticket_context['body']))
+        
         # Build context based on intent - include comprehensive ticket details when ticket context exists
         context_info = ""
         
@@ -643,128 +834,45 @@ ORIGINAL EMAIL REQUEST:
 IMPORTANT: This ticket was automatically created from an email sent to the infra mailbox. The "REQUEST BY" field shows the external user who sent the email request. Your role is to help the infra team member resolve this request.
 """
 
-        # Check for direct responses to common questions to avoid AI calls
-        if ticket_context and intent['needs_ticket_details']:
-            message_lower = user_message.lower()
-            # Only provide ultra-short responses for very simple, single-word type questions
-            if 'status?' == message_lower.strip() or ('status' in message_lower and len(message_lower.split()) <= 3):
-                return f"Status: {ticket_context.get('status', 'Unknown')}"
-            elif 'category?' == message_lower.strip() or ('category' in message_lower and len(message_lower.split()) <= 3):
-                return f"Category: {ticket_context.get('category', 'N/A')} - handles VPN/network access"
-            elif 'urgency?' == message_lower.strip() or ('urgency' in message_lower and len(message_lower.split()) <= 3):
-                return f"Urgency: {ticket_context.get('urgency', 'N/A')}"
-            elif any(word in message_lower for word in ['when', 'date', 'created', 'received', 'reported', 'occurred', 'happen']) and ('this' in message_lower or 'ticket' in message_lower or 'issue' in message_lower):
-                created_date = ticket_context.get('created_at', 'Unknown')
-                return f"Created: {created_date}"
-            elif any(word in message_lower for word in ['who', 'sender', 'from']) and any(word in message_lower for word in ['requested', 'sent', 'created', 'mail', 'request', 'ticket']):
-                sender = ticket_context.get('sender', 'Unknown')
-                return f"Requested by: {sender}"
-            # For more complex questions like "what should I do next?", let AI provide comprehensive response
-
-        # Build system prompt based on intent
-        system_prompt = self._build_chatbot_system_prompt(user_message, ticket_context is not None, intent, user_context)
+        # System rules depend only on the kind of question, so they form a cacheable prefix
+        layout = PromptLayout(self._build_chatbot_system_prompt(user_message, ticket_context is not None, intent))
+        
+        # User and ticket details are per request and follow the static content
+        if context_info.strip():
+            layout.add_variable(None, context_info)
+        
+        # Retrieve only the knowledge base sections relevant to the question (and ticket, if any)
+        retrieval_query = question
+        if ticket_context:
+            retrieval_query += f"\n{ticket_context.get('subject') or ''}\n{ticket_context.get('category') or ''}\n{ticket_context.get('body') or ''}"
+        self._add_knowledge(layout, "KNOWLEDGE BASE REFERENCE", retrieval_query, budget=budget)
         
         # Build the user prompt with knowledge base integration
         if intent['needs_ticket_details']:
-            user_prompt = f"""
-{context_info}
-
-KNOWLEDGE BASE REFERENCE:
-{self.knowledge_base}
-
-USER QUESTION: {user_message}
+            layout.add_variable(None, f"""USER QUESTION: {question}
 
-Using the complete ticket context above AND the knowledge base information, provide an informative and helpful response. Reference the knowledge base to suggest specific solutions, procedures, or troubleshooting steps when relevant to the ticket category and user's question."""
+Using the complete ticket context above AND the knowledge base information, provide an informative and helpful response. Reference the knowledge base to suggest specific solutions, procedures, or troubleshooting steps when relevant to the ticket category and user's question.""")
         else:
-            user_prompt = f"""
-{context_info}
+            layout.add_variable(None, f"""USER QUESTION: {question}
 
-KNOWLEDGE BASE REFERENCE:
-{self.knowledge_base}
+Provide a helpful response using the knowledge base information and any relevant context available. Reference specific procedures, solutions, or guidelines from the knowledge base when applicable.""")
 
-USER QUESTION: {user_message}
-
-Provide a helpful response using the knowledge base information and any relevant context available. Reference specific procedures, solutions, or guidelines from the knowledge base when applicable."""
-
-        try:
-            # Significantly increased token limits for comprehensive, detailed responses
-            max_tokens = 150 if intent.get('is_casual', False) else (700 if intent.get('needs_ticket_details', False) else 500)
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                temperature=0.7,
-                max_tokens=max_tokens
-            )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            logging.error(f"Chatbot response failed: {e}")
-            return self._fallback_response(user_message, ticket_context, user_context, f"AI service error: {str(e)}")
+        # Significantly increased token limits for comprehensive, detailed responses
+        max_tokens = 150 if intent.get('is_casual', False) else (700 if intent.get('needs_ticket_details', False) else 500)
+        
+        budget.log()
+        return {
+            'messages': layout.messages(),
+            'temperature': 0.7,
+            'max_tokens': max_tokens,
+        }
 
-    def _analyze_user_intent(self, user_message: str) -> Dict[str, bool]:
+    def _analyze_user_intent(self, user_message: str) -> Dict[str, any]:
         """
         Analyze user message to determine what kind of response they need
+        Returns: {'needs_ticket_details': bool, 'is_casual': bool, 'fields': [ticket fields asked for]}
         """
-        message_lower = user_message.lower().strip()
-        
-        # Greetings and casual conversation
-        casual_phrases = [
-            'hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening', 
-            'thanks', 'thank you', 'bye', 'goodbye', 'how are you', 'how are you?',
-            'how\'s it going', 'how is it going', 'what\'s up', 'whats up',
-            'nice to meet you', 'pleased to meet you', 'good to see you'
-        ]
-        
-        # Keywords that explicitly indicate wanting ticket details
-        explicit_ticket_keywords = [
-            'about this ticket', 'current ticket', 'this ticket', 'ticket details',
-            'tell me about', 'explain this', 'describe this', 'summary of this',
-            'what is this ticket', 'ticket summary', 'ticket information'
-        ]
-        
-        # Keywords that definitely need ticket context (including specific who/when questions)
-        definite_ticket_keywords = [
-            'status', 'category', 'urgency', 'assigned', 'created', 'sender',
-            'next steps', 'what should', 'how to resolve', 'solution', 'fix', 'resolve',
-            'when was this', 'when did this', 'what date', 'creation date', 'reported',
-            'issue occur', 'this happen', 'this reported', 
-            'who requested', 'who sent', 'who created', 'who is the sender', 'from who',
-            'who made this', 'who submitted', 'who opened', 'who filed', 'created by',
-            'requested by', 'sent by', 'submitted by', 'opened by', 'filed by'
-        ]
-        
-        # Questions that might need context but could be general
-        contextual_questions = [
-            'what', 'who', 'when', 'where', 'why', 'how', 'explain', 'show me', 'tell me more'
-        ]
-        
-        # Check if explicitly asking about ticket (check this FIRST)
-        if any(keyword in message_lower for keyword in explicit_ticket_keywords):
-            return {'needs_ticket_details': True, 'is_casual': False}
-        
-        # Check for specific ticket-related keywords including date questions (check BEFORE casual)
-        if any(keyword in message_lower for keyword in definite_ticket_keywords):
-            return {'needs_ticket_details': True, 'is_casual': False}
-        
-        # Check if it's a simple greeting or casual conversation (check AFTER ticket keywords)
-        if any(phrase in message_lower for phrase in casual_phrases):
-            return {'needs_ticket_details': False, 'is_casual': True}
-        
-        # For contextual questions, only assume they want ticket details if they mention specific terms
-        if any(word in message_lower for word in contextual_questions):
-            # If the question is very short and general, treat as casual
-            if len(message_lower.split()) <= 4 and not any(keyword in message_lower for keyword in definite_ticket_keywords):
-                return {'needs_ticket_details': False, 'is_casual': False}
-            # Otherwise assume they want ticket details
-            return {'needs_ticket_details': True, 'is_casual': False}
-        
-        # Default: assume they want brief response
-        return {'needs_ticket_details': False, 'is_casual': False}
+        return analyze_intent(user_message)
 
     def _fallback_response(self, user_message: str, ticket_context: Optional[Dict] = None, user_context: Optional[Dict] = None, error_msg: str = None) -> str:
         """Provide fallback responses when OpenAI is not available"""
@@ -801,6 +909,9 @@ Provide a helpful response using the knowledge base information and any relevant
         
         # If we have ticket context and user wants ticket details
         if ticket_context and intent.get('needs_ticket_details', False):
+            direct_answer = answer_from_ticket(intent['fields'], ticket_context)
+            if direct_answer:
+                return direct_answer
             return f"""Ticket #{ticket_context.get('id', 'N/A')}: {ticket_context.get('subject', 'No subject')}
 Status: {ticket_context.get('status', 'Unknown')} | Category: {ticket_context.get('category', 'N/A')} | Urgency: {ticket_context.get('urgency', 'N/A')}
 Requested by: {ticket_context.get('sender', 'Unknown')} | Created: {ticket_context.get('created_at', 'Unknown')}
@@ -820,22 +931,12 @@ This ticket was auto-created from an email to the infra mailbox."""
             greeting = f"Hi {user_name}! I'm" if user_name else "I'm"
             return f"{greeting} your TeBSTrack assistant, here to help the infra team manage tickets and resolve user requests efficiently."
 
-    def _build_chatbot_system_prompt(self, user_message: str, has_ticket_context: bool, intent: Dict[str, bool], user_context: Optional[Dict] = None) -> str:
-        """Build an appropriate system prompt based on the user's question and context"""
-        
-        # Build user information section
-        user_info = ""
-        if user_context:
-            username = user_context.get('username', 'Unknown')
-            role = user_context.get('role', 'user')
-            user_info = f"""
-
-CURRENT USER:
-- Username: {username}
-- Role: {role}
-- You are assisting this user with their question"""
-        
-        base_prompt = f"""You are TeBSTrack Assistant, an AI helper for the TeBSTrack Infrastructure Ticketing System.
+    def _build_chatbot_system_prompt(self, user_message: str, has_ticket_context: bool, intent: Dict[str, bool]) -> str:
+        """
+        Build an appropriate system prompt based on the kind of question. Nothing user- or
+        ticket-specific goes here (see USER INFORMATION in the user message) so it stays cacheable
+        """
+        base_prompt = """You are TeBSTrack Assistant, an AI helper for the TeBSTrack Infrastructure Ticketing System.
 
 SYSTEM CONTEXT:
 TeBSTrack is an infrastructure team ticketing system where:
@@ -854,7 +955,8 @@ KNOWLEDGE BASE USAGE:
 USER CONTEXT:
 - TeBSTrack users are infra team members responsible for resolving tickets
 - Ticket requesters are external users who sent emails to the infra mailbox
-- When viewing tickets, the "REQUEST BY" field shows who sent the original email request{user_info}"""
+- When viewing tickets, the "REQUEST BY" field shows who sent the original email request
+- The USER INFORMATION section identifies the infra team member you are assisting"""
         
         if intent.get('is_casual', False):
             # Handle casual conversation
@@ -897,13 +999,13 @@ INFRA TEAM HELP MODE: Provide clear, helpful answers about TeBSTrack features an
 
     def recommend_email_template(self, ticket_subject: str, ticket_description: str, ticket_category: str = None) -> Dict[str, any]:
         """
-        Use AI to recommend the most appropriate email template for a ticket
+        Recommend the most appropriate email template for a ticket. Templates are ranked
+        locally; a decisive local match is returned as is, otherwise the LLM chooses
+        among the top few candidates only.
         """
-        from .models import EmailTemplate
-        
-        # Get available templates from database
-        active_templates = EmailTemplate.query.filter_by(is_active=True).all()
-        if not active_templates:
+        ranked = template_index.rank(ticket_subject, ticket_description, ticket_category)
+        templates_available = [t['name'] for t in ranked]
+        if not ranked:
             return {
                 "recommended_template": None,
                 "confidence": 0.0,
@@ -911,33 +1013,29 @@ INFRA TEAM HELP MODE: Provide clear, helpful answers about TeBSTrack features an
                 "templates_available": []
             }
         
-        # Build templates description for AI
-        templates_info = {}
-        for template in active_templates:
-            templates_info[template.name] = {
-                "subject": template.subject,
-                "use_case": template.use_case_description or "General use",
-                "body_preview": template.body[:200] + "..." if len(template.body) > 200 else template.body
+        if is_decisive(ranked):
+            best = ranked[0]
+            return {
+                "recommended_template": best['name'],
+                "confidence": local_confidence(ranked),
+                "reasoning": f"Matched locally on the template's name and use case (score {best['score']:.2f}, "
+                             f"next best {ranked[1]['score'] if len(ranked) > 1 else 0.0:.2f}); LLM not consulted",
+                "alternative_templates": [t['name'] for t in ranked[1:TEMPLATE_SHORTLIST_SIZE] if t['score'] > 0],
+                "template_match_score": best['score'],
+                "templates_available": templates_available,
+                "source": "local"
             }
         
-        # Get template selection guidance from system settings
-        template_guide = self._get_template_selection_guide()
+        shortlist = ranked[:TEMPLATE_SHORTLIST_SIZE]
+        candidates = {
+            t['name']: {"subject": t['subject'], "use_case": t['use_case'], "body_preview": t['body_preview']}
+            for t in shortlist
+        }
         
-        prompt = f"""
-Analyze this support ticket and recommend the most appropriate email template:
-
-TICKET INFORMATION:
-Subject: {ticket_subject}
-Description: {ticket_description}
-Category: {ticket_category or "Not specified"}
-
-AVAILABLE EMAIL TEMPLATES:
-{json.dumps(templates_info, indent=2)}
-
-TEMPLATE SELECTION GUIDE:
-{template_guide}
-
-ANALYSIS REQUIREMENTS:
+        # Instructions and guide are the same for every ticket; candidates and the ticket go last
+        layout = PromptLayout("You are an expert email template recommendation system. Analyze support tickets and suggest the most appropriate response template based on content analysis and use case matching.")
+        layout.add_static("TEMPLATE SELECTION GUIDE", self._get_template_selection_guide())
+        layout.add_static("ANALYSIS REQUIREMENTS", """
 1. Match ticket content to template purpose and use cases
 2. Consider the specific request type and category
 3. Look for keywords that indicate template relevance  
@@ -945,28 +1043,36 @@ ANALYSIS REQUIREMENTS:
 5. If no template is clearly suitable, explain why
 
 Respond with JSON:
-{{
+{
     "recommended_template": "exact template name or null",
     "confidence": 0.85,
     "reasoning": "detailed explanation of why this template fits or why no template is suitable",
     "alternative_templates": ["list of other potentially relevant templates"],
     "template_match_score": 0.85
-}}
-"""
+}
+""")
+        budget = TokenBudget('recommend_template', subject=SUBJECT_MAX_TOKENS, body=BODY_MAX_TOKENS)
+        subject = budget.fit('subject', ticket_subject)
+        description = budget.fit('body', ticket_description)
+        layout.add_variable("AVAILABLE EMAIL TEMPLATES", json.dumps(candidates, indent=2))
+        layout.add_variable(None, "Analyze this support ticket and recommend the most appropriate email template:")
+        layout.add_variable("TICKET INFORMATION", f"Subject: {subject}\nDescription: {description}\nCategory: {ticket_category or 'Not specified'}")
+        budget.log()
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an expert email template recommendation system. Analyze support tickets and suggest the most appropriate response template based on content analysis and use case matching."},
-                    {"role": "user", "content": prompt}
-                ],
+            response = self.backend.create(
+                messages=layout.messages(),
                 temperature=0.2,  # Low temperature for consistent recommendations
                 response_format={"type": "json_object"}
             )
             
             result = json.loads(response.choices[0].message.content)
-            result["templates_available"] = [t.name for t in active_templates]
+            if result.get("recommended_template") not in candidates:
+                if result.get("recommended_template"):
+                    logging.warning(f"AI recommended unknown template '{result.get('recommended_template')}'")
+                result["recommended_template"] = None
+            result["alternative_templates"] = [name for name in result.get("alternative_templates") or [] if name in candidates]
+            result["templates_available"] = templates_available
             return result
             
         except Exception as e:
@@ -975,160 +1081,93 @@ Respond with JSON:
                 "recommended_template": None,
                 "confidence": 0.0,
                 "reasoning": f"AI recommendation failed: {str(e)}",
-                "templates_available": [t.name for t in active_templates],
+                "templates_available": templates_available,
                 "alternative_templates": [],
-                "template_match_score": 0.0
+                "template_match_score": 0.0,
+                "failed": True
             }
 
     def _get_template_selection_guide(self) -> str:
-        """Get the template selection guide from system settings"""
-        from .models import SystemSettings, EmailTemplate
+        """
+        Template selection guide from system settings, or the default criteria (the
+        candidate templates and their use cases are listed separately in each prompt)
+        """
+        from .models import SystemSettings
         
         guide = SystemSettings.get_setting('email_template_guide', '')
         if not guide:
-            # Generate dynamic guide based on available templates
-            active_templates = EmailTemplate.query.filter_by(is_active=True).all()
-            
-            if active_templates:
-                guide = "TEMPLATE SELECTION GUIDELINES:\n\n"
-                
-                for i, template in enumerate(active_templates, 1):
-                    use_case = template.use_case_description if template.use_case_description else f"Email template for general use"
-                    guide += f"{i}. {template.name}: {use_case}\n"
-                
-                guide += """
+            guide = """
 SELECTION CRITERIA:
 - Match specific keywords in the request to template purpose
 - Consider the technical complexity of the request
 - Evaluate if the template provides appropriate information for the user's needs
 - If multiple templates could work, choose the most specific one
 - Only recommend a template if there's a clear match (confidence > 0.7)
-"""
-            else:
-                guide = """
-TEMPLATE SELECTION GUIDELINES:
-No email templates are currently configured in the system.
-Please contact the administrator to set up email templates.
 """
         
         return guide
 
     def generate_template_action_steps(self, template_name: str, ticket_context: Dict[str, any]) -> List[Dict[str, any]]:
         """
-        Generate AI-suggested action steps for a template based on ticket context
+        Action steps for a template with the ticket's details filled in: the template's
+        configured steps, or AI-suggested steps generated once per template and stored
         """
-        from .models import EmailTemplate, TemplateActionStep
-        
-        # Get the template and its existing action steps
-        template = EmailTemplate.query.filter_by(name=template_name, is_active=True).first()
-        if not template:
-            return []
-        
-        existing_steps = TemplateActionStep.query.filter_by(template_id=template.id).order_by(TemplateActionStep.step_order).all()
-        
-        # If template has configured steps, return those with any dynamic content filled in
-        if existing_steps:
-            return self._customize_action_steps(existing_steps, ticket_context)
-        
-        # If no configured steps, generate AI suggestions
-        return self._generate_ai_action_steps(template, ticket_context)
-
-    def _customize_action_steps(self, steps: List, ticket_context: Dict[str, any]) -> List[Dict[str, any]]:
-        """Customize existing action steps with ticket-specific information"""
-        customized_steps = []
-        
-        for step in steps:
-            step_data = {
-                "id": step.id,
-                "order": step.step_order,
-                "type": step.step_type,
-                "title": step.step_title,
-                "description": step.step_description,
-                "is_automated": step.is_automated,
-                "config": json.loads(step.step_config) if step.step_config else {}
-            }
-            
-            # Customize step description with ticket context
-            step_data["description"] = self._apply_ticket_variables(step_data["description"], ticket_context)
-            
-            customized_steps.append(step_data)
-        
-        return customized_steps
-
-    def _apply_ticket_variables(self, text: str, ticket_context: Dict[str, any]) -> str:
-        """Apply ticket variables to step descriptions"""
-        variables = {
-            "{user_email}": ticket_context.get("sender", "user@example.com"),
-            "{username}": ticket_context.get("sender", "user@example.com").split("@")[0] if "@" in ticket_context.get("sender", "") else "username",
-            "{ticket_id}": str(ticket_context.get("id", "N/A")),
-            "{subject}": ticket_context.get("subject", ""),
-            "{category}": ticket_context.get("category", "")
-        }
-        
-        result = text
-        for var, value in variables.items():
-            result = result.replace(var, value)
-        
-        return result
+        return action_plans.get_steps(template_name, ticket_context)
 
-    def _generate_ai_action_steps(self, template, ticket_context: Dict[str, any]) -> List[Dict[str, any]]:
-        """Generate AI-suggested action steps when none are configured"""
-        
-        prompt = f"""
-Generate specific action steps for resolving this support ticket using the "{template.name}" email template:
-
-TICKET DETAILS:
-Subject: {ticket_context.get('subject', '')}
-Description: {ticket_context.get('description', '')}
-Category: {ticket_context.get('category', '')}
-Requested by: {ticket_context.get('sender', '')}
-
-TEMPLATE INFORMATION:
-Name: {template.name}
-Purpose: {template.use_case_description}
-Email Subject: {template.subject}
+    def generate_ai_action_steps(self, template) -> Optional[List[Dict[str, any]]]:
+        """
+        Suggest action steps for a template that has none configured. The steps are shared by
+        every ticket on the template, so ticket details are written as placeholders.
+        Returns: list of steps, or None if generation failed
+        """
+        layout = PromptLayout("You are an IT workflow expert. Generate specific, actionable steps for infrastructure team members to resolve support requests.")
+        layout.add_static(None, """
+Generate 3-5 specific, actionable steps that an infrastructure team member should take to resolve requests answered with the email template described. Focus on practical actions, not just "send email".
 
-Generate 3-5 specific, actionable steps that an infrastructure team member should take to resolve this request. Focus on practical actions, not just "send email".
+The steps are reused for every ticket answered with this template. Where a step needs ticket details, write these placeholders, which are filled in for each ticket: {username}, {user_email}, {ticket_id}, {subject}, {category}.
 
 Respond with JSON:
-{{
+{
     "action_steps": [
-        {{
+        {
             "order": 1,
             "title": "Step Title",
             "description": "Detailed description of what to do",
             "type": "manual",
             "is_automated": false
-        }}
+        }
     ]
-}}
-"""
+}
+""")
+        layout.add_variable("TEMPLATE INFORMATION", f"Name: {template.name}\nPurpose: {template.use_case_description}\nEmail Subject: {template.subject}")
 
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are an IT workflow expert. Generate specific, actionable steps for infrastructure team members to resolve support requests."},
-                    {"role": "user", "content": prompt}
-                ],
+            response = self.backend.create(
+                messages=layout.messages(),
                 temperature=0.3,
                 response_format={"type": "json_object"}
             )
             
-            result = json.loads(response.choices[0].message.content)
-            return result.get("action_steps", [])
+            steps = json.loads(response.choices[0].message.content).get("action_steps")
+            if not isinstance(steps, list) or not all(isinstance(step, dict) for step in steps):
+                raise ValueError("response has no list of action steps")
+            return steps
             
         except Exception as e:
             logging.error(f"Action step generation failed: {e}")
-            return [
-                {
-                    "order": 1,
-                    "title": f"Process {template.name} Request",
-                    "description": f"Follow standard procedure for {template.name.lower()} as described in the email template.",
-                    "type": "manual",
-                    "is_automated": False
-                }
-            ]
+            return None
+
+    def fallback_action_steps(self, template) -> List[Dict[str, any]]:
+        """Generic step shown when no steps are configured and generation failed"""
+        return [
+            {
+                "order": 1,
+                "title": f"Process {template.name} Request",
+                "description": f"Follow standard procedure for {template.name.lower()} as described in the email template.",
+                "type": "manual",
+                "is_automated": False
+            }
+        ]
 
 
 # Global AI service instance (lazy-loaded)
@@ -1145,3 +1184,7 @@ def reset_ai_service():
     """Reset the AI service instance (useful when API key changes)."""
     global _ai_service
     _ai_service = None
+    # Failures recorded against the old key or backend no longer apply
+    llm_executor.reset()
+    # Answers from the old backend or model are regenerated
+    chatbot_cache.clear()
@@ -0,0 +1,205 @@
+"""
+Audit log retention for TeBSTrack
+Handles moving Log entries older than the retention period into gzipped JSON-lines files, one per month, in
+bounded chunks, reading archived months back for the audit log page, and returning freed pages to the
+filesystem with incremental VACUUM
+"""
+
+import datetime
+import glob
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from typing import Dict, List
+
+from flask import current_app
+
+# Entries older than this many days are archived (0 keeps everything in the database)
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 180))
+# Where the monthly archive files are written (default: instance/audit_archive)
+AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR', '')
+# Entries moved per transaction, so archiving never holds the write lock for long
+AUDIT_ARCHIVE_CHUNK_SIZE = int(os.getenv('AUDIT_ARCHIVE_CHUNK_SIZE', 1000))
+# Most free pages returned to the filesystem per incremental VACUUM step
+AUDIT_VACUUM_PAGES = int(os.getenv('AUDIT_VACUUM_PAGES', 500))
+# How often the retention pass runs when triggered from the email fetch loop
+AUDIT_RETENTION_INTERVAL_HOURS = float(os.getenv('AUDIT_RETENTION_INTERVAL_HOURS', 24))
+
+ARCHIVE_FILE_PATTERN = re.compile(r'^log-(\d{4}-\d{2})\.jsonl\.gz$')
+
+# An archived entry, shaped like Log for the audit log template
+ArchivedLog = namedtuple('ArchivedLog', ['id', 'timestamp', 'user', 'action', 'details'])
+
+
+def archive_dir() -> str:
+    return AUDIT_ARCHIVE_DIR or os.path.join(current_app.instance_path, 'audit_archive')
+
+
+def archive_path(month: str) -> str:
+    return os.path.join(archive_dir(), f'log-{month}.jsonl.gz')
+
+
+def archived_months() -> List[str]:
+    """Months ('YYYY-MM') with an archive file, newest first"""
+    months = []
+    for path in glob.glob(os.path.join(archive_dir(), 'log-*.jsonl.gz')):
+        match = ARCHIVE_FILE_PATTERN.match(os.path.basename(path))
+        if match:
+            months.append(match.group(1))
+    return sorted(months, reverse=True)
+
+
+def read_month(month: str) -> List[ArchivedLog]:
+    """
+    Every entry archived for a month, newest first. An entry appears once even if a chunk was written
+    twice (archived, then interrupted before it was deleted from the table).
+    """
+    path = archive_path(month)
+    if not ARCHIVE_FILE_PATTERN.match(os.path.basename(path)) or not os.path.exists(path):
+        return []
+    entries = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            entries[row['id']] = ArchivedLog(
+                row['id'], datetime.datetime.fromisoformat(row['timestamp']), row['user'], row['action'], row.get('details')
+            )
+    return sorted(entries.values(), key=lambda entry: (entry.timestamp, entry.id), reverse=True)
+
+
+class AuditRetention:
+    """Archives old audit entries; at most one pass runs at a time"""
+
+    def __init__(self):
+        self.app = None
+        self.lock = threading.Lock()
+        self.running = False
+        self.last_run = None  # time.monotonic() when the last pass started
+        self.stats = {'runs': 0, 'archived': 0, 'vacuumed_pages': 0, 'failed': 0}
+
+    def init_app(self, app):
+        """Bind the Flask app whose context background passes run in"""
+        self.app = app
+
+    def schedule(self) -> bool:
+        """Start a background pass if retention is enabled and none ran within the interval"""
+        if AUDIT_RETENTION_DAYS <= 0:
+            return False
+        with self.lock:
+            if self.running or (self.last_run is not None
+                                and time.monotonic() - self.last_run < AUDIT_RETENTION_INTERVAL_HOURS * 3600):
+                return False
+            if self.app is None:
+                self.app = current_app._get_current_object()
+            self.running = True
+            self.last_run = time.monotonic()
+        threading.Thread(target=self._background_run, name="audit-retention", daemon=True).start()
+        return True
+
+    def _background_run(self):
+        try:
+            with self.app.app_context():
+                self.run()
+        except Exception as e:
+            with self.lock:
+                self.stats['failed'] += 1
+            logging.error(f"Audit log retention pass failed: {e}")
+        finally:
+            with self.lock:
+                self.running = False
+
+    def run(self, retention_days: int = AUDIT_RETENTION_DAYS, chunk_size: int = AUDIT_ARCHIVE_CHUNK_SIZE) -> Dict[str, int]:
+        """Archive entries older than retention_days, then vacuum incrementally (needs an app context); 0 keeps everything"""
+        if retention_days <= 0:
+            return {'archived': 0, 'vacuumed_pages': 0}
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+        archived = self.archive_before(cutoff, chunk_size)
+        vacuumed = incremental_vacuum() if archived else 0
+        with self.lock:
+            self.stats['runs'] += 1
+            self.stats['archived'] += archived
+            self.stats['vacuumed_pages'] += vacuumed
+        if archived:
+            logging.info(f"Archived {archived} audit log entries older than {cutoff:%Y-%m-%d}; freed {vacuumed} pages")
+        return {'archived': archived, 'vacuumed_pages': vacuumed}
+
+    @staticmethod
+    def archive_before(cutoff: datetime.datetime, chunk_size: int = AUDIT_ARCHIVE_CHUNK_SIZE) -> int:
+        """
+        Move entries older than cutoff to the archive files, oldest first, one chunk per transaction.
+        Each chunk is appended to its month's file (as a new gzip member) and flushed to disk before
+        the rows are deleted, so an interruption can duplicate a chunk in the archive but never lose it.
+        """
+        from .models import db, Log
+        os.makedirs(archive_dir(), exist_ok=True)
+        # Compared as text, like the audit log page, so both stored timestamp formats are handled
+        bound = db.literal(cutoff.strftime('%Y-%m-%d %H:%M:%S'), db.String)
+        total = 0
+        while True:
+            rows = db.session.query(Log.id, db.type_coerce(Log.timestamp, db.String), Log.user, Log.action, Log.details) \
+                .filter(Log.timestamp < bound).order_by(Log.timestamp, Log.id).limit(chunk_size).all()
+            if not rows:
+                return total
+            by_month = {}
+            for log_id, timestamp, user, action, details in rows:
+                entry = {'id': log_id, 'timestamp': timestamp, 'user': user, 'action': action, 'details': details}
+                by_month.setdefault(timestamp[:7], []).append(entry)
+            for month, entries in by_month.items():
+                with open(archive_path(month), 'ab') as raw:
+                    with gzip.GzipFile(fileobj=raw, mode='ab') as f:
+                        f.write(''.join(json.dumps(entry) + '\n' for entry in entries).encode('utf-8'))
+                    raw.flush()
+                    os.fsync(raw.fileno())
+            db.session.query(Log).filter(Log.id.in_([row[0] for row in rows])).delete(synchronize_session=False)
+            db.session.commit()
+            total += len(rows)
+
+    def get_status(self) -> Dict[str, any]:
+        with self.lock:
+            return dict(self.stats, running=self.running, retention_days=AUDIT_RETENTION_DAYS)
+
+
+def incremental_vacuum(max_pages: int = AUDIT_VACUUM_PAGES) -> int:
+    """
+    Return free pages to the filesystem a step at a time. Only works once the database uses
+    auto_vacuum=INCREMENTAL (see enable_incremental_vacuum); returns the number of pages freed.
+    """
+    from .models import db
+    freed = 0
+    with db.engine.connect() as connection:
+        if connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+            return 0
+        cursor = connection.connection.cursor()
+        while True:
+            free = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+            if not free:
+                break
+            # SQLite frees one page per step of this statement, so it is run to completion; each
+            # call is its own transaction, so other writers get in between calls
+            cursor.execute(f'PRAGMA incremental_vacuum({min(free, max_pages)})').fetchall()
+            connection.connection.commit()
+            freed += free - cursor.execute('PRAGMA freelist_count').fetchone()[0]
+        cursor.close()
+    return freed
+
+
+def enable_incremental_vacuum() -> bool:
+    """One-off switch to auto_vacuum=INCREMENTAL; rebuilds the file with a full VACUUM, so run it during maintenance"""
+    from .models import db
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+        if connection.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:
+            return False
+        connection.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+        connection.exec_driver_sql('VACUUM')
+    return True
+
+
+# Global audit log retention
+audit_retention = AuditRetention()
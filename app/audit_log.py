@@ -0,0 +1,182 @@
+"""
+Audit log writer for TeBSTrack
+Handles queueing Log entries in process and bulk-inserting them from a background thread, so routes do not
+need a second commit for their audit entry; security-critical entries are written in the caller's transaction
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from flask import current_app
+
+# Most entries waiting to be written; when full, record() writes the entry itself instead of dropping it
+AUDIT_LOG_QUEUE_SIZE = int(os.getenv('AUDIT_LOG_QUEUE_SIZE', 10000))
+# Queued entries are written at least this often (milliseconds), or as soon as a batch fills up
+AUDIT_LOG_FLUSH_MS = int(os.getenv('AUDIT_LOG_FLUSH_MS', 500))
+AUDIT_LOG_BATCH_SIZE = int(os.getenv('AUDIT_LOG_BATCH_SIZE', 200))
+# Attempts at writing a batch (e.g. while another connection holds the database lock) before the writer
+# sets it aside and tries again after AUDIT_LOG_RETRY_SECONDS; entries are only counted as written once stored
+AUDIT_LOG_WRITE_ATTEMPTS = int(os.getenv('AUDIT_LOG_WRITE_ATTEMPTS', 3))
+AUDIT_LOG_RETRY_SECONDS = float(os.getenv('AUDIT_LOG_RETRY_SECONDS', 5))
+# Longest flush() waits for the writer thread to store the batch it is holding
+AUDIT_LOG_FLUSH_TIMEOUT_SECONDS = float(os.getenv('AUDIT_LOG_FLUSH_TIMEOUT_SECONDS', 10))
+# Longest the audit log page waits for it; after that the page is shown with a note that recent entries may be missing
+AUDIT_LOG_PAGE_FLUSH_SECONDS = float(os.getenv('AUDIT_LOG_PAGE_FLUSH_SECONDS', 1))
+
+
+class AuditLogWriter:
+    """Bounded queue of Log rows drained by one writer thread in multi-row inserts"""
+
+    def __init__(self, maxsize: int = AUDIT_LOG_QUEUE_SIZE):
+        self.app = None
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stats = {'queued': 0, 'written': 0, 'batches': 0, 'sync': 0, 'overflow': 0, 'failed': 0, 'lost': 0}
+
+    def init_app(self, app):
+        """Bind the Flask app whose context the writer runs in"""
+        self.app = app
+
+    def record(self, user: str, action: str, details: Optional[str] = None, sync: bool = False) -> None:
+        """
+        Add an audit log entry. By default it is queued and written within AUDIT_LOG_FLUSH_MS. With
+        sync=True it is added to the current session instead, so it is committed together with the
+        change it describes (the caller's next commit), or not at all.
+        """
+        entry = {'timestamp': datetime.utcnow(), 'user': user, 'action': action, 'details': details}
+        if sync:
+            from .models import db, Log
+            db.session.add(Log(**entry))
+            with self.lock:
+                self.stats['sync'] += 1
+            return
+        with self.lock:
+            self._ensure_started()
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            # The writer has fallen behind; write this one here rather than lose it
+            with self.lock:
+                self.stats['overflow'] += 1
+            if not self._write([entry]):
+                self._lose([entry])
+            return
+        with self.lock:
+            self.stats['queued'] += 1
+
+    def flush(self, timeout: float = AUDIT_LOG_FLUSH_TIMEOUT_SECONDS) -> bool:
+        """
+        Write everything recorded so far (at exit, and before the audit log page reads the table): what is
+        still queued is written here, then this waits for the batch the writer thread already holds.
+        Returns False if entries were still unwritten after timeout seconds.
+        """
+        entries = self._drain([])
+        while entries:
+            if not self._write_in_context(entries):
+                # Hand them back to the writer thread, which keeps retrying
+                for entry in entries:
+                    self.queue.put(entry)
+                    self.queue.task_done()
+                break
+            self._done(entries)
+            entries = self._drain([])
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.warning(f"Audit log flush timed out with {self.queue.unfinished_tasks} entries unwritten")
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        return True
+
+    def get_status(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats, pending=self.queue.unfinished_tasks)
+
+    def _ensure_started(self):
+        """Start the writer thread on first use (caller holds the lock)"""
+        if self.thread:
+            return
+        if self.app is None:
+            self.app = current_app._get_current_object()
+        self.thread = threading.Thread(target=self._worker, name="audit-log-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def _drain(self, entries: List[Dict]) -> List[Dict]:
+        while len(entries) < AUDIT_LOG_BATCH_SIZE:
+            try:
+                entries.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return entries
+
+    def _done(self, entries: List[Dict]) -> None:
+        """Mark entries taken from the queue as stored, releasing flush() once none are left"""
+        for _ in entries:
+            self.queue.task_done()
+
+    def _lose(self, entries: List[Dict]) -> None:
+        with self.lock:
+            self.stats['lost'] += len(entries)
+        logging.error(f"Gave up on {len(entries)} audit log entries: "
+                      + '; '.join(f"{entry['user']} {entry['action']}" for entry in entries[:5]))
+
+    def _worker(self):
+        entries = []
+        while True:
+            if not entries:
+                entries = [self.queue.get()]
+                # Give a burst a moment to collect into one insert, unless a full batch is already waiting
+                if self.queue.qsize() < AUDIT_LOG_BATCH_SIZE - 1:
+                    time.sleep(AUDIT_LOG_FLUSH_MS / 1000)
+            entries = self._drain(entries)
+            try:
+                written = self._write_in_context(entries)
+            except Exception as e:
+                logging.error(f"Audit log writer crashed on {len(entries)} entries: {e}")
+                written = False
+            if written:
+                self._done(entries)
+                entries = []
+            else:
+                # Keep the batch (it stays counted as unfinished) and try it again
+                time.sleep(AUDIT_LOG_RETRY_SECONDS)
+
+    def _write_in_context(self, entries: List[Dict]) -> bool:
+        with self.app.app_context():
+            return self._write(entries)
+
+    def _write(self, entries: List[Dict]) -> bool:
+        """
+        Insert entries on a connection of their own, so a caller's open session is not committed.
+        Retried with a short backoff; returns False if every attempt failed.
+        """
+        from .models import db, Log
+        for attempt in range(AUDIT_LOG_WRITE_ATTEMPTS):
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(db.insert(Log), entries)
+            except Exception as e:
+                with self.lock:
+                    self.stats['failed'] += 1
+                logging.warning(f"Could not write {len(entries)} audit log entries (attempt {attempt + 1}): {e}")
+                time.sleep(0.1 * 2 ** attempt)
+                continue
+            with self.lock:
+                self.stats['written'] += len(entries)
+                self.stats['batches'] += 1
+            return True
+        return False
+
+
+# Global audit log writer
+audit_log = AuditLogWriter()
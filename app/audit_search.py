@@ -0,0 +1,218 @@
+"""
+Audit log queries for TeBSTrack
+Handles filtering the audit log by user, action, category, date range and details text, and reading it a page
+at a time with keyset pagination on (timestamp, id) so every page costs the same however long the history is;
+archived months are read from their archive file the same way
+"""
+
+import datetime
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Entries per page of the audit log
+AUDIT_LOG_PAGE_SIZE = int(os.getenv('AUDIT_LOG_PAGE_SIZE', 50))
+# How long the list of actions offered as filters is cached
+AUDIT_FILTER_OPTIONS_TTL_SECONDS = float(os.getenv('AUDIT_FILTER_OPTIONS_TTL_SECONDS', 300))
+
+# Category shown for an action: the first whose keyword appears in it (lower-cased)
+ACTION_CATEGORIES = OrderedDict([
+    ('Authentication', ('login', 'logout')),
+    ('Knowledge Base', ('knowledge base',)),
+    ('Ticket Management', ('ticket',)),
+    ('Bulk Operations', ('bulk',)),
+    ('User Management', ('user',)),
+    ('Email Operations', ('email',)),
+])
+DEFAULT_CATEGORY = 'System Operations'
+CATEGORY_NAMES = list(ACTION_CATEGORIES) + [DEFAULT_CATEGORY]
+
+
+def action_category(action: str) -> str:
+    action = (action or '').lower()
+    for category, keywords in ACTION_CATEGORIES.items():
+        if any(keyword in action for keyword in keywords):
+            return category
+    return DEFAULT_CATEGORY
+
+
+def known_actions() -> List[str]:
+    """Distinct actions in the log, for the filter dropdowns (cached, as scanning them is not free)"""
+    from .models import db, Log
+    from .settings_cache import settings_cache
+
+    def load():
+        return sorted(action for (action,) in db.session.query(Log.action).distinct())
+    return settings_cache.get(('audit', 'actions'), load, ttl=AUDIT_FILTER_OPTIONS_TTL_SECONDS)
+
+
+def encode_cursor(timestamp: str, log_id: int) -> str:
+    return f"{timestamp}_{log_id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, int]]:
+    """(stored timestamp text, id) from a cursor, or None if it is missing or malformed"""
+    if not cursor or '_' not in cursor:
+        return None
+    timestamp, _, log_id = cursor.rpartition('_')
+    try:
+        datetime.datetime.fromisoformat(timestamp)
+        return timestamp, int(log_id)
+    except ValueError:
+        return None
+
+
+class AuditLogFilters:
+    """Filters from the audit log page's query string"""
+
+    def __init__(self, args):
+        self.user = (args.get('user') or '').strip()
+        self.action = (args.get('action') or '').strip()
+        self.category = (args.get('category') or '').strip()
+        self.start = self._date(args.get('start'))
+        self.end = self._date(args.get('end'))
+        self.q = (args.get('q') or '').strip()
+        # Month ('YYYY-MM') of archived entries to show instead of the live table
+        archive = (args.get('archive') or '').strip()
+        self.archive = archive if re.fullmatch(r'\d{4}-\d{2}', archive) else ''
+
+    @staticmethod
+    def _date(value: Optional[str]) -> Optional[datetime.date]:
+        try:
+            return datetime.date.fromisoformat(value) if value else None
+        except ValueError:
+            return None
+
+    def as_args(self) -> Dict[str, str]:
+        """Non-empty filters, for building page links"""
+        values = {
+            'user': self.user, 'action': self.action, 'category': self.category, 'q': self.q, 'archive': self.archive,
+            'start': self.start.isoformat() if self.start else '', 'end': self.end.isoformat() if self.end else '',
+        }
+        return {key: value for key, value in values.items() if value}
+
+    def apply(self, query):
+        from .models import db, Log
+        from .search_index import log_search
+        # Timestamps are stored as text, so date bounds are compared as text too ('2025-08-01' sorts
+        # before every time on that day whether or not it was stored with microseconds)
+        if self.start:
+            query = query.filter(Log.timestamp >= db.literal(self.start.isoformat(), db.String))
+        if self.end:
+            next_day = self.end + datetime.timedelta(days=1)
+            query = query.filter(Log.timestamp < db.literal(next_day.isoformat(), db.String))
+        if self.user:
+            query = query.filter(Log.user == self.user)
+        if self.action:
+            query = query.filter(Log.action == self.action)
+        elif self.category:
+            actions = [action for action in known_actions() if action_category(action) == self.category]
+            query = query.filter(Log.action.in_(actions))
+        if self.q:
+            matching = log_search.matching_ids(self.q) if log_search.exists() else None
+            if matching is not None:
+                query = query.filter(Log.id.in_(matching))
+            else:
+                query = query.filter(Log.details.ilike(f"%{self.q}%"))
+        return query
+
+    def matches(self, entry) -> bool:
+        """The same filters applied in Python, for archived entries"""
+        if self.start and entry.timestamp.date() < self.start:
+            return False
+        if self.end and entry.timestamp.date() > self.end:
+            return False
+        if self.user and entry.user != self.user:
+            return False
+        if self.action and entry.action != self.action:
+            return False
+        if not self.action and self.category and action_category(entry.action) != self.category:
+            return False
+        if self.q:
+            details = (entry.details or '').lower()
+            return all(word in details for word in re.findall(r'\w+', self.q.lower()))
+        return True
+
+
+def _raw_timestamp():
+    """The timestamp column as stored (text), without converting it to a datetime"""
+    from .models import db, Log
+    return db.type_coerce(Log.timestamp, db.String)
+
+
+def page_of_logs(filters: AuditLogFilters, after: Optional[str] = None, before: Optional[str] = None,
+                 page_size: int = AUDIT_LOG_PAGE_SIZE) -> Dict[str, any]:
+    """
+    One page of log entries, newest first
+    after: cursor of the last entry on the previous page (older entries follow it)
+    before: cursor of the first entry on the next page (going back towards newer entries)
+    Returns: {'logs', 'older' (cursor or None), 'newer' (cursor or None)}
+    """
+    from .models import db, Log
+    raw_timestamp = _raw_timestamp()
+    query = filters.apply(db.session.query(Log, raw_timestamp))
+    key = db.tuple_(Log.timestamp, Log.id)
+
+    after_key, before_key = decode_cursor(after), decode_cursor(before)
+    if before_key:
+        rows = query.filter(key > db.tuple_(db.literal(before_key[0], db.String), before_key[1])) \
+            .order_by(Log.timestamp.asc(), Log.id.asc()).limit(page_size + 1).all()
+        has_more_newer = len(rows) > page_size
+        rows = list(reversed(rows[:page_size]))
+        has_more_older = True
+    else:
+        if after_key:
+            query = query.filter(key < db.tuple_(db.literal(after_key[0], db.String), after_key[1]))
+        rows = query.order_by(Log.timestamp.desc(), Log.id.desc()).limit(page_size + 1).all()
+        has_more_older = len(rows) > page_size
+        rows = rows[:page_size]
+        has_more_newer = after_key is not None
+
+    logs = [log for log, _ in rows]
+    cursors = [encode_cursor(timestamp, log.id) for log, timestamp in rows]
+    return {
+        'logs': logs,
+        'older': cursors[-1] if rows and has_more_older else None,
+        'newer': cursors[0] if rows and has_more_newer else None,
+    }
+
+
+def iter_logs(filters: AuditLogFilters, batch_size: int = 1000):
+    """Every matching entry, newest first, read in keyset batches (for CSV export)"""
+    cursor = None
+    while True:
+        page = page_of_logs(filters, after=cursor, page_size=batch_size)
+        yield from page['logs']
+        if not page['older']:
+            return
+        cursor = page['older']
+
+
+def page_of_archived_logs(filters: AuditLogFilters, after: Optional[str] = None, before: Optional[str] = None,
+                          page_size: int = AUDIT_LOG_PAGE_SIZE) -> Dict[str, any]:
+    """Like page_of_logs, for the archived month in filters.archive"""
+    from .audit_archive import read_month
+    entries = [entry for entry in read_month(filters.archive) if filters.matches(entry)]
+    keys = [(entry.timestamp, entry.id) for entry in entries]  # newest first
+
+    def position(cursor):
+        timestamp, log_id = cursor
+        key = (datetime.datetime.fromisoformat(timestamp), log_id)
+        # First entry older than the cursor
+        return next((index for index, entry_key in enumerate(keys) if entry_key < key), len(keys))
+
+    after_key, before_key = decode_cursor(after), decode_cursor(before)
+    if before_key:
+        end = next((index for index, entry_key in enumerate(keys)
+                    if entry_key <= (datetime.datetime.fromisoformat(before_key[0]), before_key[1])), len(keys))
+        start = max(0, end - page_size)
+    else:
+        start = position(after_key) if after_key else 0
+        end = start + page_size
+    page = entries[start:end]
+    return {
+        'logs': page,
+        'older': encode_cursor(page[-1].timestamp.isoformat(' '), page[-1].id) if page and end < len(entries) else None,
+        'newer': encode_cursor(page[0].timestamp.isoformat(' '), page[0].id) if page and start > 0 else None,
+    }
@@ -0,0 +1,205 @@
+"""
+Background ticket categorization for TeBSTrack
+Handles AI categorization of newly ingested tickets outside the email fetch loop, with bounded concurrency and retries
+"""
+
+import logging
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from .ai_service import AI_CATEGORIZATION_BATCH_SIZE
+
+PENDING_CATEGORY = 'Pending Classification'
+
+# Fallbacks applied when categorization keeps failing (same as the legacy synchronous path)
+DEFAULT_CATEGORY = 'General'
+DEFAULT_URGENCY = 'Medium'
+
+CATEGORIZATION_WORKERS = int(os.getenv('AI_CATEGORIZATION_WORKERS', 2))
+CATEGORIZATION_MAX_ATTEMPTS = int(os.getenv('AI_CATEGORIZATION_MAX_ATTEMPTS', 4))
+CATEGORIZATION_RETRY_SECONDS = float(os.getenv('AI_CATEGORIZATION_RETRY_SECONDS', 2))
+CATEGORIZATION_MAX_RETRY_SECONDS = float(os.getenv('AI_CATEGORIZATION_MAX_RETRY_SECONDS', 60))
+
+
+class CategorizationQueue:
+    """Queue of ticket IDs awaiting AI categorization, drained by a fixed pool of worker threads"""
+
+    def __init__(self, workers: int = CATEGORIZATION_WORKERS, max_attempts: int = CATEGORIZATION_MAX_ATTEMPTS):
+        self.app = None
+        self.workers = max(1, workers)
+        self.max_attempts = max(1, max_attempts)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.threads = []
+        self.queued = set()  # ticket IDs waiting, retrying or in flight
+        self.stats = {'queued': 0, 'completed': 0, 'retried': 0, 'failed': 0}
+
+    def init_app(self, app):
+        """Bind the Flask app whose context the workers run in"""
+        self.app = app
+
+    def enqueue(self, ticket_id: int) -> bool:
+        """Queue a ticket for categorization; returns False if it is already queued"""
+        with self.lock:
+            if ticket_id in self.queued:
+                return False
+            self.queued.add(ticket_id)
+            self.stats['queued'] += 1
+            self._ensure_started()
+        self.queue.put((ticket_id, 1))
+        return True
+
+    def enqueue_pending(self) -> int:
+        """Queue every ticket still marked as pending (e.g. left over from a restart)"""
+        from .models import Ticket
+        pending = Ticket.query.filter_by(category=PENDING_CATEGORY).with_entities(Ticket.id).all()
+        return sum(1 for (ticket_id,) in pending if self.enqueue(ticket_id))
+
+    def get_status(self) -> Dict[str, int]:
+        """Queue depth and lifetime counters for status reporting"""
+        with self.lock:
+            return dict(self.stats, pending=len(self.queued), workers=len(self.threads))
+
+    def _ensure_started(self):
+        """Start the worker threads on first use (caller holds the lock)"""
+        if self.threads:
+            return
+        if self.app is None:
+            self.app = current_app._get_current_object()
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"categorizer-{number + 1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _worker(self):
+        while True:
+            # Take whatever else is already waiting so a backlog is categorized in batched requests
+            jobs = [self.queue.get()]
+            while len(jobs) < AI_CATEGORIZATION_BATCH_SIZE:
+                try:
+                    jobs.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            handled = set()
+            try:
+                with self.app.app_context():
+                    self._process(jobs, handled)
+            except Exception as e:
+                # Tickets already completed or scheduled for a retry keep that outcome
+                unhandled = [(ticket_id, attempt) for ticket_id, attempt in jobs if ticket_id not in handled]
+                logging.error(f"Categorization worker crashed on tickets {[ticket_id for ticket_id, _ in unhandled]}: {e}")
+                for ticket_id, attempt in unhandled:
+                    if attempt < self.max_attempts:
+                        self._retry(ticket_id, attempt, e)
+                    else:
+                        self._finish(ticket_id, 'failed')
+            finally:
+                for _ in jobs:
+                    self.queue.task_done()
+
+    def _process(self, jobs: List[Tuple[int, int]], handled: set):
+        """Categorize a batch; each ticket's ID is added to handled once it is finished or scheduled for a retry"""
+        from .ai_service import get_ai_service
+        from .models import db, Ticket
+
+        tickets = []
+        attempts = []
+        for ticket_id, attempt in jobs:
+            ticket = Ticket.query.get(ticket_id)
+            if not ticket or ticket.category != PENDING_CATEGORY:
+                # Deleted or already categorized by hand while waiting
+                self._finish(ticket_id, 'completed')
+                handled.add(ticket_id)
+                continue
+            tickets.append(ticket)
+            attempts.append(attempt)
+        if not tickets:
+            return
+
+        try:
+            results = get_ai_service().categorize_tickets_batch([
+                {'subject': ticket.subject, 'body': ticket.description or '', 'sender': ticket.sender}
+                for ticket in tickets
+            ])
+            errors = ["no valid result"] * len(tickets)
+        except Exception as e:
+            results = [None] * len(tickets)
+            errors = [e] * len(tickets)
+
+        for ticket, attempt, result, error in zip(tickets, attempts, results, errors):
+            ticket_id = ticket.id
+            try:
+                if result is None and attempt < self.max_attempts:
+                    self._retry(ticket_id, attempt, error)
+                else:
+                    if result is None:
+                        logging.error(f"AI categorization of ticket {ticket_id} failed after {attempt} attempts: {error}. Using defaults.")
+                    self._apply(ticket, result)
+                    self._finish(ticket_id, 'completed' if result else 'failed')
+            except Exception as e:
+                # e.g. the commit failed: undo this ticket's changes and retry it alone
+                db.session.rollback()
+                if attempt < self.max_attempts:
+                    self._retry(ticket_id, attempt, e)
+                else:
+                    logging.error(f"Could not store the categorization of ticket {ticket_id}: {e}")
+                    self._finish(ticket_id, 'failed')
+            handled.add(ticket_id)
+
+    def _retry(self, ticket_id: int, attempt: int, error):
+        """Re-queue a ticket after an exponential backoff delay"""
+        delay = min(CATEGORIZATION_RETRY_SECONDS * (2 ** (attempt - 1)), CATEGORIZATION_MAX_RETRY_SECONDS)
+        logging.warning(f"AI categorization of ticket {ticket_id} failed (attempt {attempt}/{self.max_attempts}): {error}. Retrying in {delay:g}s")
+        with self.lock:
+            self.stats['retried'] += 1
+        timer = threading.Timer(delay, self.queue.put, args=((ticket_id, attempt + 1),))
+        timer.daemon = True
+        timer.start()
+
+    def _apply(self, ticket, result: Optional[Dict[str, any]]) -> bool:
+        """
+        Store the categorization on the ticket and record it in the audit log, unless the ticket was
+        categorized by hand while the AI call ran (returns False then, and changes nothing)
+        """
+        from .models import db, Category, Log, Ticket
+        from .template_recommendations import template_recommendations
+
+        category = (result or {}).get('category', DEFAULT_CATEGORY)
+        urgency = (result or {}).get('urgency', DEFAULT_URGENCY)
+        # Validate that the AI-suggested category exists in the database
+        if not Category.query.filter_by(name=category).first():
+            category = DEFAULT_CATEGORY
+
+        # Only while the ticket is still pending, so a change made by staff meanwhile is kept
+        ticket_id = ticket.id
+        updated = Ticket.query.filter(Ticket.id == ticket_id, Ticket.category == PENDING_CATEGORY) \
+            .update({'category': category, 'urgency': urgency}, synchronize_session=False)
+        if not updated:
+            db.session.rollback()
+            logging.info(f"Ticket {ticket_id} was categorized by hand before the AI result arrived; keeping that")
+            return False
+        if result:
+            confidence = result.get('confidence', 0) or 0
+            classifier = 'Local classifier' if result.get('source') == 'local' else 'AI'
+            db.session.add(Log(
+                user='System (AI)',
+                action='auto_categorize_email',
+                details=f"{classifier} auto-categorized new email ticket '{ticket.subject}' (ID: {ticket.id}) as '{category}' with urgency '{urgency}' (confidence: {confidence:.1%})"
+            ))
+        db.session.commit()
+        # The recommendation depends on the category, so compute it once the category is known
+        template_recommendations.enqueue(ticket.id)
+        return True
+
+    def _finish(self, ticket_id: int, outcome: str):
+        with self.lock:
+            self.queued.discard(ticket_id)
+            self.stats[outcome] += 1
+
+
+# Global categorization queue instance
+categorization_queue = CategorizationQueue()
@@ -0,0 +1,116 @@
+"""
+Chatbot answer cache for TeBSTrack
+Handles reuse of chatbot answers for repeated questions about the same ticket and knowledge base version
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Maximum cached answers (least recently used are evicted); 0 disables the cache
+CHATBOT_CACHE_SIZE = int(os.getenv('CHATBOT_CACHE_SIZE', 500))
+
+# Answers older than this are regenerated
+CHATBOT_CACHE_TTL_SECONDS = float(os.getenv('CHATBOT_CACHE_TTL_SECONDS', 3600))
+
+# Ticket fields that appear in the chatbot prompt (an answer only applies while they are unchanged)
+TICKET_CONTEXT_FIELDS = ('id', 'subject', 'body', 'sender', 'category', 'status', 'urgency', 'created_at', 'assigned_to')
+
+
+# Words that never change what is being asked
+FILLER_WORDS = {'a', 'an', 'the', 'my', 'our', 'please', 'pls', 'kindly'}
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and filler words, collapse whitespace"""
+    words = re.sub(r"[^\w\s]", ' ', question.lower()).split()
+    return ' '.join(word for word in words if word not in FILLER_WORDS)
+
+
+def context_key(ticket_context: Optional[Dict], user_context: Optional[Dict], knowledge_version: str) -> str:
+    """Hash of everything besides the question that shapes the answer"""
+    ticket = ticket_context or {}
+    parts = [knowledge_version, (user_context or {}).get('role', '')]
+    parts.extend(str(ticket.get(field, '')) for field in TICKET_CONTEXT_FIELDS)
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class ChatbotCache:
+    """
+    LRU cache of chatbot answers keyed on the normalized question text. Only case, punctuation and
+    filler words are ignored: fuzzy matching cannot tell "install" from "uninstall" apart.
+    """
+
+    def __init__(self, max_entries: int = CHATBOT_CACHE_SIZE, ttl_seconds: float = CHATBOT_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()  # (context key, normalized question) -> entry, least recently used first
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, question: str, ticket_context: Optional[Dict], user_context: Optional[Dict],
+            knowledge_version: str) -> Optional[str]:
+        """Cached answer for this question (ignoring case, punctuation and filler words) in the same context"""
+        if not self.enabled:
+            return None
+        normalized = normalize_question(question)
+        context = context_key(ticket_context, user_context, knowledge_version)
+        username = (user_context or {}).get('username')
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get((context, normalized))
+            if entry is None or not self._usable(entry, username, now):
+                self.stats['misses'] += 1
+                return None
+            self.entries.move_to_end((context, normalized))
+            self.stats['hits'] += 1
+            return entry['answer']
+
+    def put(self, question: str, ticket_context: Optional[Dict], user_context: Optional[Dict],
+            knowledge_version: str, answer: str) -> None:
+        if not self.enabled or not answer:
+            return
+        normalized = normalize_question(question)
+        context = context_key(ticket_context, user_context, knowledge_version)
+        username = (user_context or {}).get('username')
+        key = (context, normalized)
+        entry = {
+            'answer': answer,
+            # Answers that address the asker by name are only reused for that user
+            'owner': username if username and username.lower() in answer.lower() else None,
+            'created': time.monotonic(),
+        }
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            self.stats['stores'] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def _usable(self, entry: Dict, username: Optional[str], now: float) -> bool:
+        if self.ttl_seconds and now - entry['created'] > self.ttl_seconds:
+            return False
+        return entry['owner'] is None or entry['owner'] == username
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def get_status(self) -> Dict[str, any]:
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return dict(self.stats, entries=len(self.entries), max_entries=self.max_entries,
+                        hit_rate=round(self.stats['hits'] / lookups, 3) if lookups else 0.0)
+
+
+# Global chatbot answer cache shared by every AI service instance
+chatbot_cache = ChatbotCache()
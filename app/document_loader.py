@@ -6,80 +6,156 @@ import os
 import fitz  # PyMuPDF for PDF
 import docx  # python-docx for DOCX
 import logging
-from typing import Optional
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .text_chunker import TextChunker
+
+# Worker processes used for parallel extraction (1 disables the process pool)
+EXTRACT_WORKERS = int(os.getenv('KB_EXTRACT_WORKERS', min(4, os.cpu_count() or 1)))
+
+# PDFs with at least this many pages are split into page ranges across worker processes
+PDF_PARALLEL_MIN_PAGES = int(os.getenv('KB_PDF_PARALLEL_MIN_PAGES', 64))
+
+
+def _extract_pdf_page_range(job: Tuple[str, int, int]) -> List[str]:
+    """Process pool entry point: text of pages [start, stop) of a PDF"""
+    file_path, start, stop = job
+    with fitz.open(file_path) as doc:
+        return [doc[page_index].get_text() for page_index in range(start, stop)]
+
 
 class DocumentLoader:
     @staticmethod
     def load_knowledge_document(file_path: str) -> Optional[str]:
         """
-        Load and extract text from PDF or DOCX knowledge documents
+        Load and extract text from PDF, DOCX or plain text knowledge documents
+        """
+        document = DocumentLoader.extract_with_offsets(file_path)
+        return document['text'] if document else None
+
+    @staticmethod
+    def extract_with_offsets(file_path: str) -> Optional[Dict[str, any]]:
+        """
+        Extract a document and record where each page (PDF) or section (DOCX/TXT) lands in the text
+        Returns: {text: str, sections: [{number: int, start: int, end: int}]} or None on failure
         """
         if not os.path.exists(file_path):
             logging.warning(f"Knowledge document not found: {file_path}")
             return None
-            
-        file_ext = os.path.splitext(file_path)[1].lower()
-        
+
         try:
-            if file_ext == '.pdf':
-                return DocumentLoader._extract_pdf_text(file_path)
-            elif file_ext == '.docx':
-                return DocumentLoader._extract_docx_text(file_path)
-            else:
-                logging.error(f"Unsupported document format: {file_ext}")
-                return None
-                
+            parts = []
+            sections = []
+            offset = 0
+            for number, section_text in DocumentLoader.iter_sections(file_path):
+                parts.append(section_text)
+                sections.append({'number': number, 'start': offset, 'end': offset + len(section_text)})
+                offset += len(section_text)
+        except ValueError as e:
+            logging.error(str(e))
+            return None
         except Exception as e:
             logging.error(f"Failed to load document {file_path}: {e}")
             return None
-    
+
+        # Strip like the legacy extractors did, shifting offsets past leading whitespace
+        raw = ''.join(parts)
+        text = raw.strip()
+        lead = len(raw) - len(raw.lstrip())
+        for section in sections:
+            section['start'] = min(max(section['start'] - lead, 0), len(text))
+            section['end'] = min(max(section['end'] - lead, 0), len(text))
+        return {'text': text, 'sections': sections}
+
     @staticmethod
-    def _extract_pdf_text(file_path: str) -> str:
-        """Extract text from PDF file"""
-        text = ""
+    def section_at(sections: List[Dict[str, int]], offset: int) -> Optional[int]:
+        """Page/section number containing a character offset (for citing retrieved text)"""
+        for section in sections:
+            if section['start'] <= offset < section['end']:
+                return section['number']
+        return None
+
+    @staticmethod
+    def iter_sections(file_path: str) -> Iterator[Tuple[int, str]]:
+        """Yield (page or section number, text) pairs in document order"""
+        file_ext = os.path.splitext(file_path)[1].lower()
+        if file_ext == '.pdf':
+            return DocumentLoader.iter_pdf_pages(file_path)
+        elif file_ext == '.docx':
+            return DocumentLoader.iter_docx_sections(file_path)
+        elif file_ext == '.txt':
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return iter([(1, f.read())])
+        raise ValueError(f"Unsupported document format: {file_ext}")
+
+    @staticmethod
+    def iter_pdf_pages(file_path: str, workers: Optional[int] = None) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (page number, text) for every PDF page. Large PDFs are split into
+        contiguous page ranges extracted in parallel processes; pages are still
+        yielded in order as each range completes.
+        """
+        workers = EXTRACT_WORKERS if workers is None else workers
         with fitz.open(file_path) as doc:
-            for page in doc:
-                text += page.get_text()
-        return text.strip()
-    
+            page_count = doc.page_count
+            # Worker processes (e.g. the knowledge cache pool) never start a nested pool
+            if workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES or multiprocessing.parent_process() is not None:
+                for page_index in range(page_count):
+                    yield page_index + 1, doc[page_index].get_text()
+                return
+
+        # A few ranges per worker keeps the pool busy when some pages are much denser than others
+        range_size = max(1, -(-page_count // (workers * 4)))
+        jobs = [(file_path, start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            for (_, start, _), texts in zip(jobs, pool.map(_extract_pdf_page_range, jobs)):
+                for offset, text in enumerate(texts):
+                    yield start + offset + 1, text
+
     @staticmethod
-    def _extract_docx_text(file_path: str) -> str:
-        """Extract text from DOCX file"""
+    def iter_docx_sections(file_path: str) -> Iterator[Tuple[int, str]]:
+        """
+        Yield (section number, text) for each DOCX paragraph and then each table.
+        Merged cells are repeated by python-docx for every grid position they span,
+        so each underlying cell is emitted only once.
+        """
         doc = docx.Document(file_path)
-        text = []
-        
+        number = 0
+
         for paragraph in doc.paragraphs:
-            text.append(paragraph.text)
-            
+            number += 1
+            yield number, paragraph.text + '\n'
+
         # Also extract text from tables
         for table in doc.tables:
+            seen = set()
+            lines = []
             for row in table.rows:
                 for cell in row.cells:
-                    text.append(cell.text)
-                    
-        return '\n'.join(text).strip()
+                    # Holding the cell elements keeps their lxml proxies (and identities) stable
+                    if cell._tc in seen:
+                        continue
+                    seen.add(cell._tc)
+                    lines.append(cell.text + '\n')
+            number += 1
+            yield number, ''.join(lines)
+
+    @staticmethod
+    def _extract_pdf_text(file_path: str) -> str:
+        """Extract text from PDF file"""
+        return ''.join(text for _, text in DocumentLoader.iter_pdf_pages(file_path)).strip()
+
+    @staticmethod
+    def _extract_docx_text(file_path: str) -> str:
+        """Extract text from DOCX file"""
+        return ''.join(text for _, text in DocumentLoader.iter_docx_sections(file_path)).strip()
 
     @staticmethod
     def chunk_text(text: str, max_chunk_size: int = 3000) -> list:
         """
         Split large text into chunks for better AI processing
+        max_chunk_size is in characters (~4 per token); see text_chunker for token-based options
         """
-        if len(text) <= max_chunk_size:
-            return [text]
-            
-        chunks = []
-        sentences = text.split('. ')
-        current_chunk = ""
-        
-        for sentence in sentences:
-            if len(current_chunk + sentence) <= max_chunk_size:
-                current_chunk += sentence + ". "
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + ". "
-                
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-            
-        return chunks
+        return TextChunker(max_tokens=max(1, max_chunk_size // 4), overlap_tokens=0).split(text)
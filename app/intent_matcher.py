@@ -0,0 +1,210 @@
+"""
+Chat intent matching for TeBSTrack
+Handles classifying chatbot messages (casual, about the ticket, asking for specific ticket fields) with one
+compiled pattern, and answering field questions from the ticket without calling the AI
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+# Phrase groups; a phrase matches whole words only, case-insensitively
+PHRASE_GROUPS = {
+    'casual': [
+        'hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening',
+        'thanks', 'thank you', 'cheers', 'bye', 'goodbye', 'how are you',
+        "how's it going", 'how is it going', "what's up", 'whats up',
+        'nice to meet you', 'pleased to meet you', 'good to see you',
+    ],
+    # Explicitly asking about the ticket being viewed
+    'explicit_ticket': [
+        'about this ticket', 'current ticket', 'this ticket', 'ticket details',
+        'tell me about', 'explain this', 'describe this', 'summary of this',
+        'what is this ticket', 'ticket summary', 'ticket information',
+    ],
+    # Needs the ticket to answer (field names are added from the field groups below)
+    'definite_ticket': [
+        'next steps', 'what should', 'how to resolve', 'solution', 'fix', 'resolve',
+        'when was this', 'when did this', 'what date', 'issue occur', 'this happen',
+    ],
+    # Might need the ticket, or might be general
+    'contextual': ['what', 'who', 'when', 'where', 'why', 'how', 'explain', 'show me', 'tell me more'],
+    # Asking for help or an explanation rather than a field value; never answered from fields alone
+    'action': [
+        'how', 'why', 'should', 'fix', 'resolve', 'solution', 'solve', 'next', 'steps', 'help',
+        'explain', 'troubleshoot', 'describe', 'tell me about', 'summary', 'summarise', 'summarize',
+        'draft', 'reply', 'respond', 'write', 'can you', 'could you', 'change', 'update', 'set',
+        'escalate', 'assign', 'close',
+    ],
+    'who': ['who', 'whom', 'whose'],
+    'when': ['when', 'what date', 'what time', 'how long ago', 'how old'],
+    # Mentions of the ticket, for "who sent it" / "when was it" style questions
+    'ticket_ref': ['this', 'it', 'ticket', 'issue', 'request', 'mail', 'email'],
+    # The ticket being viewed itself; a field question must say this or name nothing else to be answered directly
+    'ticket_self': ['this', 'it', 'its', 'ticket'],
+    # Ticket fields that can be answered directly
+    'status': ['status', 'still open', 'is it open', 'is this open', 'is it closed', 'is this closed', 'resolved'],
+    'category': ['category', 'categorised', 'categorized', 'what type of ticket', 'what kind of ticket'],
+    'urgency': ['urgency', 'priority', 'urgent', 'how urgent'],
+    'sender': [
+        'sender', 'requester', 'requestor', 'requested by', 'sent by', 'submitted by', 'raised by', 'opened by',
+        'filed by', 'created by', 'who requested', 'who sent', 'who raised', 'who submitted', 'who opened',
+        'who filed', 'who made', 'who created', 'from who', 'from whom', 'email from',
+    ],
+    'assignee': ['assigned', 'assignee', 'assigned to', 'who is handling', 'who is working on', 'owner'],
+    # 'received' and 'reported' are left out: "received an error when..." is not about the date
+    'created': ['created', 'creation date', 'date created', 'created on', 'opened on'],
+    'subject': ['subject', 'title'],
+    'ticket_id': ['ticket id', 'ticket number', 'ticket no', 'id of this ticket'],
+}
+
+# Answer line, ticket context key and default for each field group, in the order answers list them
+FIELD_ANSWERS = {
+    'status': ("Status: {}", 'status', 'Unknown'),
+    'category': ("Category: {}", 'category', 'N/A'),
+    'urgency': ("Urgency: {}", 'urgency', 'N/A'),
+    'assignee': ("Assigned to: {}", 'assigned_to', 'Unassigned'),
+    'sender': ("Requested by: {}", 'sender', 'Unknown'),
+    'created': ("Created: {}", 'created_at', 'Unknown'),
+    'subject': ("Subject: {}", 'subject', 'N/A'),
+    'ticket_id': ("Ticket #{}", 'id', 'N/A'),
+}
+TICKET_FIELDS = tuple(FIELD_ANSWERS)
+
+# Questions longer than this are left to the AI even if they name a field
+DIRECT_ANSWER_MAX_WORDS = 8
+# Words that may surround field names in a bare field question ("what's the status?"), besides the field phrases
+QUESTION_FILLER_WORDS = frozenset([
+    'what', "what's", 'whats', 'which', 'is', 'are', 'was', 'the', 'a', 'an', 'of', 'and', 'or', 'by', 'to',
+    'me', 'please', 'current', 'hi', 'hello', 'hey', 'thanks', 'ok', 'so',
+])
+
+
+def _contains_words(text: str, phrase: str) -> bool:
+    return re.search(r'\b' + re.escape(phrase) + r'\b', text) is not None
+
+
+def _trie_regex(phrases: Iterable[str]) -> str:
+    """Alternation factored by common prefix ("st(?:atus|eps)"), so the regex engine never retries a shared prefix"""
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}  # end of a phrase
+
+    def emit(node):
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # Longer phrases are tried first because the quantifier is greedy
+        return f'(?:{body})?' if '' in node else body
+
+    return emit(trie)
+
+
+class PhraseMatcher:
+    """
+    All phrase groups compiled into one prefix-factored regex. A lookahead at each word start
+    finds the longest phrase beginning there, so overlapping phrases are all seen in one scan; shorter
+    phrases inside a matched one (e.g. "created" in "created by") are implied by it.
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        phrase_groups = {}
+        for group, phrases in groups.items():
+            for phrase in phrases:
+                phrase_groups.setdefault(phrase.lower(), set()).add(group)
+
+        # Groups seen when a phrase matches: its own and those of every phrase it contains
+        self.implied = {
+            phrase: frozenset().union(*(
+                other_groups for other, other_groups in phrase_groups.items() if _contains_words(phrase, other)
+            ))
+            for phrase in phrase_groups
+        }
+
+        self.pattern = re.compile(r"\b(?=(" + _trie_regex(phrase_groups) + r")\b)")
+
+    def groups(self, text: str) -> FrozenSet[str]:
+        """Names of every group with a phrase in the text"""
+        found = set()
+        for match in self.pattern.finditer(text.lower()):
+            found |= self.implied[match.group(1)]
+        return frozenset(found)
+
+
+def _with_field_phrases(groups: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Field questions need the ticket too"""
+    groups = dict(groups)
+    groups['definite_ticket'] = list(groups['definite_ticket']) + [
+        phrase for field in TICKET_FIELDS for phrase in groups[field]
+    ]
+    return groups
+
+
+matcher = PhraseMatcher(_with_field_phrases(PHRASE_GROUPS))
+
+# Groups that can make a message a field question
+FIELD_QUESTION_GROUPS = frozenset(TICKET_FIELDS + ('who', 'when'))
+# Words a bare field question may consist of
+BARE_QUESTION_WORDS = QUESTION_FILLER_WORDS | frozenset(
+    word for group in TICKET_FIELDS + ('who', 'when', 'ticket_self') for phrase in PHRASE_GROUPS[group]
+    for word in phrase.split()
+)
+
+
+def is_bare_question(message: str) -> bool:
+    """Nothing but field names and filler ("status and urgency?"), so it can only mean the ticket being viewed"""
+    return all(word in BARE_QUESTION_WORDS for word in re.findall(r"[\w']+", message.lower()))
+
+
+def requested_fields(found: FrozenSet[str], message: str) -> List[str]:
+    """
+    Ticket fields the message asks for, if it asks for nothing but field values of this ticket: it has to
+    refer to the ticket ("this", "it", "ticket") or be a bare field question, so "what is the status of
+    the vpn server?" goes to the AI
+    """
+    if 'action' in found or not found & FIELD_QUESTION_GROUPS or len(message.split()) > DIRECT_ANSWER_MAX_WORDS:
+        return []
+    if 'ticket_self' not in found and not is_bare_question(message):
+        return []
+    if 'who' in found:
+        # "Who ..." asks for a person: the assignee if mentioned, otherwise the requester
+        if 'assignee' in found:
+            return ['assignee']
+        return ['sender'] if found & {'sender', 'ticket_ref', 'created'} else []
+    if 'when' in found:
+        # Only the creation date is recorded
+        return ['created'] if found & {'created', 'ticket_ref'} and 'assignee' not in found else []
+    return [field for field in TICKET_FIELDS if field in found]
+
+
+def analyze_intent(message: str) -> Dict[str, any]:
+    """
+    Classify a chat message in one pass
+    Returns: {'needs_ticket_details': bool, 'is_casual': bool, 'fields': [ticket fields asked for]}
+    """
+    found = matcher.groups(message)
+    word_count = len(message.split())
+    fields = requested_fields(found, message)
+
+    # Ticket questions win over greetings ("hi, what's the status?")
+    if found & {'explicit_ticket', 'definite_ticket'}:
+        return {'needs_ticket_details': True, 'is_casual': False, 'fields': fields}
+    if 'casual' in found:
+        return {'needs_ticket_details': False, 'is_casual': True, 'fields': []}
+    if 'contextual' in found:
+        # Short general questions ("what is VPN?") don't need the ticket
+        return {'needs_ticket_details': word_count > 4, 'is_casual': False, 'fields': []}
+    return {'needs_ticket_details': False, 'is_casual': False, 'fields': []}
+
+
+def answer_from_ticket(fields: List[str], ticket_context: Dict[str, any]) -> Optional[str]:
+    """One line per requested field, or None if nothing was asked"""
+    if not fields:
+        return None
+    return '\n'.join(
+        FIELD_ANSWERS[field][0].format(ticket_context.get(FIELD_ANSWERS[field][1], FIELD_ANSWERS[field][2]))
+        for field in fields
+    )
@@ -0,0 +1,221 @@
+"""
+Persistent knowledge base cache for TeBSTrack
+Stores extracted document text and the search index on disk so they are only rebuilt when a source file changes
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from .document_loader import EXTRACT_WORKERS, DocumentLoader
+from .knowledge_index import KnowledgeIndex
+from .text_chunker import TextChunker
+
+CACHE_DIR = os.getenv('KB_CACHE_DIR', os.path.join('instance', 'kb_cache'))
+
+# Bump when the chunking or index layout changes so stale artifacts are ignored
+INDEX_FORMAT_VERSION = 3
+
+# Bump when document extraction output changes so cached texts are re-extracted
+TEXT_FORMAT_VERSION = 2
+
+
+def _sha256_file(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _extract_document(file_path: str) -> Optional[str]:
+    """Process pool entry point (must be a module-level function to be picklable)"""
+    return DocumentLoader.load_knowledge_document(file_path)
+
+
+class KnowledgeCache:
+    """Disk-backed cache of extracted knowledge documents and their search indexes"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.lock = threading.Lock()
+        self._texts = {}    # content sha256 -> extracted text
+        self._indexes = {}  # index key -> KnowledgeIndex
+        self._manifest = None
+
+    def _load_manifest(self) -> Dict[str, Dict]:
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def _write_json(self, path: str, data) -> None:
+        """Write JSON atomically so a crash never leaves a half-written cache file"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _manifest_entry(stat: os.stat_result, content_hash: str) -> Dict[str, any]:
+        return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': content_hash, 'version': TEXT_FORMAT_VERSION}
+
+    def _text_path(self, content_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"text_{content_hash}.txt")
+
+    def _read_cached_text(self, content_hash: str) -> Optional[str]:
+        if content_hash in self._texts:
+            return self._texts[content_hash]
+        try:
+            with open(self._text_path(content_hash), 'r', encoding='utf-8') as f:
+                text = f.read()
+        except OSError:
+            return None
+        self._texts[content_hash] = text
+        return text
+
+    def load_document(self, file_path: str) -> Optional[str]:
+        """Return the extracted text of a single knowledge document (see load_documents)"""
+        return self.load_documents([file_path]).get(file_path)
+
+    def load_documents(self, file_paths: List[str]) -> Dict[str, str]:
+        """
+        Return {path: extracted text} for the given documents. Files are only
+        re-extracted when their mtime/size changed and their content hash no
+        longer matches; several stale files are extracted in parallel processes.
+        """
+        results = {}
+        stale = []  # (path, manifest key, stat, content hash)
+        touched = False  # an entry's mtime/size was refreshed without re-extracting
+
+        with self.lock:
+            manifest = self._load_manifest()
+
+            for file_path in file_paths:
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    logging.warning(f"Knowledge document not found: {file_path}")
+                    continue
+
+                key = os.path.abspath(file_path)
+                entry = manifest.get(key)
+                if entry and entry.get('version') != TEXT_FORMAT_VERSION:
+                    entry = None
+
+                # Fast path: file untouched since last extraction
+                if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    text = self._read_cached_text(entry['sha256'])
+                    if text is not None:
+                        results[file_path] = text
+                        continue
+
+                # File touched: only re-extract if the content actually changed
+                content_hash = _sha256_file(file_path)
+                text = self._read_cached_text(content_hash) if entry and entry['sha256'] == content_hash else None
+                if text is not None:
+                    results[file_path] = text
+                    manifest[key] = self._manifest_entry(stat, content_hash)
+                    touched = True
+                else:
+                    stale.append((file_path, key, stat, content_hash))
+
+            if not stale and len(results) == len(file_paths):
+                # Record refreshed mtimes, or every later load re-hashes the touched files
+                if touched:
+                    self._save_manifest(manifest)
+                return results
+
+            paths = [item[0] for item in stale]
+            if len(paths) > 1 and EXTRACT_WORKERS > 1:
+                with ProcessPoolExecutor(max_workers=min(EXTRACT_WORKERS, len(paths))) as pool:
+                    texts = list(pool.map(_extract_document, paths))
+            else:
+                texts = [_extract_document(path) for path in paths]
+
+            for (file_path, key, stat, content_hash), text in zip(stale, texts):
+                if not text:
+                    continue
+                previous = manifest.get(key)
+                if previous and previous['sha256'] != content_hash:
+                    self._remove_file(self._text_path(previous['sha256']))
+                self._texts[content_hash] = text
+                try:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    with open(self._text_path(content_hash), 'w', encoding='utf-8') as f:
+                        f.write(text)
+                except OSError as e:
+                    logging.warning(f"Failed to cache extracted text for {file_path}: {e}")
+                manifest[key] = self._manifest_entry(stat, content_hash)
+                results[file_path] = text
+                logging.info(f"Extracted and cached knowledge document {file_path}")
+
+            self._save_manifest(manifest)
+            return results
+
+    def _save_manifest(self, manifest: Dict[str, Dict]) -> None:
+        try:
+            self._write_json(self.manifest_path, manifest)
+        except OSError as e:
+            logging.warning(f"Failed to write knowledge cache manifest: {e}")
+
+    def load_index(self, documents: Dict[str, str]) -> KnowledgeIndex:
+        """Return the search index for {source: text} documents, building it only on a cache miss"""
+        chunker = TextChunker()
+        fingerprint = "\n".join(f"{source}:{_sha256_text(text)}" for source, text in sorted(documents.items()))
+        settings = f"{INDEX_FORMAT_VERSION}:{chunker.max_tokens}:{chunker.overlap_tokens}"
+        index_key = _sha256_text(f"{settings}\n{fingerprint}")
+        with self.lock:
+            if index_key in self._indexes:
+                return self._indexes[index_key]
+
+            index_path = os.path.join(self.cache_dir, f"index_{index_key}.json")
+            index = None
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    index = KnowledgeIndex.from_dict(json.load(f))
+            except (OSError, ValueError, KeyError):
+                pass
+
+            if index is None:
+                index = KnowledgeIndex.from_documents(documents, chunker)
+                try:
+                    self._write_json(index_path, index.to_dict())
+                    self._prune_indexes(keep=index_path)
+                except OSError as e:
+                    logging.warning(f"Failed to cache knowledge index: {e}")
+
+            # Only the current knowledge base is ever queried
+            self._indexes = {index_key: index}
+            return index
+
+    def _prune_indexes(self, keep: str) -> None:
+        """Remove index files for knowledge base versions that are no longer current"""
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith('index_') and name.endswith('.json') and path != keep:
+                self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# Global knowledge cache instance (shared across AI service resets)
+knowledge_cache = KnowledgeCache()
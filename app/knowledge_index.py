@@ -0,0 +1,137 @@
+"""
+Knowledge base retrieval for TeBSTrack
+Builds a local BM25 index over knowledge base chunks so AI prompts only carry the relevant sections
+"""
+
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .text_chunker import TextChunker
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Common English words that carry no retrieval signal
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in is it its me my
+no not of on or our please so that the their them then there these this to us was we
+what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into index terms, dropping stopwords"""
+    if not text:
+        return []
+    return [term for term in _TOKEN_PATTERN.findall(text.lower()) if term not in _STOPWORDS]
+
+
+class KnowledgeIndex:
+    """Okapi BM25 index over knowledge base chunks (pure Python, no network)"""
+
+    def __init__(self, chunks: List[str], sources: Optional[List[str]] = None, k1: float = 1.5, b: float = 0.75):
+        if sources is None:
+            sources = [""] * len(chunks)
+        kept = [(chunk, source) for chunk, source in zip(chunks, sources) if chunk and chunk.strip()]
+        self.chunks = [chunk for chunk, _ in kept]
+        self.sources = [source for _, source in kept]  # source document of each chunk
+        self.k1 = k1
+        self.b = b
+        self.doc_lengths = []
+        self.postings = {}  # term -> {chunk_id: term frequency}
+
+        for chunk_id, chunk in enumerate(self.chunks):
+            terms = tokenize(chunk)
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, {})[chunk_id] = tf
+
+        self._compute_statistics()
+
+    def _compute_statistics(self):
+        """Derive average chunk length and per-term IDF from the postings"""
+        total = len(self.chunks)
+        self.avg_doc_length = (sum(self.doc_lengths) / total) if total else 0.0
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    @classmethod
+    def from_text(cls, text: str, chunker: Optional[TextChunker] = None) -> 'KnowledgeIndex':
+        """Chunk a knowledge base document and index the chunks"""
+        return cls((chunker or TextChunker()).split(text))
+
+    @classmethod
+    def from_documents(cls, documents: Dict[str, str], chunker: Optional[TextChunker] = None) -> 'KnowledgeIndex':
+        """Chunk several knowledge documents into one index, tagging every chunk with its source"""
+        chunker = chunker or TextChunker()
+        chunks = []
+        sources = []
+        for source, text in documents.items():
+            document_chunks = chunker.split(text)
+            chunks.extend(document_chunks)
+            sources.extend([source] * len(document_chunks))
+        return cls(chunks, sources)
+
+    def to_dict(self) -> Dict[str, any]:
+        """Serialize the index (chunks and postings) to JSON-compatible data"""
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "chunks": self.chunks,
+            "sources": self.sources,
+            "doc_lengths": self.doc_lengths,
+            "postings": {term: list(postings.items()) for term, postings in self.postings.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, any]) -> 'KnowledgeIndex':
+        """Restore an index saved with to_dict without re-tokenizing the chunks"""
+        index = cls.__new__(cls)
+        index.k1 = data["k1"]
+        index.b = data["b"]
+        index.chunks = data["chunks"]
+        index.sources = data["sources"]
+        index.doc_lengths = data["doc_lengths"]
+        index.postings = {term: dict(pairs) for term, pairs in data["postings"].items()}
+        index._compute_statistics()
+        return index
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict[str, any]]:
+        """
+        Rank chunks against the query
+        Returns: [{chunk_id: int, source: str, score: float, text: str}] best match first
+        """
+        if not self.chunks or top_k <= 0:
+            return []
+
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for chunk_id, tf in postings.items():
+                length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[chunk_id] / self.avg_doc_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + length_norm)
+
+        ranked = heapq.nlargest(top_k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [
+            {"chunk_id": chunk_id, "source": self.sources[chunk_id], "score": round(score, 4), "text": self.chunks[chunk_id]}
+            for chunk_id, score in ranked
+        ]
+
+    def get_context(self, query: str, top_k: int = 3) -> str:
+        """Return the top-k relevant chunks joined in document order, for prompt injection"""
+        hits = self.search(query, top_k)
+        hits.sort(key=lambda hit: hit["chunk_id"])
+        return "\n\n---\n\n".join(
+            f"[Source: {hit['source']}]\n{hit['text']}" if hit["source"] else hit["text"]
+            for hit in hits
+        )
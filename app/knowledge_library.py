@@ -0,0 +1,96 @@
+"""
+Multi-document knowledge base for TeBSTrack
+Ingests every PDF, DOCX and TXT document in the knowledge directory into one source-tagged search index
+"""
+
+import hashlib
+import logging
+import os
+from typing import Dict, List, Optional
+
+from .knowledge_cache import knowledge_cache
+from .knowledge_index import KnowledgeIndex
+
+KNOWLEDGE_DIRS = [os.getenv('KB_DIRECTORY')] if os.getenv('KB_DIRECTORY') else ['app/knowledge', 'knowledge']
+
+# When one base name exists in several formats, only the first of these is loaded
+SUPPORTED_EXTENSIONS = ['.txt', '.docx', '.pdf']
+
+EDITED_SUFFIX = '_edited'
+
+
+def discover_documents(directory: str) -> List[str]:
+    """
+    List the knowledge documents under a directory (recursively). An edited copy
+    (<name>_edited.*) replaces its original, and each base name is loaded once.
+    """
+    selected = {}  # (folder, base name) -> (is_edited, extension rank, path)
+    for folder, _, filenames in os.walk(directory):
+        for filename in filenames:
+            stem, ext = os.path.splitext(filename)
+            ext = ext.lower()
+            if ext not in SUPPORTED_EXTENSIONS or filename.startswith('~$'):
+                continue
+            is_edited = stem.endswith(EDITED_SUFFIX)
+            base = stem[:-len(EDITED_SUFFIX)] if is_edited else stem
+            candidate = (not is_edited, SUPPORTED_EXTENSIONS.index(ext), os.path.join(folder, filename))
+            key = (folder, base)
+            if key not in selected or candidate < selected[key]:
+                selected[key] = candidate
+    return sorted(path for _, _, path in selected.values())
+
+
+class KnowledgeLibrary:
+    """All knowledge documents plus a unified, source-tagged search index"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or next((d for d in KNOWLEDGE_DIRS if os.path.isdir(d)), KNOWLEDGE_DIRS[0])
+        self.documents = {}  # source name -> text
+        self.index = KnowledgeIndex([])
+        self.version = ''  # fingerprint of the loaded documents, changes whenever any of them does
+
+    def refresh(self, fallback_text: str = "") -> 'KnowledgeLibrary':
+        """Reload every document (cached extractions are reused) and rebuild the index if anything changed"""
+        paths = discover_documents(self.directory) if os.path.isdir(self.directory) else []
+        texts = knowledge_cache.load_documents(paths)
+        self.documents = {
+            os.path.relpath(path, self.directory).replace(os.sep, '/'): text
+            for path, text in texts.items() if text
+        }
+        if not self.documents and fallback_text:
+            self.documents = {'built-in knowledge base': fallback_text}
+        self.index = knowledge_cache.load_index(self.documents)
+        digest = hashlib.sha256()
+        for source, text in sorted(self.documents.items()):
+            digest.update(f"{source}\0{text}\0".encode('utf-8'))
+        self.version = digest.hexdigest()[:16]
+        logging.info(f"Knowledge library loaded {len(self.documents)} documents ({len(self.index)} chunks)")
+        return self
+
+    def search(self, query: str, top_k: int = 3) -> List[Dict[str, any]]:
+        """
+        Search all knowledge documents
+        Returns: [{source: str, chunk_id: int, score: float, text: str}] best match first
+        """
+        return self.index.search(query, top_k)
+
+    def get_context(self, query: str, top_k: int = 3) -> str:
+        """Relevant chunks from any document, labelled with their source, for prompt injection"""
+        return self.index.get_context(query, top_k)
+
+    def full_text(self) -> str:
+        """Every document concatenated (used when retrieval is disabled)"""
+        return "\n\n".join(f"[Source: {source}]\n{text}" for source, text in self.documents.items())
+
+    def sources(self) -> List[Dict[str, any]]:
+        """Per-document summary for status reporting"""
+        chunk_counts = {}
+        for source in self.index.sources:
+            chunk_counts[source] = chunk_counts.get(source, 0) + 1
+        return [
+            {"source": source, "characters": len(text), "chunks": chunk_counts.get(source, 0)}
+            for source, text in self.documents.items()
+        ]
+
+    def __len__(self) -> int:
+        return len(self.index)
@@ -0,0 +1,97 @@
+"""
+LLM backend configuration for TeBSTrack
+Handles which chat completion service the AI features use: OpenAI, any OpenAI-compatible server, or the local mock server
+"""
+
+import os
+from typing import Dict, Optional
+
+import openai
+
+from .llm_executor import llm_executor
+from .prompt_layout import prompt_cache_stats
+
+# Backend key -> label shown in the settings page
+LLM_BACKENDS = {
+    'openai': 'OpenAI',
+    'openai_compatible': 'OpenAI-compatible server',
+    'mock': 'Local mock server (load testing)',
+}
+
+DEFAULT_BACKEND = 'openai'
+DEFAULT_MODEL = 'gpt-4o-mini'  # Cost-effective for categorization
+
+# Where benchmarks/mock_llm_server.py listens by default
+DEFAULT_MOCK_URL = 'http://127.0.0.1:8089/v1'
+
+
+class ChatBackend:
+    """A configured chat completion endpoint (OpenAI client plus model name)"""
+
+    def __init__(self, name: str, model: str, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        self.name = name
+        self.model = model
+        self.base_url = base_url
+        # Local servers ignore the key, but the client refuses to start without one
+        if name != 'openai' and not api_key:
+            api_key = 'not-needed'
+        # Retries and timeouts are handled by the shared executor
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=0)
+
+    def create(self, **kwargs):
+        """
+        Create a chat completion through the shared executor (rate limits, retries,
+        circuit breaker); the configured model is used unless one is given
+        """
+        kwargs.setdefault('model', self.model)
+        if kwargs.get('stream'):
+            # The final chunk carries the usage block (streamed responses omit it otherwise)
+            kwargs.setdefault('stream_options', {'include_usage': True})
+        response = llm_executor.execute(self.client.chat.completions.create, **kwargs)
+        if not kwargs.get('stream'):
+            prompt_cache_stats.record(getattr(response, 'usage', None))
+        return response
+
+    def describe(self) -> Dict[str, str]:
+        return {
+            'backend': self.name,
+            'label': LLM_BACKENDS.get(self.name, self.name),
+            'model': self.model,
+            'base_url': self.base_url or 'https://api.openai.com/v1',
+        }
+
+
+def get_backend_settings() -> Dict[str, Optional[str]]:
+    """Backend, base URL and model from system settings, falling back to LLM_* environment variables"""
+    from .models import SystemSettings
+    backend = SystemSettings.get_setting('llm_backend') or os.getenv('LLM_BACKEND', DEFAULT_BACKEND)
+    if backend not in LLM_BACKENDS:
+        backend = DEFAULT_BACKEND
+    base_url = SystemSettings.get_setting('llm_base_url') or os.getenv('LLM_BASE_URL') or None
+    if backend == 'mock' and not base_url:
+        base_url = DEFAULT_MOCK_URL
+    if backend == 'openai':
+        base_url = None
+    return {
+        'backend': backend,
+        'base_url': base_url,
+        'model': SystemSettings.get_setting('llm_model') or os.getenv('LLM_MODEL', DEFAULT_MODEL),
+    }
+
+
+def create_chat_backend() -> ChatBackend:
+    """Build the chat backend described by the current settings"""
+    from .models import SystemSettings
+    settings = get_backend_settings()
+    return ChatBackend(
+        settings['backend'],
+        settings['model'],
+        api_key=SystemSettings.get_openai_api_key(),
+        base_url=settings['base_url'],
+    )
+
+
+def is_llm_configured() -> bool:
+    """Whether AI features can run: local backends need no API key"""
+    from .models import SystemSettings
+    return get_backend_settings()['backend'] != 'openai' or bool(SystemSettings.get_openai_api_key())
@@ -0,0 +1,223 @@
+"""
+LLM request executor for TeBSTrack
+Handles every chat completion call: per-call deadlines, jittered retries on 429/5xx, rate limiting, a concurrency cap and circuit breaking
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import openai
+
+from .text_chunker import estimate_tokens
+
+# Seconds allowed for one HTTP attempt, and for the whole call including retries and waiting for capacity
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', 30))
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', 60))
+
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 3))
+LLM_RETRY_BASE_SECONDS = float(os.getenv('LLM_RETRY_BASE_SECONDS', 1))
+LLM_RETRY_MAX_SECONDS = float(os.getenv('LLM_RETRY_MAX_SECONDS', 20))
+
+# Account limits (defaults match OpenAI usage tier 1 for gpt-4o-mini)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv('LLM_REQUESTS_PER_MINUTE', 500))
+LLM_TOKENS_PER_MINUTE = float(os.getenv('LLM_TOKENS_PER_MINUTE', 200000))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 8))
+
+# Consecutive failed calls that open the circuit, and how long it stays open
+LLM_CIRCUIT_FAILURES = int(os.getenv('LLM_CIRCUIT_FAILURES', 5))
+LLM_CIRCUIT_COOLDOWN_SECONDS = float(os.getenv('LLM_CIRCUIT_COOLDOWN_SECONDS', 30))
+
+# Completion size assumed when a request does not set max_tokens
+DEFAULT_COMPLETION_TOKENS = 500
+
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APITimeoutError, openai.APIConnectionError)
+
+
+class LLMUnavailableError(Exception):
+    """The LLM call could not be made or completed in time; callers should use their fallback"""
+
+
+class LLMCircuitOpenError(LLMUnavailableError):
+    """Recent calls kept failing, so requests are refused without contacting the API"""
+
+
+class LLMCapacityError(LLMUnavailableError):
+    """Our own rate or concurrency limit could not be satisfied before the deadline"""
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most one minute of capacity"""
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = max(1.0, rate_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount from the bucket, returning how long the caller must wait before it is covered"""
+        amount = min(amount, self.capacity)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMExecutor:
+    """Runs chat completion calls under shared rate, concurrency and failure limits"""
+
+    def __init__(self):
+        self.requests = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+        self.tokens = TokenBucket(LLM_TOKENS_PER_MINUTE)
+        self.slots = threading.BoundedSemaphore(max(1, LLM_MAX_CONCURRENCY))
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.stats = {'calls': 0, 'succeeded': 0, 'retries': 0, 'failed': 0, 'rejected': 0}
+
+    def execute(self, create: Callable, **kwargs):
+        """
+        Call create(**kwargs) (a chat.completions.create method) with rate limiting,
+        retries and the circuit breaker. Raises LLMUnavailableError when the call is
+        refused or runs out of time; non-retryable API errors propagate unchanged.
+        """
+        deadline = time.monotonic() + LLM_DEADLINE_SECONDS
+        is_trial = self._admit()
+        estimated_tokens = self._estimate_tokens(kwargs)
+        attempt = 0
+        try:
+            while True:
+                self._wait_for_capacity(estimated_tokens, deadline)
+                remaining = deadline - time.monotonic()
+                if not self.slots.acquire(timeout=max(0.0, remaining)):
+                    # Nothing was sent, so give back the capacity reserved for it
+                    self.requests.refund(1)
+                    self.tokens.refund(estimated_tokens)
+                    raise LLMCapacityError("Timed out waiting for a free LLM request slot")
+                try:
+                    response = create(timeout=min(LLM_TIMEOUT_SECONDS, max(1.0, deadline - time.monotonic())), **kwargs)
+                except _RETRYABLE_ERRORS as e:
+                    error = e
+                else:
+                    error = None
+                finally:
+                    self.slots.release()
+
+                if error is None:
+                    self._record(True, is_trial)
+                    return response
+
+                attempt += 1
+                delay = self._backoff(attempt, error)
+                if attempt > LLM_MAX_RETRIES or time.monotonic() + delay >= deadline:
+                    raise LLMUnavailableError(f"LLM request failed after {attempt} attempt(s): {error}") from error
+                logging.warning(f"LLM request failed ({error.__class__.__name__}), retry {attempt}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+                with self.lock:
+                    self.stats['retries'] += 1
+                time.sleep(delay)
+        except LLMCapacityError:
+            # Nothing was sent, so this says nothing about the API's health
+            self._record(None, is_trial)
+            raise
+        except LLMUnavailableError:
+            self._record(False, is_trial)
+            raise
+        except openai.APIStatusError:
+            # The API answered (e.g. 400 bad request): the service is up, so the circuit stays closed
+            self._record(True, is_trial)
+            raise
+        except Exception:
+            self._record(False, is_trial)
+            raise
+
+    def _admit(self) -> bool:
+        """Refuse calls while the circuit is open; after the cooldown let a single trial call through"""
+        with self.lock:
+            self.stats['calls'] += 1
+            if self.consecutive_failures < LLM_CIRCUIT_FAILURES:
+                return False
+            if time.monotonic() >= self.open_until and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.stats['rejected'] += 1
+        raise LLMCircuitOpenError("LLM circuit open after repeated failures; using fallback")
+
+    def _record(self, succeeded: Optional[bool], is_trial: bool):
+        """Update the circuit breaker with a call outcome (None: the call never reached the API)"""
+        with self.lock:
+            if is_trial:
+                self.trial_in_flight = False
+            if succeeded is None:
+                return
+            if succeeded:
+                self.consecutive_failures = 0
+                self.stats['succeeded'] += 1
+                return
+            self.stats['failed'] += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= LLM_CIRCUIT_FAILURES:
+                if self.open_until <= time.monotonic():
+                    logging.error(f"LLM circuit opened for {LLM_CIRCUIT_COOLDOWN_SECONDS:g}s after {self.consecutive_failures} consecutive failures")
+                self.open_until = time.monotonic() + LLM_CIRCUIT_COOLDOWN_SECONDS
+
+    def _wait_for_capacity(self, estimated_tokens: int, deadline: float):
+        request_wait = self.requests.reserve(1)
+        token_wait = self.tokens.reserve(estimated_tokens)
+        wait = max(request_wait, token_wait)
+        if wait <= 0:
+            return
+        if time.monotonic() + wait >= deadline:
+            self.requests.refund(1)
+            self.tokens.refund(estimated_tokens)
+            raise LLMCapacityError(f"LLM rate limit: capacity not available for {wait:.1f}s")
+        time.sleep(wait)
+
+    @staticmethod
+    def _estimate_tokens(kwargs: Dict) -> int:
+        prompt = sum(estimate_tokens(str(m.get('content', ''))) for m in kwargs.get('messages', []))
+        return prompt + (kwargs.get('max_tokens') or DEFAULT_COMPLETION_TOKENS)
+
+    @staticmethod
+    def _backoff(attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, honouring Retry-After on 429s"""
+        delay = random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * (2 ** (attempt - 1))))
+        response = getattr(error, 'response', None)
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        try:
+            return max(delay, min(float(retry_after), LLM_RETRY_MAX_SECONDS)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    def is_available(self) -> bool:
+        """False while the circuit is open (callers can skip straight to their fallback)"""
+        with self.lock:
+            return self.consecutive_failures < LLM_CIRCUIT_FAILURES or time.monotonic() >= self.open_until
+
+    def get_status(self) -> Dict[str, any]:
+        with self.lock:
+            open_for = max(0.0, self.open_until - time.monotonic()) if self.consecutive_failures >= LLM_CIRCUIT_FAILURES else 0.0
+            return dict(self.stats, circuit='open' if open_for else 'closed', circuit_open_seconds=round(open_for, 1),
+                        consecutive_failures=self.consecutive_failures)
+
+    def reset(self):
+        """Close the circuit (e.g. after the API key or backend changes)"""
+        with self.lock:
+            self.consecutive_failures = 0
+            self.open_until = 0.0
+            self.trial_in_flight = False
+
+
+# Global executor shared by every AI service instance (limits apply per account, not per instance)
+llm_executor = LLMExecutor()
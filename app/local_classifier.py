@@ -0,0 +1,277 @@
+"""
+Local ticket classifier for TeBSTrack
+Handles offline category/urgency prediction (TF-IDF + softmax regression) so confident tickets skip the OpenAI round trip
+"""
+
+import json
+import logging
+import math
+import os
+import random
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+from .knowledge_index import tokenize
+
+MODEL_PATH = os.getenv('LOCAL_CLASSIFIER_PATH', os.path.join('instance', 'local_classifier.json'))
+
+# Minimum category probability for a local prediction to be used without the LLM (above 1 disables)
+CONFIDENCE_THRESHOLD = float(os.getenv('LOCAL_CLASSIFIER_THRESHOLD', 0.85))
+
+# Too few labelled tickets give a model that is confidently wrong
+MIN_TRAINING_EXAMPLES = 20
+
+URGENCY_LEVELS = ["Low", "Medium", "High", "Urgent"]
+
+# Sample weights by label provenance: corrected by a person > entered by a person > suggested by the AI
+WEIGHT_CORRECTED = 3.0
+WEIGHT_MANUAL = 2.0
+WEIGHT_AI = 1.0
+
+_LOG_TICKET_ID = re.compile(r"\(ID: (\d+)\)")
+
+
+def extract_features(subject: str, body: str) -> Dict[str, float]:
+    """Sublinear term counts of unigrams and bigrams (the subject counts twice)"""
+    terms = tokenize(f"{subject or ''} {subject or ''} {body or ''}")
+    counts = Counter(terms)
+    counts.update(f"{a}_{b}" for a, b in zip(terms, terms[1:]))
+    return {term: 1.0 + math.log(count) for term, count in counts.items()}
+
+
+class _SoftmaxModel:
+    """Multinomial logistic regression over sparse feature dicts, trained with SGD"""
+
+    def __init__(self, classes: List[str], weights: Optional[Dict[str, List[float]]] = None, bias: Optional[List[float]] = None):
+        self.classes = classes
+        self.weights = weights or {}  # feature -> one weight per class
+        self.bias = bias or [0.0] * len(classes)
+
+    def probabilities(self, vector: Dict[str, float]) -> List[float]:
+        scores = list(self.bias)
+        for feature, value in vector.items():
+            row = self.weights.get(feature)
+            if row:
+                for c, weight in enumerate(row):
+                    scores[c] += weight * value
+        top = max(scores)
+        exps = [math.exp(score - top) for score in scores]
+        total = sum(exps)
+        return [e / total for e in exps]
+
+    def fit(self, vectors: List[Dict[str, float]], labels: List[int], sample_weights: List[float],
+            epochs: int = 30, learning_rate: float = 0.5, l2: float = 1e-4) -> '_SoftmaxModel':
+        order = list(range(len(vectors)))
+        rng = random.Random(0)  # fixed seed: retraining on the same data gives the same model
+        for epoch in range(epochs):
+            rng.shuffle(order)
+            eta = learning_rate / (1 + epoch * 0.2)
+            for i in order:
+                vector = vectors[i]
+                probs = self.probabilities(vector)
+                for c, prob in enumerate(probs):
+                    gradient = (prob - (1.0 if labels[i] == c else 0.0)) * sample_weights[i] * eta
+                    if abs(gradient) < 1e-7:
+                        continue
+                    self.bias[c] -= gradient
+                    for feature, value in vector.items():
+                        row = self.weights.get(feature)
+                        if row is None:
+                            row = self.weights[feature] = [0.0] * len(self.classes)
+                        row[c] -= gradient * value
+            decay = 1 - eta * l2
+            for row in self.weights.values():
+                for c in range(len(row)):
+                    row[c] *= decay
+        return self
+
+    def to_dict(self) -> Dict[str, any]:
+        # Weights that round to zero do not change any prediction
+        weights = {f: [round(w, 5) for w in row] for f, row in self.weights.items() if any(abs(w) >= 1e-5 for w in row)}
+        return {"classes": self.classes, "weights": weights, "bias": self.bias}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, any]) -> '_SoftmaxModel':
+        return cls(data["classes"], data["weights"], data["bias"])
+
+
+class LocalTicketClassifier:
+    """Category and urgency classifier trained on historical tickets"""
+
+    def __init__(self, idf: Dict[str, float], category_model: _SoftmaxModel, urgency_model: _SoftmaxModel, trained_on: int = 0):
+        self.idf = idf
+        self.category_model = category_model
+        self.urgency_model = urgency_model
+        self.trained_on = trained_on
+
+    @classmethod
+    def train(cls, examples: List[Dict[str, any]]) -> 'LocalTicketClassifier':
+        """
+        Train from labelled tickets
+        examples: [{subject: str, body: str, category: str, urgency: str, weight: float}]
+        """
+        raw = [extract_features(e['subject'], e['body']) for e in examples]
+        document_frequency = Counter(feature for vector in raw for feature in vector)
+        total = len(examples)
+        # Features seen in a single ticket are mostly names and ticket-specific noise
+        idf = {f: math.log((1 + total) / (1 + df)) + 1 for f, df in document_frequency.items() if df > 1 or total < 50}
+        vectors = [cls._weigh(vector, idf) for vector in raw]
+        sample_weights = [e.get('weight', 1.0) for e in examples]
+
+        categories = sorted({e['category'] for e in examples})
+        category_model = _SoftmaxModel(categories).fit(
+            vectors, [categories.index(e['category']) for e in examples], sample_weights)
+
+        urgencies = [u for u in URGENCY_LEVELS if any(e['urgency'] == u for e in examples)]
+        urgency_model = _SoftmaxModel(urgencies).fit(
+            vectors, [urgencies.index(e['urgency']) for e in examples], sample_weights)
+
+        return cls(idf, category_model, urgency_model, trained_on=total)
+
+    @staticmethod
+    def _weigh(vector: Dict[str, float], idf: Dict[str, float]) -> Dict[str, float]:
+        """Apply IDF weights and L2-normalize; unknown features are dropped"""
+        weighted = {f: value * idf[f] for f, value in vector.items() if f in idf}
+        norm = math.sqrt(sum(v * v for v in weighted.values()))
+        return {f: v / norm for f, v in weighted.items()} if norm else {}
+
+    def predict(self, subject: str, body: str) -> Dict[str, any]:
+        """
+        Predict category and urgency
+        Returns: {category: str, urgency: str, confidence: float, urgency_confidence: float}
+        """
+        vector = self._weigh(extract_features(subject, body), self.idf)
+        category_probs = self.category_model.probabilities(vector)
+        urgency_probs = self.urgency_model.probabilities(vector)
+        category_index = max(range(len(category_probs)), key=category_probs.__getitem__)
+        urgency_index = max(range(len(urgency_probs)), key=urgency_probs.__getitem__)
+        return {
+            "category": self.category_model.classes[category_index],
+            "urgency": self.urgency_model.classes[urgency_index],
+            # Nothing recognised means no evidence, however peaked the priors are
+            "confidence": category_probs[category_index] if vector else 0.0,
+            "urgency_confidence": urgency_probs[urgency_index] if vector else 0.0,
+        }
+
+    def to_dict(self) -> Dict[str, any]:
+        return {
+            "idf": self.idf,
+            "category_model": self.category_model.to_dict(),
+            "urgency_model": self.urgency_model.to_dict(),
+            "trained_on": self.trained_on,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, any]) -> 'LocalTicketClassifier':
+        return cls(
+            data["idf"],
+            _SoftmaxModel.from_dict(data["category_model"]),
+            _SoftmaxModel.from_dict(data["urgency_model"]),
+            data.get("trained_on", 0),
+        )
+
+    def save(self, path: str = MODEL_PATH) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH) -> Optional['LocalTicketClassifier']:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return cls.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable local classifier model {path}: {e}")
+            return None
+
+
+def load_training_examples() -> List[Dict[str, any]]:
+    """
+    Labelled tickets from the database (requires an app context). Only current
+    categories and standard urgencies are used; labels a person corrected in the
+    ticket editor weigh more than ones the AI assigned.
+    """
+    from .models import Category, Log, Ticket
+
+    categories = {c.name for c in Category.query.all()}
+    corrected = set()
+    ai_labelled = set()
+    logs = Log.query.filter(Log.action.in_(['edit_ticket', 'auto_categorize_email'])).with_entities(Log.action, Log.details).all()
+    for action, details in logs:
+        match = _LOG_TICKET_ID.search(details or '')
+        if not match:
+            continue
+        if action == 'auto_categorize_email':
+            ai_labelled.add(int(match.group(1)))
+        elif 'category changed from' in details or 'urgency changed from' in details:
+            corrected.add(int(match.group(1)))
+
+    examples = []
+    for ticket in Ticket.query.with_entities(Ticket.id, Ticket.subject, Ticket.description, Ticket.category, Ticket.urgency).all():
+        if ticket.category not in categories or ticket.urgency not in URGENCY_LEVELS:
+            continue
+        if ticket.id in corrected:
+            weight = WEIGHT_CORRECTED
+        elif ticket.id in ai_labelled:
+            weight = WEIGHT_AI
+        else:
+            weight = WEIGHT_MANUAL
+        examples.append({
+            'subject': ticket.subject or '',
+            'body': ticket.description or '',
+            'category': ticket.category,
+            'urgency': ticket.urgency,
+            'weight': weight,
+        })
+    return examples
+
+
+_local_classifier = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def get_local_classifier() -> Optional[LocalTicketClassifier]:
+    """The trained model from MODEL_PATH, or None if none has been trained yet"""
+    global _local_classifier, _loaded
+    if not _loaded:
+        with _lock:
+            if not _loaded:
+                _local_classifier = LocalTicketClassifier.load()
+                _loaded = True
+    return _local_classifier
+
+
+def train_local_classifier(examples: Optional[List[Dict[str, any]]] = None, path: str = MODEL_PATH) -> Optional[LocalTicketClassifier]:
+    """Train on the ticket history, save the model and make it the active one"""
+    global _local_classifier, _loaded
+    examples = load_training_examples() if examples is None else examples
+    if len(examples) < MIN_TRAINING_EXAMPLES or len({e['category'] for e in examples}) < 2:
+        logging.warning(f"Not enough labelled tickets to train the local classifier ({len(examples)} found)")
+        return None
+    classifier = LocalTicketClassifier.train(examples)
+    classifier.save(path)
+    with _lock:
+        _local_classifier = classifier
+        _loaded = True
+    logging.info(f"Local classifier trained on {len(examples)} tickets and saved to {path}")
+    return classifier
+
+
+def predict_confident(subject: str, body: str) -> Optional[Dict[str, any]]:
+    """Local prediction if the model is trained and confident enough, else None (escalate to the LLM)"""
+    classifier = get_local_classifier()
+    if classifier is None or CONFIDENCE_THRESHOLD > 1:
+        return None
+    prediction = classifier.predict(subject, body)
+    if prediction['confidence'] < CONFIDENCE_THRESHOLD:
+        return None
+    return prediction
@@ -0,0 +1,257 @@
+"""
+Login throttling for TeBSTrack
+Handles counting failed logins per IP and per username in memory over a sliding window, rejecting locked-out
+attempts without touching the database, and writing the counters to LoginAttempt in periodic batches
+"""
+
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from flask import current_app
+
+from .audit_log import audit_log
+
+# Failed logins from one IP within the window that lock it out
+LOGIN_MAX_FAILURES = int(os.getenv('LOGIN_MAX_FAILURES', 5))
+# Failed logins for one username (from any IP) within the window that lock the username out
+LOGIN_MAX_USER_FAILURES = int(os.getenv('LOGIN_MAX_USER_FAILURES', 20))
+LOGIN_WINDOW_SECONDS = float(os.getenv('LOGIN_WINDOW_SECONDS', 15 * 60))
+LOGIN_LOCKOUT_SECONDS = float(os.getenv('LOGIN_LOCKOUT_SECONDS', 15 * 60))
+# How often counters are written to the database
+LOGIN_FLUSH_SECONDS = float(os.getenv('LOGIN_FLUSH_SECONDS', 5))
+
+# LoginAttempt.ip holds the throttle key: IPs as they are, usernames with this prefix
+USERNAME_KEY_PREFIX = 'user:'
+
+
+def ip_key(ip: Optional[str]) -> str:
+    return (ip or 'unknown')[:64]
+
+
+def username_key(username: str) -> str:
+    return (USERNAME_KEY_PREFIX + username.lower())[:64]
+
+
+class _Window:
+    """Failure times inside the sliding window, and the lockout they triggered"""
+
+    __slots__ = ('failures', 'lockout_until', 'rejected', 'last_attempt')
+
+    def __init__(self):
+        self.failures = deque()  # time.time() of each failure, oldest first
+        self.lockout_until = 0.0
+        self.rejected = 0  # attempts refused during the lockout, not yet written to the audit log
+        self.last_attempt = 0.0
+
+    def prune(self, now: float) -> None:
+        while self.failures and self.failures[0] <= now - LOGIN_WINDOW_SECONDS:
+            self.failures.popleft()
+
+
+class LoginThrottle:
+    """
+    In-memory sliding-window counters keyed by IP and by username. The login route asks check()
+    before doing anything else, so a burst of attempts from a locked-out IP costs no queries. A
+    background thread writes changed counters every LOGIN_FLUSH_SECONDS and reads back lockouts
+    recorded by other processes; audit events go through the queued audit log writer.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.lock = threading.Lock()
+        self.windows = {}  # throttle key -> _Window
+        self.dirty = set()  # keys whose counters changed since the last flush
+        self.thread = None
+        self.stats = {'rejected': 0, 'failures': 0, 'successes': 0, 'lockouts': 0, 'flushes': 0}
+
+    def init_app(self, app):
+        """Bind the Flask app whose context the flush thread runs in"""
+        self.app = app
+
+    def _window(self, key: str) -> _Window:
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = _Window()
+        return window
+
+    def check(self, ip: str, username: Optional[str] = None) -> float:
+        """
+        Seconds until the IP (or username, if given) may try again; 0 if the attempt may go ahead.
+        Refused attempts are counted and reported in the audit log at the next flush.
+        """
+        self._ensure_started()
+        now = time.time()
+        keys = [ip_key(ip)] + ([username_key(username)] if username else [])
+        with self.lock:
+            for key in keys:
+                window = self.windows.get(key)
+                if window is not None and window.lockout_until > now:
+                    window.rejected += 1
+                    window.last_attempt = now
+                    self.dirty.add(key)
+                    self.stats['rejected'] += 1
+                    return window.lockout_until - now
+        return 0.0
+
+    def record_failure(self, ip: str, username: str, details: str) -> Tuple[int, bool]:
+        """
+        Count a failed login against the IP and the username
+        Returns: (attempts the IP has left before lockout, whether this failure caused a lockout)
+        """
+        now = time.time()
+        limits = ((ip_key(ip), LOGIN_MAX_FAILURES), (username_key(username), LOGIN_MAX_USER_FAILURES))
+        locked = False
+        with self.lock:
+            self.stats['failures'] += 1
+            for key, limit in limits:
+                window = self._window(key)
+                window.prune(now)
+                window.failures.append(now)
+                window.last_attempt = now
+                self.dirty.add(key)
+                if len(window.failures) >= limit:
+                    window.lockout_until = now + LOGIN_LOCKOUT_SECONDS
+                    window.failures.clear()
+                    locked = True
+                    self.stats['lockouts'] += 1
+            ip_window = self.windows[limits[0][0]]
+            attempts_left = 0 if ip_window.lockout_until > now else LOGIN_MAX_FAILURES - len(ip_window.failures)
+        if locked:
+            audit_log.record(username, 'login_lockout', f"Account lockout from {ip}")
+        else:
+            audit_log.record(username, 'login_failed', details)
+        return attempts_left, locked
+
+    def record_success(self, ip: str, username: str) -> None:
+        """Clear the IP's and username's failures and record the login_success audit event"""
+        now = time.time()
+        with self.lock:
+            self.stats['successes'] += 1
+            for key in (ip_key(ip), username_key(username)):
+                window = self.windows.get(key)
+                if window is not None and (window.failures or window.lockout_until):
+                    window.failures.clear()
+                    window.lockout_until = 0.0
+                    window.last_attempt = now
+                    self.dirty.add(key)
+        audit_log.record(username, 'login_success', f"Login success from {ip}")
+
+    def get_status(self) -> Dict[str, int]:
+        now = time.time()
+        with self.lock:
+            return dict(self.stats, tracked=len(self.windows),
+                        locked_out=sum(1 for window in self.windows.values() if window.lockout_until > now))
+
+    def _ensure_started(self) -> None:
+        """Load current lockouts and start the flush thread on first use"""
+        if self.thread:
+            return
+        with self.lock:
+            if self.thread:
+                return
+            if self.app is None:
+                self.app = current_app._get_current_object()
+            self.thread = threading.Thread(target=self._flusher, name="login-throttle-flush", daemon=True)
+            self.thread.start()
+            atexit.register(self.flush)
+        # Lockouts recorded before a restart still apply
+        self._sync_from_db()
+
+    def _flusher(self) -> None:
+        while True:
+            time.sleep(LOGIN_FLUSH_SECONDS)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Login throttle flush failed: {e}")
+
+    def flush(self) -> None:
+        """Write changed counters in one transaction, then pick up other processes' lockouts"""
+        with self.lock:
+            counters = {
+                key: (len(self.windows[key].failures), self.windows[key].lockout_until,
+                      self.windows[key].last_attempt, self.windows[key].rejected)
+                for key in self.dirty
+            }
+            for key in self.dirty:
+                self.windows[key].rejected = 0
+            self.dirty = set()
+            self._expire(time.time())
+        if counters:
+            with self.app.app_context():
+                self._write(counters)
+            with self.lock:
+                self.stats['flushes'] += 1
+            for key, (_, _, _, rejected) in counters.items():
+                if rejected:
+                    # One audit entry per flush rather than one per refused attempt
+                    user = key[len(USERNAME_KEY_PREFIX):] if key.startswith(USERNAME_KEY_PREFIX) else key
+                    audit_log.record(user, 'login_lockout', f"Refused {rejected} login attempt(s) for {key} while locked out")
+        self._sync_from_db()
+
+    def _expire(self, now: float) -> None:
+        """Forget keys with nothing left to enforce (caller holds the lock)"""
+        for key in [key for key, window in self.windows.items() if key not in self.dirty]:
+            window = self.windows[key]
+            count = len(window.failures)
+            window.prune(now)
+            if len(window.failures) != count:
+                # Write the lower count next flush, or _sync_from_db would restore the pruned failures
+                self.dirty.add(key)
+            elif not window.failures and window.lockout_until <= now and not window.rejected:
+                del self.windows[key]
+
+    @staticmethod
+    def _write(counters: Dict[str, Tuple[int, float, float, int]]) -> None:
+        from .models import db, LoginAttempt
+        try:
+            rows = {row.ip: row for row in LoginAttempt.query.filter(LoginAttempt.ip.in_(list(counters))).all()}
+            for key, (fail_count, lockout_until, last_attempt, rejected) in counters.items():
+                row = rows.get(key)
+                if row is None:
+                    row = LoginAttempt(ip=key)
+                    db.session.add(row)
+                row.fail_count = fail_count
+                row.lockout_until = lockout_until
+                row.last_attempt = datetime.utcfromtimestamp(last_attempt) if last_attempt else datetime.utcnow()
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _sync_from_db(self) -> None:
+        """Adopt lockouts and recent failures written by other processes (or before a restart)"""
+        from .models import LoginAttempt
+        now = time.time()
+        try:
+            with self.app.app_context():
+                recent = datetime.utcnow() - timedelta(seconds=LOGIN_WINDOW_SECONDS)
+                rows = LoginAttempt.query.with_entities(
+                    LoginAttempt.ip, LoginAttempt.fail_count, LoginAttempt.lockout_until, LoginAttempt.last_attempt
+                ).filter((LoginAttempt.lockout_until > now)
+                         | ((LoginAttempt.fail_count > 0) & (LoginAttempt.last_attempt > recent))).all()
+        except Exception as e:
+            logging.debug(f"Could not read login attempts: {e}")
+            return
+        with self.lock:
+            for key, fail_count, lockout_until, last_attempt in rows:
+                if key in self.dirty:
+                    continue  # our own newer counts win until they are flushed
+                window = self._window(key)
+                window.lockout_until = max(window.lockout_until, lockout_until or 0.0)
+                if fail_count and len(window.failures) < fail_count and last_attempt is not None:
+                    # Only the count and the latest time are stored; treat the missing failures as happening then
+                    stamp = min(now, (last_attempt - datetime(1970, 1, 1)).total_seconds())
+                    restored = [stamp] * (fail_count - len(window.failures))
+                    # Keep the window oldest first, as prune expects
+                    window.failures = deque(sorted(list(window.failures) + restored))
+
+
+# Global login throttle
+login_throttle = LoginThrottle()
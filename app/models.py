@@ -1,11 +1,14 @@
 
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import Column, Integer, String, Float, DateTime
+from collections import namedtuple
 from datetime import datetime
 from flask_login import UserMixin
 import json
 import os
 
+from .settings_cache import settings_cache, MISSING
+
 db = SQLAlchemy()
 
 class LoginAttempt(db.Model):
@@ -18,7 +21,7 @@ class LoginAttempt(db.Model):
 
 class EmailMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'))
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), index=True)
     thread_id = db.Column(db.String(255))
     sender = db.Column(db.String(150))
     subject = db.Column(db.String(255))
@@ -51,6 +54,27 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(150), nullable=False)
     role = db.Column(db.String(20), nullable=False, default='infra')  # 'admin' or 'infra'
 
+    @classmethod
+    def directory(cls):
+        """All users as {id: UserEntry(username, role)}, from the settings cache (one query when cold)"""
+        def load():
+            rows = db.session.query(cls.id, cls.username, cls.role).all()
+            return {user_id: UserEntry(username, role) for user_id, username, role in rows}
+        return settings_cache.get(('directory', 'users'), load)
+
+    @classmethod
+    def usernames(cls):
+        """{id: username} for every user, for showing assignees"""
+        return {user_id: entry.username for user_id, entry in cls.directory().items()}
+
+    @classmethod
+    def invalidate_directory(cls):
+        """Call after committing a user being created, edited or deleted"""
+        settings_cache.invalidate(('directory', 'users'))
+
+
+UserEntry = namedtuple('UserEntry', ['username', 'role'])
+
 class UserSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
@@ -69,6 +93,29 @@ class UserSettings(db.Model):
             db.session.commit()
         return settings
 
+    @classmethod
+    def get_cached(cls, user_id):
+        """Read-only copy of a user's settings from the settings cache (use get_user_settings to change them)"""
+        def load():
+            settings = cls.get_user_settings(user_id)
+            return UserSettingsSnapshot(settings.pagination_enabled, settings.tickets_per_page)
+        return settings_cache.get(('user', user_id), load)
+
+    @classmethod
+    def invalidate_cache(cls, user_id):
+        """Call after committing a change to a user's settings"""
+        settings_cache.invalidate(('user', user_id))
+
+
+UserSettingsSnapshot = namedtuple('UserSettingsSnapshot', ['pagination_enabled', 'tickets_per_page'])
+
+
+class SettingsVersion(db.Model):
+    """Counter bumped on every settings change so each process knows when to drop its settings cache"""
+    __tablename__ = 'settings_version'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
 
 class SystemSettings(db.Model):
     """System-wide settings for TeBSTrack"""
@@ -81,9 +128,12 @@ class SystemSettings(db.Model):
     
     @classmethod
     def get_setting(cls, key, default=None):
-        """Get a system setting value"""
-        setting = cls.query.filter_by(setting_key=key).first()
-        return setting.setting_value if setting else default
+        """Get a system setting value (cached; see settings_cache)"""
+        def load():
+            setting = cls.query.filter_by(setting_key=key).first()
+            return setting.setting_value if setting else MISSING
+        value = settings_cache.get(('system', key), load)
+        return default if value is MISSING else value
     
     @classmethod
     def set_setting(cls, key, value, description=None):
@@ -102,8 +152,16 @@ class SystemSettings(db.Model):
             )
             db.session.add(setting)
         db.session.commit()
+        settings_cache.put(('system', key), value)
         return setting
     
+    @classmethod
+    def delete_setting(cls, key):
+        """Remove a system setting (get_setting returns the default again)"""
+        cls.query.filter_by(setting_key=key).delete()
+        db.session.commit()
+        settings_cache.put(('system', key), MISSING)
+    
     @classmethod
     def get_openai_api_key(cls):
         """Get the OpenAI API key from settings or environment"""
@@ -146,6 +204,15 @@ class TemplateActionStep(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class GeneratedActionSteps(db.Model):
+    """AI-suggested action steps for a template without configured steps, reused for all its tickets"""
+    id = db.Column(db.Integer, primary_key=True)
+    template_id = db.Column(db.Integer, db.ForeignKey('email_template.id'), nullable=False, unique=True)
+    template_hash = db.Column(db.String(64), nullable=False)  # Template name, subject and use case they were generated from
+    steps_json = db.Column(db.Text, nullable=False)  # Steps with {username}-style placeholders
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
 class TicketTemplateRecommendation(db.Model):
     """AI recommendations for email templates on tickets"""
     id = db.Column(db.Integer, primary_key=True)
@@ -156,6 +223,10 @@ class TicketTemplateRecommendation(db.Model):
     is_user_selected = db.Column(db.Boolean, default=False)  # Did user manually select this?
     selected_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # What a stored AI recommendation was computed from; it is reused until either changes
+    ticket_fingerprint = db.Column(db.String(64), nullable=True)  # Subject, description and category
+    catalog_fingerprint = db.Column(db.String(64), nullable=True)  # Active templates and selection guide
+    result_json = db.Column(db.Text, nullable=True)  # Full recommendation as returned to the UI
     
     ticket = db.relationship('Ticket', backref='template_recommendations')
     template = db.relationship('EmailTemplate', backref='recommendations')
@@ -169,6 +240,13 @@ class Log(db.Model):
     action = db.Column(db.String(100), nullable=False)
     details = db.Column(db.Text, nullable=True)
 
+    # The audit log page pages newest-first by (timestamp, id), optionally filtered by user or action
+    __table_args__ = (
+        db.Index('ix_log_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_log_user_timestamp_id', 'user', 'timestamp', 'id'),
+        db.Index('ix_log_action_timestamp_id', 'action', 'timestamp', 'id'),
+    )
+
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(64), unique=True, nullable=False)
@@ -225,3 +303,39 @@ class EmailFetchState(db.Model):
             db.session.add(state)
         db.session.commit()
         return state
+
+
+def add_missing_columns():
+    """
+    Add model columns missing from existing tables (db.create_all only creates new tables).
+    Only nullable columns without server defaults are added, which SQLite can do in place.
+    """
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+            print(f"Added column {table.name}.{column.name}")
+
+
+def add_missing_indexes():
+    """Create model indexes missing from existing tables, and the full-text search indexes"""
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                print(f"Added index {index.name}")
+    from .search_index import ensure_search_indexes
+    ensure_search_indexes()
@@ -0,0 +1,83 @@
+"""
+Prompt layout for TeBSTrack
+Handles assembling chat prompts as a stable prefix (rules, categories, templates, static knowledge) followed by
+per-request content, so provider-side prompt caching can reuse the prefix, and tracks cached prompt tokens
+"""
+
+import threading
+from typing import Dict, List, Optional
+
+
+class PromptLayout:
+    """
+    Chat messages built from static sections, identical on every call of the same
+    kind, and variable sections (ticket, question, retrieved knowledge) that come last.
+    Providers cache prompts by exact prefix, so nothing per-request may precede static content.
+    """
+
+    def __init__(self, system: str):
+        self.system = system.strip()
+        self.static = []
+        self.variable = []
+
+    @staticmethod
+    def _section(heading: Optional[str], content: str) -> str:
+        content = content.strip()
+        return f"{heading}:\n{content}" if heading else content
+
+    def add_static(self, heading: Optional[str], content: str) -> 'PromptLayout':
+        """Content that does not depend on the ticket or question (goes in the system message)"""
+        self.static.append(self._section(heading, content))
+        return self
+
+    def add_variable(self, heading: Optional[str], content: str) -> 'PromptLayout':
+        """Per-request content (goes in the user message, in the order added)"""
+        self.variable.append(self._section(heading, content))
+        return self
+
+    def messages(self) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": "\n\n".join([self.system] + self.static)},
+            {"role": "user", "content": "\n\n".join(self.variable)},
+        ]
+
+
+class PromptCacheStats:
+    """Prompt tokens reported by the API, split into cached (prefix reused) and uncached"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def record(self, usage) -> None:
+        """Add a response's usage block (missing fields count as zero)"""
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached = getattr(details, 'cached_tokens', None) or 0
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += getattr(usage, 'prompt_tokens', None) or 0
+            self.cached_tokens += cached
+            self.completion_tokens += getattr(usage, 'completion_tokens', None) or 0
+
+    def get_status(self) -> Dict[str, any]:
+        with self.lock:
+            return {
+                'calls': self.calls,
+                'prompt_tokens': self.prompt_tokens,
+                'cached_prompt_tokens': self.cached_tokens,
+                'uncached_prompt_tokens': self.prompt_tokens - self.cached_tokens,
+                'completion_tokens': self.completion_tokens,
+                'cached_ratio': round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+            }
+
+
+# Global usage counters for every chat completion the application makes
+prompt_cache_stats = PromptCacheStats()
@@ -1,9 +1,9 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, session, current_app, jsonify, send_from_directory, make_response
+from flask import Blueprint, render_template, redirect, url_for, request, flash, session, current_app, jsonify, send_from_directory, make_response, Response, stream_with_context
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField
 from wtforms.validators import DataRequired, Length
 from flask_login import login_user, login_required, logout_user, current_user
-from app.models import User, Ticket, db, Category, SystemSettings, EmailTemplate, TemplateActionStep, TicketTemplateRecommendation
+from app.models import User, Ticket, db, Category, SystemSettings, EmailTemplate, TemplateActionStep, TicketTemplateRecommendation, GeneratedActionSteps
 from app.models import Log as TicketLog
 from werkzeug.security import generate_password_hash, check_password_hash
 from functools import wraps
@@ -17,6 +17,10 @@ import logging
 from app.extensions import csrf
 import bleach
 from app.ai_service import get_ai_service
+from app.llm_backend import LLM_BACKENDS, get_backend_settings, is_llm_configured
+from app.template_index import template_index
+from app.action_steps import action_plans
+from app.audit_log import audit_log, AUDIT_LOG_PAGE_FLUSH_SECONDS
 import os
 main = Blueprint('main', __name__)
 
@@ -24,7 +28,7 @@ main = Blueprint('main', __name__)
 @login_required
 @csrf.exempt
 def reply_ticket(ticket_id):
-    from .models import Ticket, EmailMessage, Log
+    from .models import Ticket, EmailMessage
     import bleach, datetime, uuid, smtplib, os
     from email.message import EmailMessage as PyEmailMessage
     import logging
@@ -102,9 +106,7 @@ def reply_ticket(ticket_id):
             )
             db.session.add(email_msg)
             db.session.commit()
-            log = Log(user=current_user.username, action='reply_ticket', details=f"Replied to ticket '{ticket.subject}' (ID: {ticket.id}) and sent email to {to_addr}")
-            db.session.add(log)
-            db.session.commit()
+            audit_log.record(user=current_user.username, action='reply_ticket', details=f"Replied to ticket '{ticket.subject}' (ID: {ticket.id}) and sent email to {to_addr}")
             flash('Reply sent as email and saved to thread.', 'success')
         except Exception as e:
             db.session.rollback()
@@ -144,7 +146,9 @@ def settings():
         system_settings = {
             'openai_api_key': custom_key,
             'using_env_key': not bool(custom_key),
-            'env_api_key': env_key
+            'env_api_key': env_key,
+            'llm': get_backend_settings(),
+            'llm_backends': LLM_BACKENDS
         }
     
     return render_template('settings.html', 
@@ -175,6 +179,7 @@ def update_pagination_settings():
     user_settings.tickets_per_page = tickets_per_page
     
     db.session.commit()
+    UserSettings.invalidate_cache(current_user.id)
     
     if pagination_enabled:
         flash(f'Pagination enabled with {tickets_per_page} tickets per page!', 'success')
@@ -182,10 +187,57 @@ def update_pagination_settings():
         flash('Pagination disabled successfully!', 'success')
     return redirect(url_for('main.settings'))
 
+@main.route('/update_llm_backend', methods=['POST'])
+@login_required
+def update_llm_backend():
+    from app.models import SystemSettings
+    from app.ai_service import reset_ai_service
+    
+    # Only admin can update system settings
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('main.settings'))
+    
+    backend = request.form.get('llm_backend', '').strip()
+    base_url = request.form.get('llm_base_url', '').strip()
+    model = request.form.get('llm_model', '').strip()
+    
+    if backend not in LLM_BACKENDS:
+        flash('Unknown LLM backend.', 'error')
+        return redirect(url_for('main.settings'))
+    if backend == 'openai_compatible' and not base_url:
+        flash('Please provide the base URL of the OpenAI-compatible server.', 'error')
+        return redirect(url_for('main.settings'))
+    if base_url and not base_url.startswith(('http://', 'https://')):
+        flash('Base URL must start with http:// or https://', 'error')
+        return redirect(url_for('main.settings'))
+    
+    try:
+        # Security-relevant: committed with the first setting change
+        audit_log.record(
+            user=current_user.username,
+            action='LLM Backend Updated',
+            details=f"Switched AI backend to {LLM_BACKENDS[backend]} (model: {model or 'default'}{', url: ' + base_url if base_url else ''})",
+            sync=True
+        )
+        SystemSettings.set_setting('llm_backend', backend, 'Chat completion backend for AI features')
+        SystemSettings.set_setting('llm_base_url', base_url, 'Base URL for OpenAI-compatible or mock LLM backends')
+        SystemSettings.set_setting('llm_model', model, 'Model name sent to the LLM backend')
+        
+        # Reset AI service to pick up the new backend
+        reset_ai_service()
+        
+        flash(f'AI backend switched to {LLM_BACKENDS[backend]}!', 'success')
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Error updating AI backend: {str(e)}', 'error')
+    
+    return redirect(url_for('main.settings'))
+
 @main.route('/update_openai_api_key', methods=['POST'])
 @login_required 
 def update_openai_api_key():
-    from app.models import SystemSettings, Log
+    from app.models import SystemSettings
     from app.ai_service import reset_ai_service
     
     # Only admin can update system settings
@@ -198,24 +250,20 @@ def update_openai_api_key():
         use_env_key = request.form.get('use_env_key') == 'on'
         
         if use_env_key:
+            # Log the action (security-relevant: committed with the key change)
+            audit_log.record(
+                user=current_user.username,
+                action='OpenAI API Key Updated',
+                details='Switched to using environment variable for OpenAI API key',
+                sync=True
+            )
+            
             # Remove custom API key to fall back to environment variable
-            setting = SystemSettings.query.filter_by(setting_key='openai_api_key').first()
-            if setting:
-                db.session.delete(setting)
-                db.session.commit()
+            SystemSettings.delete_setting('openai_api_key')
             
             # Reset AI service to pick up new settings
             reset_ai_service()
             
-            # Log the action
-            log = Log(
-                user=current_user.username,
-                action='OpenAI API Key Updated',
-                details='Switched to using environment variable for OpenAI API key'
-            )
-            db.session.add(log)
-            db.session.commit()
-            
             flash('Successfully switched to using environment variable for OpenAI API key!', 'success')
         else:
             if not api_key:
@@ -227,6 +275,15 @@ def update_openai_api_key():
                 flash('Invalid API key format. OpenAI API keys typically start with "sk-".', 'error')
                 return redirect(url_for('main.settings'))
             
+            # Log the action (mask the key in logs; committed with the key change)
+            masked_key = api_key[:8] + '*' * (len(api_key) - 12) + api_key[-4:] if len(api_key) > 12 else 'sk-***'
+            audit_log.record(
+                user=current_user.username,
+                action='OpenAI API Key Updated', 
+                details=f'Updated OpenAI API key (ending in ...{api_key[-4:] if len(api_key) >= 4 else "***"})',
+                sync=True
+            )
+            
             # Store custom API key
             SystemSettings.set_setting(
                 'openai_api_key', 
@@ -237,16 +294,6 @@ def update_openai_api_key():
             # Reset AI service to pick up new API key
             reset_ai_service()
             
-            # Log the action (mask the key in logs)
-            masked_key = api_key[:8] + '*' * (len(api_key) - 12) + api_key[-4:] if len(api_key) > 12 else 'sk-***'
-            log = Log(
-                user=current_user.username,
-                action='OpenAI API Key Updated', 
-                details=f'Updated OpenAI API key (ending in ...{api_key[-4:] if len(api_key) >= 4 else "***"})'
-            )
-            db.session.add(log)
-            db.session.commit()
-            
             flash('OpenAI API key updated successfully!', 'success')
         
         return redirect(url_for('main.settings'))
@@ -265,9 +312,7 @@ def add_category():
         if not Category.query.filter_by(name=new_category).first():
             db.session.add(Category(name=new_category))
             db.session.commit()
-            log = TicketLog(user=current_user.username, action='add_category', details=f"Added category '{new_category}'")
-            db.session.add(log)
-            db.session.commit()
+            audit_log.record(user=current_user.username, action='add_category', details=f"Added category '{new_category}'")
     return redirect(url_for('main.settings'))
 
 @main.route('/edit_category/<category>', methods=['POST'])
@@ -285,9 +330,7 @@ def edit_category(category):
             # Update all tickets with the old category to the new one
             Ticket.query.filter_by(category=category).update({'category': new_category})
             db.session.commit()
-            log = TicketLog(user=current_user.username, action='edit_category', details=f"Renamed category '{old_name}' to '{new_category}'")
-            db.session.add(log)
-            db.session.commit()
+            audit_log.record(user=current_user.username, action='edit_category', details=f"Renamed category '{old_name}' to '{new_category}'")
     return redirect(url_for('main.settings'))
 
 @main.route('/delete_category/<category>', methods=['POST'])
@@ -302,9 +345,7 @@ def delete_category(category):
         # Remove category from all tickets
         Ticket.query.filter_by(category=category).update({'category': None})
         db.session.commit()
-        log = TicketLog(user=current_user.username, action='delete_category', details=f"Deleted category '{category}'")
-        db.session.add(log)
-        db.session.commit()
+        audit_log.record(user=current_user.username, action='delete_category', details=f"Deleted category '{category}'")
     return redirect(url_for('main.settings'))
 
 
@@ -339,11 +380,9 @@ def create_user():
         role=role
     )
     db.session.add(new_user)
+    audit_log.record(user=current_user.username, action='create_user', details=f"Created user '{username}' with role '{role}'", sync=True)
     db.session.commit()
-    from .models import Log
-    log = Log(user=current_user.username, action='create_user', details=f"Created user '{username}' with role '{role}'")
-    db.session.add(log)
-    db.session.commit()
+    User.invalidate_directory()
     flash(f"User '{username}' created.", 'success')
     return redirect(url_for('main.manage_users'))
 
@@ -358,11 +397,9 @@ def delete_user(username):
         flash('Cannot delete this user.', 'error')
         return redirect(url_for('main.manage_users'))
     db.session.delete(user)
+    audit_log.record(user=current_user.username, action='delete_user', details=f"Deleted user '{username}'", sync=True)
     db.session.commit()
-    from .models import Log
-    log = Log(user=current_user.username, action='delete_user', details=f"Deleted user '{username}'")
-    db.session.add(log)
-    db.session.commit()
+    User.invalidate_directory()
     flash(f"User '{username}' deleted.", 'success')
     return redirect(url_for('main.manage_users'))
 
@@ -383,11 +420,9 @@ def edit_user(username):
     if password:
         from werkzeug.security import generate_password_hash
         user.password = generate_password_hash(password)
+    audit_log.record(user=current_user.username, action='edit_user', details=f"Edited user '{username}' (role: {role})", sync=True)
     db.session.commit()
-    from .models import Log
-    log = Log(user=current_user.username, action='edit_user', details=f"Edited user '{username}' (role: {role})")
-    db.session.add(log)
-    db.session.commit()
+    User.invalidate_directory()
     flash(f"User '{username}' updated.", 'success')
     return redirect(url_for('main.manage_users'))
 
@@ -397,9 +432,49 @@ def edit_user(username):
 def audit_logs():
     if current_user.role != 'admin':
         return redirect(url_for('main.index'))
-    from .models import Log
-    logs = Log.query.order_by(Log.timestamp.desc()).all()
-    return render_template('audit_logs.html', logs=logs)
+    from .audit_search import (AuditLogFilters, page_of_logs, page_of_archived_logs, iter_logs, known_actions,
+                               action_category, CATEGORY_NAMES)
+    from .audit_archive import archived_months, read_month
+    # A writer stuck retrying a locked database should not hold the page up for long
+    flushed = audit_log.flush(timeout=AUDIT_LOG_PAGE_FLUSH_SECONDS)
+    filters = AuditLogFilters(request.args)
+
+    if request.args.get('format') == 'csv':
+        def generate():
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(['Timestamp', 'User', 'Action', 'Details'])
+            logs = (log for log in read_month(filters.archive) if filters.matches(log)) if filters.archive \
+                else iter_logs(filters)
+            for log in logs:
+                writer.writerow([
+                    log.timestamp.strftime('%Y-%m-%d %H:%M:%S') if log.timestamp else '',
+                    log.user, log.action, (log.details or '').replace('\n', ' ')
+                ])
+                if output.tell() > 65536:
+                    yield output.getvalue()
+                    output.seek(0)
+                    output.truncate()
+            yield output.getvalue()
+        filename = f"audit_logs_{datetime.datetime.now().strftime('%Y-%m-%d_%H-%M')}.csv"
+        return Response(stream_with_context(generate()), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+    page_of = page_of_archived_logs if filters.archive else page_of_logs
+    page = page_of(filters, after=request.args.get('after'), before=request.args.get('before'))
+    return render_template('audit_logs.html',
+        logs=page['logs'],
+        older_cursor=page['older'],
+        newer_cursor=page['newer'],
+        filters=filters,
+        filter_args=filters.as_args(),
+        actions=known_actions(),
+        users=sorted(User.usernames().values()),
+        archived_months=archived_months(),
+        categories=CATEGORY_NAMES,
+        action_category=action_category,
+        flushed=flushed
+    )
 
 # Create Ticket endpoint (must be after Blueprint definition)
 @main.route('/create_ticket', methods=['POST'])
@@ -432,10 +507,7 @@ def create_ticket():
         )
         db.session.add(ticket)
         db.session.commit()
-        from .models import Log
-        log = Log(user=current_user.username, action='create_ticket', details=f"Created ticket '{ticket.subject}' (ID: {ticket.id})")
-        db.session.add(log)
-        db.session.commit()
+        audit_log.record(user=current_user.username, action='create_ticket', details=f"Created ticket '{ticket.subject}' (ID: {ticket.id})")
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -512,10 +584,7 @@ def bulk_ticket_action():
         )
         db.session.add(ticket)
         db.session.commit()
-        from .models import Log
-        log = Log(user=current_user.username, action='create_ticket', details=f"Created ticket '{ticket.subject}' (ID: {ticket.id})")
-        db.session.add(log)
-        db.session.commit()
+        audit_log.record(user=current_user.username, action='create_ticket', details=f"Created ticket '{ticket.subject}' (ID: {ticket.id})")
         return jsonify({'success': True})
     except Exception as e:
         db.session.rollback()
@@ -674,32 +743,15 @@ def index():
 
 @main.route('/login', methods=['GET', 'POST'])
 def login():
-    import datetime
     import logging
-    import time
+    from app.login_throttle import login_throttle
     form = LoginForm()
-    # Brute force protection: server-side using LoginAttempt model
-    from app.models import LoginAttempt
-    max_attempts = 5
-    lockout_minutes = 15
+    # Brute force protection: in-memory sliding window per IP and username (flushed to LoginAttempt)
     ip = request.remote_addr
-    now_ts = time.time()
-    attempt = LoginAttempt.query.filter_by(ip=ip).first()
-    from app.models import Log
-    if attempt and attempt.lockout_until and now_ts < attempt.lockout_until:
+    if login_throttle.check(ip):
         flash('Too many failed login attempts. Try again later.', 'error')
         logging.warning(f"Locked out login attempt from {ip}")
-        # Log to DB
-        log = Log(user=ip, action='login_lockout', details=f"Locked out login attempt from {ip}")
-        db.session.add(log)
-        db.session.commit()
         return render_template('login.html', form=form)
-    # Reset fail count if lockout expired
-    if attempt and attempt.lockout_until and now_ts >= attempt.lockout_until:
-        attempt.fail_count = 0
-        attempt.lockout_until = 0
-        from app import db
-        db.session.commit()
     if form.validate_on_submit():
         username = form.username.data.strip()
         password = form.password.data
@@ -707,48 +759,27 @@ def login():
         if not username or not password or username.isspace() or password.isspace():
             flash('Invalid username or password.', 'error')
             logging.warning(f"Login input validation failed from {ip} (username: '{username}')")
-            log = Log(user=ip, action='login_input_invalid', details=f"Input validation failed (username: '{username}')")
-            db.session.add(log)
-            db.session.commit()
+            audit_log.record(ip, 'login_input_invalid', f"Input validation failed (username: '{username}')")
+            return render_template('login.html', form=form)
+        if login_throttle.check(ip, username):
+            flash('Too many failed login attempts. Try again later.', 'error')
+            logging.warning(f"Locked out login attempt for {username} from {ip}")
             return render_template('login.html', form=form)
         # Optionally: add regex for allowed characters here
         user = User.query.filter_by(username=username).first()
-        from app import db
         if user and check_password_hash(user.password, password):
             login_user(user)
-            # Reset fail count on successful login
-            if attempt:
-                attempt.fail_count = 0
-                attempt.lockout_until = 0
-                db.session.commit()
+            login_throttle.record_success(ip, username)
             logging.info(f"Login success for {username} from {ip}")
-            log = Log(user=username, action='login_success', details=f"Login success from {ip}")
-            db.session.add(log)
-            db.session.commit()
             return redirect(url_for('main.index'))
         else:
-            # Brute force: increment fail count in DB
-            if not attempt:
-                attempt = LoginAttempt(ip=ip, fail_count=1, lockout_until=0)
-                db.session.add(attempt)
-            else:
-                attempt.fail_count += 1
-            attempts_left = max_attempts - attempt.fail_count
-            if attempt.fail_count >= max_attempts:
-                attempt.lockout_until = now_ts + (lockout_minutes * 60)
-                db.session.commit()
+            attempts_left, locked = login_throttle.record_failure(ip, username, f"Login failed from {ip}")
+            if locked:
                 flash('Too many failed login attempts. Try again later.', 'error')
                 logging.warning(f"Account lockout for {username} from {ip}")
-                log = Log(user=username, action='login_lockout', details=f"Account lockout from {ip}")
-                db.session.add(log)
-                db.session.commit()
             else:
-                db.session.commit()
                 flash(f'Login failed. {attempts_left} attempt(s) left before lockout.', 'error')
-                logging.warning(f"Login failed for {username} from {ip} (attempt {attempt.fail_count})")
-                log = Log(user=username, action='login_failed', details=f"Login failed from {ip} (attempt {attempt.fail_count})")
-                db.session.add(log)
-                db.session.commit()
+                logging.warning(f"Login failed for {username} from {ip} ({attempts_left} attempt(s) left)")
             return render_template('login.html', form=form)
     # Always pass form to template
     return render_template('login.html', form=form)
@@ -756,11 +787,8 @@ def login():
 @main.route('/logout')
 @login_required
 def logout():
-    from app.models import Log
     username = current_user.username if hasattr(current_user, 'username') else 'Unknown'
-    log = Log(user=username, action='logout', details=f"User {username} logged out.")
-    db.session.add(log)
-    db.session.commit()
+    audit_log.record(user=username, action='logout', details=f"User {username} logged out.")
     logout_user()
     flash('You have successfully logged out!', 'info')
     return redirect(url_for('main.login'))
@@ -775,13 +803,28 @@ def test_session():
     session['test'] = 'hello'
     return f"Session set to: {session['test']}"
 
+# Full-text search over tickets and their email threads
+@main.route('/search')
+@login_required
+def search():
+    from .ticket_search import search_tickets
+    q = (request.args.get('q') or '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    results = search_tickets(q, current_user, page=page) if q else {'hits': [], 'has_next': False, 'ranked': True}
+    return render_template('search.html',
+        q=q,
+        page=page,
+        hits=results['hits'],
+        has_next=results['has_next'],
+        ranked=results['ranked'])
+
 @main.route('/tickets')
 @login_required
 def tickets():
     from app.models import UserSettings
     
     # Get user pagination settings
-    user_settings = UserSettings.get_user_settings(current_user.id)
+    user_settings = UserSettings.get_cached(current_user.id)
     
     # Filters
     month = request.args.get('month', 'All')
@@ -851,7 +894,7 @@ def tickets():
     all_categories = [c.name for c in Category.query.order_by(Category.name).all()]
     all_statuses = ['Open', 'Closed', 'All']
 
-    user_map = {u.id: u.username for u in User.query.all()}
+    user_map = User.usernames()
     return render_template('tickets.html',
         tickets=tickets,
         month=month,
@@ -931,11 +974,11 @@ def export_tickets():
         if category and category != 'All':
             query = query.filter(Ticket.category == category)
     
-    tickets = query.order_by(Ticket.created_at.desc()).all()
+    # Assignee names come from the same query
+    tickets = query.outerjoin(User, User.id == Ticket.assigned_to).add_columns(User.username) \
+        .order_by(Ticket.created_at.desc()).all()
     print(f"[DEBUG] Found {len(tickets)} tickets for export", flush=True)
     
-    user_map = {u.id: u.username for u in User.query.all()}
-    
     # Prepare data for export
     headers = [
         'S/N', 'Issue Reported Date', 'Category', 'Ticket Name', 'Request by',
@@ -943,7 +986,7 @@ def export_tickets():
     ]
     
     rows = []
-    for ticket in tickets:
+    for ticket, assignee in tickets:
         row = [
             ticket.id,
             ticket.created_at.strftime('%Y-%m-%d') if ticket.created_at else '-',
@@ -952,7 +995,7 @@ def export_tickets():
             ticket.sender if ticket.sender else '-',
             ticket.status,
             ticket.resolution if ticket.status == 'Closed' and ticket.resolution else '-',
-            user_map.get(ticket.assigned_to, '-') if ticket.assigned_to else '-',
+            assignee or '-',
             ticket.urgency or '-',
             ticket.updated_at.strftime('%Y-%m-%d') if ticket.status == 'Closed' and ticket.updated_at else '-'
         ]
@@ -1220,7 +1263,7 @@ def edit_ticket(ticket_id):
             new['sender'] = old['sender']  # Keep original sender
             new['created_at'] = old['created_at']  # Keep original creation date
         
-        user_map = {u.id: u.username for u in User.query.all()}
+        user_map = User.usernames()
         for field in old:
             old_val = old[field]
             new_val = new[field]
@@ -1247,9 +1290,7 @@ def edit_ticket(ticket_id):
             details = f"Edited ticket '{ticket.subject}' (ID: {ticket.id}):\n" + "; ".join(changes)
         else:
             details = f"Edited ticket '{ticket.subject}' (ID: {ticket.id}): No changes."
-        log = Log(user=current_user.username, action='edit_ticket', details=details)
-        db.session.add(log)
-        db.session.commit()
+        audit_log.record(user=current_user.username, action='edit_ticket', details=details)
         return redirect(url_for('main.tickets'))
     # Pre-populate form with ticket data for GET
     if request.method == 'GET':
@@ -1268,7 +1309,7 @@ def ai_categorize_ticket():
     """AI-powered ticket categorization endpoint."""
     try:
         # Check if OpenAI API key is configured first
-        if not os.getenv('OPENAI_API_KEY'):
+        if not is_llm_configured():
             return jsonify({
                 'success': False,
                 'error': 'OpenAI API key not configured. Please set OPENAI_API_KEY in your environment variables.'
@@ -1307,6 +1348,69 @@ def ai_categorize_ticket():
         }), 200
 
 
+@main.route('/api/ai/categorize-batch', methods=['POST'])
+@login_required
+@csrf.exempt
+def ai_categorize_tickets_batch():
+    """AI categorization of several tickets in batched requests (backlog and re-categorization sweeps)."""
+    try:
+        if not is_llm_configured():
+            return jsonify({
+                'success': False,
+                'error': 'OpenAI API key not configured. Please set OPENAI_API_KEY in your environment variables.'
+            }), 200
+        
+        data = request.get_json()
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': 'No data provided'
+            }), 200
+        
+        # Either existing ticket IDs or raw {subject, body, sender} items
+        ticket_ids = data.get('ticket_ids') or []
+        if ticket_ids:
+            found = {t.id: t for t in Ticket.query.filter(Ticket.id.in_(ticket_ids)).all()}
+            ticket_ids = [ticket_id for ticket_id in ticket_ids if ticket_id in found]
+            items = [
+                {'subject': found[ticket_id].subject, 'body': found[ticket_id].description or '', 'sender': found[ticket_id].sender}
+                for ticket_id in ticket_ids
+            ]
+        else:
+            items = [
+                {'subject': t.get('subject', ''), 'body': t.get('body', ''), 'sender': t.get('sender', '')}
+                for t in data.get('tickets', []) if isinstance(t, dict)
+            ]
+        
+        if not items:
+            return jsonify({
+                'success': False,
+                'error': 'ticket_ids or tickets are required'
+            }), 200
+        
+        ai_service = get_ai_service()
+        results = ai_service.categorize_tickets_batch(items)
+        
+        categorizations = []
+        for index, result in enumerate(results):
+            entry = {'categorization': result, 'success': result is not None}
+            if ticket_ids:
+                entry['ticket_id'] = ticket_ids[index]
+            categorizations.append(entry)
+        
+        return jsonify({
+            'success': True,
+            'categorizations': categorizations
+        })
+        
+    except Exception as e:
+        logging.error(f"Error in batch AI categorization: {e}")
+        return jsonify({
+            'success': False,
+            'error': f'Batch categorization failed: {str(e)}'
+        }), 200
+
+
 @main.route('/api/ai/recommend-template', methods=['POST'])
 @login_required
 @csrf.exempt
@@ -1325,11 +1429,17 @@ def ai_recommend_template():
             return jsonify({'error': 'Subject or body is required'}), 400
         
         # Check if OpenAI API key is configured
-        if not os.getenv('OPENAI_API_KEY'):
+        if not is_llm_configured():
             return jsonify({'error': 'OpenAI API key not configured'}), 500
         
-        ai_service = get_ai_service()
-        result = ai_service.recommend_email_template(subject, body, category)
+        ticket = Ticket.query.get(data['ticket_id']) if data.get('ticket_id') else None
+        if ticket:
+            # Served from TicketTemplateRecommendation while the ticket and template catalog are unchanged
+            from app.template_recommendations import template_recommendations
+            result = template_recommendations.get_for_ticket(ticket, subject, category, refresh=bool(data.get('refresh')))
+        else:
+            ai_service = get_ai_service()
+            result = ai_service.recommend_email_template(subject, body, category)
         
         return jsonify({
             'success': True,
@@ -1542,9 +1652,26 @@ def knowledge_base_status():
         # Test knowledge base with a sample question
         test_response = ai_service.test_knowledge_base_integration()
         
+        from .llm_executor import llm_executor
+        from .chatbot_cache import chatbot_cache
+        from .prompt_layout import prompt_cache_stats
+        from .template_recommendations import template_recommendations
+        from .action_steps import action_plans
+        from .settings_cache import settings_cache
+        from .login_throttle import login_throttle
+        from .audit_archive import audit_retention
         return jsonify({
             'success': True,
             'knowledge_base': status,
+            'llm': dict(ai_service.backend.describe(), executor=llm_executor.get_status(),
+                        prompt_cache=prompt_cache_stats.get_status()),
+            'chatbot_cache': chatbot_cache.get_status(),
+            'template_recommendations': template_recommendations.get_status(),
+            'action_plans': action_plans.get_status(),
+            'settings_cache': settings_cache.get_status(),
+            'login_throttle': login_throttle.get_status(),
+            'audit_log': audit_log.get_status(),
+            'audit_retention': audit_retention.get_status(),
             'test_question': "How do I reset a user's VPN access?",
             'test_response': test_response
         })
@@ -1629,27 +1756,21 @@ def update_knowledge_base():
             new_source_path = new_status.get('source_path', 'Unknown')
             
             # Create audit log entry
-            from .models import Log
-            audit_entry = Log(
+            audit_log.record(
                 user=current_user.username,
                 action='Knowledge Base Updated',
                 details=f'Updated knowledge base content. Size: {old_content_length} → {new_content_length} characters. Source: {old_source_path} → {new_source_path}'
             )
-            db.session.add(audit_entry)
-            db.session.commit()
             
             flash('Knowledge base updated successfully! The chatbot will now use the new content.', 'success')
             logging.info(f"Knowledge base updated by {current_user.username}: {old_content_length} → {new_content_length} characters")
         else:
             # Log failed attempt
-            from .models import Log
-            audit_entry = Log(
+            audit_log.record(
                 user=current_user.username,
                 action='Knowledge Base Update Failed',
                 details=f'Failed to update knowledge base content. Content size: {len(knowledge_content)} characters'
             )
-            db.session.add(audit_entry)
-            db.session.commit()
             
             flash('Failed to update knowledge base. Please try again.', 'error')
         
@@ -1658,14 +1779,11 @@ def update_knowledge_base():
         
         # Log error in audit
         try:
-            from .models import Log
-            audit_entry = Log(
+            audit_log.record(
                 user=current_user.username,
                 action='Knowledge Base Update Error',
                 details=f'Error occurred while updating knowledge base: {str(e)}'
             )
-            db.session.add(audit_entry)
-            db.session.commit()
         except:
             pass  # Don't fail if audit logging fails
             
@@ -1708,14 +1826,11 @@ def reset_knowledge_base():
             new_source_type = new_status.get('source_type', 'unknown')
             
             # Create audit log entry
-            from .models import Log
-            audit_entry = Log(
+            audit_log.record(
                 user=current_user.username,
                 action='Knowledge Base Reset',
                 details=f'Reset knowledge base to original document. Previous: {old_source_type} ({old_content_length} chars, {old_source_path}) → Current: {new_source_type} ({new_content_length} chars, {new_source_path})'
             )
-            db.session.add(audit_entry)
-            db.session.commit()
             
             return jsonify({
                 'success': True,
@@ -1723,14 +1838,11 @@ def reset_knowledge_base():
             })
         else:
             # Log failed attempt
-            from .models import Log
-            audit_entry = Log(
+            audit_log.record(
                 user=current_user.username,
                 action='Knowledge Base Reset Failed',
                 details=f'Failed to reset knowledge base. Current state: {old_source_type} ({old_content_length} chars, {old_source_path})'
             )
-            db.session.add(audit_entry)
-            db.session.commit()
             
             return jsonify({
                 'success': False,
@@ -1742,14 +1854,11 @@ def reset_knowledge_base():
         
         # Log error in audit
         try:
-            from .models import Log
-            audit_entry = Log(
+            audit_log.record(
                 user=current_user.username,
                 action='Knowledge Base Reset Error',
                 details=f'Error occurred while resetting knowledge base: {str(e)}'
             )
-            db.session.add(audit_entry)
-            db.session.commit()
         except:
             pass  # Don't fail if audit logging fails
             
@@ -1778,28 +1887,7 @@ def ai_chatbot():
                 'response': 'Message is required'
             }), 200
         
-        # Get ticket context if provided
-        ticket_context = None
-        if ticket_id:
-            ticket = Ticket.query.get(ticket_id)
-            if ticket:
-                # Get assigned user if any
-                assigned_user = None
-                if ticket.assigned_to:
-                    assigned_user = User.query.get(ticket.assigned_to)
-                
-                ticket_context = {
-                    'id': ticket.id,
-                    'subject': ticket.subject,
-                    'body': ticket.description,  # Note: the field is 'description', not 'body'
-                    'sender': ticket.sender,
-                    'category': ticket.category,  # category is already a string
-                    'status': ticket.status,
-                    'urgency': ticket.urgency,
-                    'created_at': ticket.created_at.strftime('%Y-%m-%d %H:%M') if ticket.created_at else 'Unknown',
-                    'assigned_to': assigned_user.username if assigned_user else 'Unassigned',
-                    'recent_activity': []  # Log system doesn't support ticket-specific logs yet
-                }
+        ticket_context = _build_chatbot_ticket_context(ticket_id)
         
         ai_service = get_ai_service()
         
@@ -1825,6 +1913,81 @@ def ai_chatbot():
         }), 200
 
 
+def _build_chatbot_ticket_context(ticket_id):
+    """Ticket details passed to the chatbot, or None if no (valid) ticket is given."""
+    if not ticket_id:
+        return None
+    # Ticket and assignee name in one query
+    row = db.session.query(Ticket, User.username).outerjoin(User, User.id == Ticket.assigned_to) \
+        .filter(Ticket.id == ticket_id).first()
+    if not row:
+        return None
+    ticket, assignee = row
+
+    return {
+        'id': ticket.id,
+        'subject': ticket.subject,
+        'body': ticket.description,  # Note: the field is 'description', not 'body'
+        'sender': ticket.sender,
+        'category': ticket.category,  # category is already a string
+        'status': ticket.status,
+        'urgency': ticket.urgency,
+        'created_at': ticket.created_at.strftime('%Y-%m-%d %H:%M') if ticket.created_at else 'Unknown',
+        'assigned_to': assignee or 'Unassigned',
+        'recent_activity': []  # Log system doesn't support ticket-specific logs yet
+    }
+
+
+def _sse_event(payload, event=None):
+    """Format one Server-Sent Events message with a JSON payload."""
+    import json
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+
+@main.route('/api/ai/chatbot/stream', methods=['POST'])
+@login_required
+@csrf.exempt
+def ai_chatbot_stream():
+    """
+    Streaming chatbot endpoint: the reply is sent as Server-Sent Events while it is generated.
+    Emits 'data: {"delta": ...}' messages, then 'event: done' with the full response
+    (or 'event: error'). /api/ai/chatbot remains for clients that want a single JSON reply.
+    """
+    data = request.get_json(silent=True) or {}
+    message = data.get('message', '')
+    if not message:
+        return jsonify({
+            'success': False,
+            'response': 'Message is required'
+        }), 200
+
+    # Resolve everything that needs the request or database before streaming starts
+    ticket_context = _build_chatbot_ticket_context(data.get('ticket_id'))
+    user_context = {
+        'username': current_user.username,
+        'role': current_user.role,
+        'id': current_user.id
+    }
+    ai_service = get_ai_service()
+
+    def generate():
+        parts = []
+        try:
+            for delta in ai_service.chatbot_response_stream(message, ticket_context, user_context):
+                parts.append(delta)
+                yield _sse_event({'delta': delta})
+            yield _sse_event({'success': True, 'response': ''.join(parts)}, event='done')
+        except Exception as e:
+            logging.error(f"Error in chatbot stream: {e}")
+            yield _sse_event({'success': False, 'response': f'Chatbot request failed: {str(e)}'}, event='error')
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let a reverse proxy hold back the tokens
+    return response
+
+
 @main.route('/api/ai/analyze-sentiment', methods=['POST'])
 @login_required
 @csrf.exempt
@@ -1841,7 +2004,7 @@ def ai_analyze_sentiment():
             return jsonify({'error': 'Text is required'}), 400
         
         # Check if OpenAI API key is configured
-        if not os.getenv('OPENAI_API_KEY'):
+        if not is_llm_configured():
             return jsonify({'error': 'OpenAI API key not configured'}), 500
         
         ai_service = get_ai_service()
@@ -1866,7 +2029,7 @@ def ai_auto_categorize_ticket(ticket_id):
         ticket = Ticket.query.get_or_404(ticket_id)
         
         # Check if OpenAI API key is configured
-        if not os.getenv('OPENAI_API_KEY'):
+        if not is_llm_configured():
             return jsonify({'error': 'OpenAI API key not configured'}), 500
         
         ai_service = get_ai_service()
@@ -1882,13 +2045,11 @@ def ai_auto_categorize_ticket(ticket_id):
                 db.session.commit()
                 
                 # Log the change
-                log = TicketLog(
+                audit_log.record(
                     user=current_user.username,
                     action='ai_categorize',
                     details=f"AI categorized ticket '{ticket.subject}' (ID: {ticket.id}) from '{old_category}' to '{category.name}' with {result['confidence']:.1%} confidence. Urgency set to {result['urgency']}."
                 )
-                db.session.add(log)
-                db.session.commit()
                 
                 return jsonify({
                     'success': True,
@@ -2290,15 +2451,15 @@ def create_email_template():
             
             db.session.add(template)
             db.session.commit()
+            template_index.invalidate()
+            action_plans.invalidate()
             
             # Add audit log
-            log = TicketLog(
+            audit_log.record(
                 user=current_user.username,
                 action='template_create',
                 details=f'Created email template: {template.name}'
             )
-            db.session.add(log)
-            db.session.commit()
             
             flash('Email template created successfully!', 'success')
             return redirect(url_for('main.manage_email_templates'))
@@ -2330,15 +2491,15 @@ def edit_email_template(template_id):
             template.is_active = request.form.get('is_active') == 'on'
             
             db.session.commit()
+            template_index.invalidate()
+            action_plans.invalidate()
             
             # Add audit log
-            log = TicketLog(
+            audit_log.record(
                 user=current_user.username,
                 action='template_update',
                 details=f'Updated email template: {template.name}'
             )
-            db.session.add(log)
-            db.session.commit()
             
             flash('Email template updated successfully!', 'success')
             return redirect(url_for('main.manage_email_templates'))
@@ -2365,6 +2526,7 @@ def delete_email_template(template_id):
         
         # Delete template recommendations
         TicketTemplateRecommendation.query.filter_by(template_id=template_id).delete()
+        GeneratedActionSteps.query.filter_by(template_id=template_id).delete()
         
         # Store template name for logging before deletion
         template_name = template.name
@@ -2372,15 +2534,15 @@ def delete_email_template(template_id):
         # Delete the template
         db.session.delete(template)
         db.session.commit()
+        template_index.invalidate()
+        action_plans.invalidate()
         
         # Add audit log
-        log = TicketLog(
+        audit_log.record(
             user=current_user.username,
             action='template_delete',
             details=f'Deleted email template: {template_name}'
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({'success': True, 'message': 'Template deleted successfully!'})
         
@@ -2432,15 +2594,14 @@ def create_action_step(template_id):
             
             db.session.add(action_step)
             db.session.commit()
+            action_plans.invalidate(template.name)
             
             # Add audit log
-            log = TicketLog(
+            audit_log.record(
                 user=current_user.username,
                 action='action_step_create',
                 details=f'Created action step for template: {template.name}'
             )
-            db.session.add(log)
-            db.session.commit()
             
             flash('Action step created successfully!', 'success')
             return redirect(url_for('main.manage_template_action_steps', template_id=template_id))
@@ -2471,15 +2632,14 @@ def edit_action_step(step_id):
             step.step_config = request.form.get('step_config', '{}') if request.form.get('step_config') else '{}'
             
             db.session.commit()
+            action_plans.invalidate(template.name)
             
             # Add audit log
-            log = TicketLog(
+            audit_log.record(
                 user=current_user.username,
                 action='action_step_edit',
                 details=f'Edited action step: {step.step_title} for template: {template.name}'
             )
-            db.session.add(log)
-            db.session.commit()
             
             flash('Action step updated successfully!', 'success')
             return redirect(url_for('main.manage_template_action_steps', template_id=template.id))
@@ -2530,15 +2690,14 @@ def move_action_step(step_id):
             return jsonify({'success': False, 'message': f'Cannot move step {direction}'}), 400
         
         db.session.commit()
+        action_plans.invalidate(template.name)
         
         # Add audit log
-        log = TicketLog(
+        audit_log.record(
             user=current_user.username,
             action='action_step_move',
             details=f'Moved action step: {step.step_title} {direction} for template: {template.name}'
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({'success': True, 'message': f'Step moved {direction} successfully!'})
         
@@ -2573,15 +2732,14 @@ def delete_action_step(step_id):
             higher_step.step_order -= 1
         
         db.session.commit()
+        action_plans.invalidate(template.name)
         
         # Add audit log
-        log = TicketLog(
+        audit_log.record(
             user=current_user.username,
             action='action_step_delete',
             details=f'Deleted action step: {step_title} from template: {template.name}'
         )
-        db.session.add(log)
-        db.session.commit()
         
         return jsonify({'success': True, 'message': 'Action step deleted successfully!'})
         
@@ -2606,11 +2764,18 @@ def recommend_template():
         if not ai_service:
             return jsonify({'error': 'AI service not available'}), 503
         
-        recommendation = ai_service.recommend_email_template(
-            ticket_subject=data['subject'],
-            ticket_description=data['description'],
-            ticket_category=data.get('category')
-        )
+        ticket = Ticket.query.get(data['ticket_id']) if data.get('ticket_id') else None
+        if ticket:
+            from .template_recommendations import template_recommendations
+            recommendation = template_recommendations.get_for_ticket(
+                ticket, data['subject'], data.get('category'), refresh=bool(data.get('refresh'))
+            )
+        else:
+            recommendation = ai_service.recommend_email_template(
+                ticket_subject=data['subject'],
+                ticket_description=data['description'],
+                ticket_category=data.get('category')
+            )
         
         return jsonify(recommendation)
         
@@ -0,0 +1,123 @@
+"""
+Full-text search indexes for TeBSTrack
+Handles SQLite FTS5 tables that mirror text columns of ordinary tables, kept in sync by triggers, and turning
+what a user types into a safe FTS5 query
+"""
+
+import logging
+import re
+from typing import Dict, List, Optional
+
+_fts5_available = None
+
+
+def fts5_available() -> bool:
+    """Whether the SQLite library in use was built with FTS5"""
+    global _fts5_available
+    if _fts5_available is None:
+        from .models import db
+        try:
+            with db.engine.connect() as connection:
+                connection.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+                connection.exec_driver_sql("DROP TABLE temp.fts5_probe")
+            _fts5_available = True
+        except Exception as e:
+            logging.info(f"SQLite FTS5 is not available, search falls back to LIKE: {e}")
+            _fts5_available = False
+    return _fts5_available
+
+
+def match_query(text: str) -> Optional[str]:
+    """
+    FTS5 query for free text: every word must appear, the last one as a prefix ("vpn acc" finds
+    "VPN account"). Words are quoted, so FTS5 operators typed by the user are taken literally.
+    """
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+class FullTextIndex:
+    """An external-content FTS5 table over some text columns of a table, keyed by its integer id"""
+
+    def __init__(self, name: str, table: str, columns: List[str], key: str = 'id', tokenize: Optional[str] = None):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.key = key
+        self.tokenize = tokenize  # FTS5 tokenizer, e.g. 'porter unicode61' to match word forms
+        self.ready = False
+
+    def _trigger_sql(self) -> Dict[str, str]:
+        columns = ', '.join(self.columns)
+        new_values = ', '.join(f'new.{column}' for column in self.columns)
+        old_values = ', '.join(f'old.{column}' for column in self.columns)
+        insert = f"INSERT INTO {self.name}(rowid, {columns}) VALUES (new.{self.key}, {new_values});"
+        delete = (f"INSERT INTO {self.name}({self.name}, rowid, {columns}) "
+                  f"VALUES ('delete', old.{self.key}, {old_values});")
+        return {
+            f'{self.name}_ai': f"AFTER INSERT ON {self.table} BEGIN {insert} END",
+            f'{self.name}_ad': f"AFTER DELETE ON {self.table} BEGIN {delete} END",
+            f'{self.name}_au': f"AFTER UPDATE OF {columns} ON {self.table} BEGIN {delete} {insert} END",
+        }
+
+    def ensure(self) -> bool:
+        """Create the index and its triggers if missing, filling it from the table; False without FTS5"""
+        from .models import db
+        if not fts5_available():
+            return False
+        with db.engine.begin() as connection:
+            existing = {row[0] for row in connection.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE name = ? OR tbl_name = ?", (self.name, self.table))}
+            if self.name not in existing:
+                tokenize = f", tokenize='{self.tokenize}'" if self.tokenize else ''
+                connection.exec_driver_sql(
+                    f"CREATE VIRTUAL TABLE {self.name} USING fts5({', '.join(self.columns)}, "
+                    f"content='{self.table}', content_rowid='{self.key}'{tokenize})"
+                )
+                connection.exec_driver_sql(f"INSERT INTO {self.name}({self.name}) VALUES ('rebuild')")
+                print(f"Created full-text index {self.name}")
+            for trigger, body in self._trigger_sql().items():
+                if trigger not in existing:
+                    connection.exec_driver_sql(f"CREATE TRIGGER {trigger} {body}")
+        self.ready = True
+        return True
+
+    def exists(self) -> bool:
+        """Whether the index can be queried (remembered once it has been seen)"""
+        from .models import db
+        if self.ready:
+            return True
+        if not fts5_available():
+            return False
+        with db.engine.connect() as connection:
+            self.ready = connection.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (self.name,)).first() is not None
+        return self.ready
+
+    def matching_ids(self, text: str):
+        """Subquery of the ids of rows matching the text (None if the text has no words)"""
+        from .models import db
+        query = match_query(text)
+        if query is None:
+            return None
+        return db.select(db.literal_column('rowid')).select_from(db.table(self.name)) \
+            .where(db.literal_column(self.name).op('MATCH')(query))
+
+
+# Audit log details
+log_search = FullTextIndex('log_fts', 'log', ['details'])
+# Ticket and email thread text, stemmed so "printers" finds "printer"
+ticket_text_search = FullTextIndex('ticket_fts', 'ticket', ['subject', 'description'], tokenize='porter unicode61')
+message_text_search = FullTextIndex('email_message_fts', 'email_message', ['subject', 'body'], tokenize='porter unicode61')
+
+SEARCH_INDEXES = [log_search, ticket_text_search, message_text_search]
+
+
+def ensure_search_indexes() -> None:
+    """Create any missing full-text indexes (called with db.create_all at start-up)"""
+    for index in SEARCH_INDEXES:
+        index.ensure()
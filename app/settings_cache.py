@@ -0,0 +1,134 @@
+"""
+Settings cache for TeBSTrack
+Handles keeping system and per-user settings in memory with a per-entry TTL, updating them on write, and
+noticing writes from other processes through a version counter row in the database
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+# How long a cached setting is trusted without re-reading it
+SETTINGS_CACHE_TTL_SECONDS = float(os.getenv('SETTINGS_CACHE_TTL_SECONDS', 300))
+# How often the shared version counter is read to pick up changes made by other processes
+SETTINGS_VERSION_CHECK_SECONDS = float(os.getenv('SETTINGS_VERSION_CHECK_SECONDS', 5))
+
+# Cached in place of a setting that does not exist, so missing settings are not re-queried either
+MISSING = object()
+
+
+class SettingsCache:
+    """
+    Values keyed by ('system', key) or ('user', user_id). Writers call invalidate (or put)
+    after committing, which bumps the shared version; other processes clear their cache
+    the next time they check it.
+    """
+
+    def __init__(self, ttl: float = SETTINGS_CACHE_TTL_SECONDS, version_check_seconds: float = SETTINGS_VERSION_CHECK_SECONDS):
+        self.ttl = ttl
+        self.version_check_seconds = version_check_seconds
+        self.lock = threading.Lock()
+        self.entries = {}  # key -> (value, expires at)
+        self.version = None
+        self.version_checked_at = float('-inf')
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'remote_changes': 0}
+
+    def get(self, key: Hashable, loader: Callable[[], any], ttl: Optional[float] = None):
+        """Cached value for key, calling loader (and caching its result) when absent or expired"""
+        self._check_version()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                self.stats['hits'] += 1
+                return entry[0]
+            self.stats['misses'] += 1
+        value = loader()
+        self.store(key, value, ttl)
+        return value
+
+    def store(self, key: Hashable, value, ttl: Optional[float] = None) -> None:
+        """Cache a value read or derived from the database in this process only; other processes load their own"""
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def put(self, key: Hashable, value, ttl: Optional[float] = None) -> None:
+        """Write-through after a committed change: cache the new value here and tell other processes"""
+        self._bump_version()
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + (self.ttl if ttl is None else ttl))
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """Forget one key (or everything) here and in other processes after a committed change"""
+        self._bump_version()
+        with self.lock:
+            self.stats['invalidations'] += 1
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        """Forget everything in this process only"""
+        with self.lock:
+            self.entries.clear()
+            self.version = None
+            self.version_checked_at = float('-inf')
+
+    def _check_version(self) -> None:
+        now = time.monotonic()
+        if now - self.version_checked_at < self.version_check_seconds:
+            return
+        self.version_checked_at = now
+        try:
+            version = _read_version()
+        except Exception as e:
+            logging.debug(f"Settings version check failed: {e}")
+            return
+        with self.lock:
+            if self.version is not None and version != self.version:
+                self.entries.clear()
+                self.stats['remote_changes'] += 1
+            self.version = version
+
+    def _bump_version(self) -> None:
+        try:
+            version = _increment_version()
+        except Exception as e:
+            logging.warning(f"Could not publish settings change to other processes: {e}")
+            return
+        with self.lock:
+            if self.version is not None and version != self.version + 1:
+                # Someone else changed settings since we last looked
+                self.entries.clear()
+            self.version = version
+            self.version_checked_at = time.monotonic()
+
+    def get_status(self) -> Dict[str, any]:
+        with self.lock:
+            return dict(self.stats, entries=len(self.entries), version=self.version)
+
+
+def _read_version() -> int:
+    from .models import db, SettingsVersion
+    with db.engine.connect() as connection:
+        version = connection.execute(db.select(SettingsVersion.version).where(SettingsVersion.id == 1)).scalar()
+    return version or 0
+
+
+def _increment_version() -> int:
+    """Atomically add one to the shared version (creating the row on first use) and return it"""
+    from .models import db, SettingsVersion
+    with db.engine.begin() as connection:
+        updated = connection.execute(
+            db.update(SettingsVersion).where(SettingsVersion.id == 1).values(version=SettingsVersion.version + 1)
+        ).rowcount
+        if not updated:
+            connection.execute(db.insert(SettingsVersion).values(id=1, version=1))
+        return connection.execute(db.select(SettingsVersion.version).where(SettingsVersion.id == 1)).scalar()
+
+
+# Global settings cache
+settings_cache = SettingsCache()
@@ -0,0 +1,142 @@
+"""
+Email template matching for TeBSTrack
+Handles a local TF-IDF index over active email templates, used to shortlist candidates before (or instead of)
+asking the LLM to recommend one
+"""
+
+import logging
+import math
+import os
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from .knowledge_index import tokenize
+
+# Candidates the LLM chooses between
+TEMPLATE_SHORTLIST_SIZE = int(os.getenv('TEMPLATE_SHORTLIST_SIZE', 3))
+
+# A local match skips the LLM when its score is at least this and beats the runner-up by the margin
+TEMPLATE_LOCAL_MIN_SCORE = float(os.getenv('TEMPLATE_LOCAL_MIN_SCORE', 0.3))
+TEMPLATE_LOCAL_MARGIN = float(os.getenv('TEMPLATE_LOCAL_MARGIN', 0.15))
+
+# How often each template field's terms are counted (names and use cases say most about when to use a template)
+FIELD_WEIGHTS = (('name', 3), ('use_case_description', 2), ('subject', 2), ('body', 1))
+
+
+def _template_terms(template) -> Counter:
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS:
+        for term in tokenize(getattr(template, field, '') or ''):
+            terms[term] += weight
+    return terms
+
+
+class TemplateIndex:
+    """TF-IDF vectors of the active templates, rebuilt whenever a template is added, edited or removed"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.templates = []  # template summaries, in id order
+        self.vectors = []  # {term: weight}, unit length
+        self.idf = {}
+
+    @staticmethod
+    def catalog_fingerprint() -> Tuple:
+        """Changes whenever an active template is created, edited, (de)activated or deleted"""
+        from .models import EmailTemplate, db
+        count, max_id, id_sum, last_update = db.session.query(
+            db.func.count(EmailTemplate.id), db.func.max(EmailTemplate.id),
+            db.func.sum(EmailTemplate.id), db.func.max(EmailTemplate.updated_at)
+        ).filter(EmailTemplate.is_active == True).one()
+        return count, max_id, id_sum, str(last_update)
+
+    def invalidate(self) -> None:
+        """Force a rebuild on next use (call after changing templates)"""
+        with self.lock:
+            self.fingerprint = None
+
+    def ensure_current(self) -> 'TemplateIndex':
+        """Rebuild from the database if the active templates changed since the last build"""
+        from .models import EmailTemplate
+        fingerprint = self.catalog_fingerprint()
+        with self.lock:
+            if fingerprint != self.fingerprint:
+                self._build(EmailTemplate.query.filter_by(is_active=True).order_by(EmailTemplate.id).all())
+                self.fingerprint = fingerprint
+        return self
+
+    def build(self, templates: List) -> 'TemplateIndex':
+        """Index the given templates (objects with id, name, subject, body, use_case_description) without the database"""
+        with self.lock:
+            self._build(templates)
+            self.fingerprint = 'static'
+        return self
+
+    def _build(self, templates: List) -> None:
+        term_counts = [_template_terms(template) for template in templates]
+        document_frequency = Counter(term for counts in term_counts for term in counts)
+        total = len(templates)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+        self.vectors = [self._vector(counts) for counts in term_counts]
+        self.templates = [{
+            'id': template.id,
+            'name': template.name,
+            'subject': template.subject,
+            'use_case': template.use_case_description or "General use",
+            'body_preview': template.body[:200] + "..." if len(template.body) > 200 else template.body,
+        } for template in templates]
+        logging.info(f"Template index built for {total} active templates ({len(self.idf)} terms)")
+
+    def _vector(self, counts: Counter) -> Dict[str, float]:
+        weights = {term: (1 + math.log(tf)) * self.idf[term] for term, tf in counts.items() if term in self.idf}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {term: w / norm for term, w in weights.items()} if norm else {}
+
+    def rank(self, subject: str, description: str, category: Optional[str] = None) -> List[Dict[str, any]]:
+        """
+        Score every active template against a ticket
+        Returns: [{template summary..., score: float}] best match first (cosine similarity, 0-1)
+        """
+        if self.fingerprint != 'static':
+            self.ensure_current()
+        with self.lock:
+            query_counts = Counter(tokenize(subject or ''))
+            query_counts.update(tokenize(subject or ''))  # subjects name the request; count them twice
+            query_counts.update(tokenize(description or ''))
+            query_counts.update(tokenize(category or ''))
+            query = self._vector(query_counts)
+            scored = [
+                dict(template, score=round(sum(weight * vector.get(term, 0.0) for term, weight in query.items()), 4))
+                for template, vector in zip(self.templates, self.vectors)
+            ]
+        scored.sort(key=lambda t: (-t['score'], t['id']))
+        return scored
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+
+def is_decisive(ranked: List[Dict[str, any]]) -> bool:
+    """Whether the best local match is clear enough to recommend without the LLM"""
+    if not ranked or ranked[0]['score'] < TEMPLATE_LOCAL_MIN_SCORE:
+        return False
+    runner_up = ranked[1]['score'] if len(ranked) > 1 else 0.0
+    return ranked[0]['score'] - runner_up >= TEMPLATE_LOCAL_MARGIN
+
+
+def local_confidence(ranked: List[Dict[str, any]]) -> float:
+    """
+    Confidence shown for a decisive local match. Raw TF-IDF cosines are small (0.3-0.4 for a clear
+    match), so the confidence comes from the best template's lead over the runner-up, relative to its
+    own score: 0.75 plus up to 0.2, reaching 0.95 when nothing else matches at all.
+    """
+    best = ranked[0]['score']
+    runner_up = ranked[1]['score'] if len(ranked) > 1 else 0.0
+    lead = (best - runner_up) / best if best > 0 else 0.0
+    return round(0.75 + 0.2 * lead, 2)
+
+
+# Global template index (rebuilt lazily when templates change)
+template_index = TemplateIndex()
@@ -0,0 +1,189 @@
+"""
+Stored template recommendations for TeBSTrack
+Handles computing a ticket's email template recommendation once, keeping it in TicketTemplateRecommendation
+together with fingerprints of the ticket content and the template catalog, and pre-warming open tickets
+in the background
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from flask import current_app
+
+# Compute recommendations for open tickets in the background so the ticket page finds them ready
+RECOMMENDATION_PREWARM = os.getenv('TEMPLATE_RECOMMENDATION_PREWARM', 'true').lower() == 'true'
+# Most open tickets queued by one pre-warm sweep (newest first)
+RECOMMENDATION_PREWARM_LIMIT = int(os.getenv('TEMPLATE_RECOMMENDATION_PREWARM_LIMIT', 200))
+# Locks shared out by ticket ID; two tickets only wait on each other if they land on the same one
+RECOMMENDATION_LOCK_STRIPES = 64
+
+
+def ticket_fingerprint(subject: str, description: str, category: Optional[str]) -> str:
+    """Hash of the ticket content a recommendation is based on"""
+    content = '\x1f'.join(part.strip() for part in (subject or '', description or '', category or ''))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def catalog_fingerprint() -> str:
+    """Hash of what the recommendation is chosen from: the active templates and the selection guide"""
+    from .models import SystemSettings
+    from .template_index import template_index
+    content = f"{template_index.catalog_fingerprint()}\x1f{SystemSettings.get_setting('email_template_guide', '')}"
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class TemplateRecommendationService:
+    """Recommendations served from the database while the ticket and catalog fingerprints still match"""
+
+    def __init__(self):
+        self.app = None
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.queued = set()  # ticket IDs waiting or being pre-warmed
+        # Concurrent views of a ticket compute it once; a fixed pool keeps memory flat however many tickets are viewed
+        self.ticket_locks = [threading.Lock() for _ in range(RECOMMENDATION_LOCK_STRIPES)]
+        self.stats = {'hits': 0, 'computed': 0, 'prewarmed': 0, 'failed': 0}
+
+    def init_app(self, app):
+        """Bind the Flask app whose context the pre-warm worker runs in"""
+        self.app = app
+
+    def _stored(self, ticket_id: int):
+        from .models import TicketTemplateRecommendation
+        return TicketTemplateRecommendation.query.filter_by(ticket_id=ticket_id, is_user_selected=False) \
+            .order_by(TicketTemplateRecommendation.id.desc()).first()
+
+    def _lock_for(self, ticket_id: int) -> threading.Lock:
+        return self.ticket_locks[ticket_id % RECOMMENDATION_LOCK_STRIPES]
+
+    def get(self, ticket_id: int, subject: str, description: str, category: Optional[str] = None,
+            refresh: bool = False) -> Dict[str, any]:
+        """
+        Recommendation for a ticket with the given content, from the table when still current
+        Returns: recommend_email_template's result plus 'cached' (True when served from the table)
+        """
+        fingerprints = (ticket_fingerprint(subject, description, category), catalog_fingerprint())
+        with self._lock_for(ticket_id):
+            row = self._stored(ticket_id)
+            if not refresh and row is not None and row.result_json \
+                    and (row.ticket_fingerprint, row.catalog_fingerprint) == fingerprints:
+                with self.lock:
+                    self.stats['hits'] += 1
+                return dict(json.loads(row.result_json), cached=True)
+
+            from .ai_service import get_ai_service
+            result = get_ai_service().recommend_email_template(subject, description, category)
+            if result.get('failed'):
+                with self.lock:
+                    self.stats['failed'] += 1
+                return dict(result, cached=False)
+            self._save(ticket_id, row, fingerprints, result)
+            with self.lock:
+                self.stats['computed'] += 1
+            return dict(result, cached=False)
+
+    def get_for_ticket(self, ticket, subject: Optional[str] = None, category: Optional[str] = None,
+                       refresh: bool = False) -> Dict[str, any]:
+        """Recommendation for a stored ticket; subject and category may be overridden by unsaved edits on the page"""
+        return self.get(ticket.id, subject or ticket.subject, ticket.description or '', category or ticket.category,
+                        refresh=refresh)
+
+    def _save(self, ticket_id: int, row, fingerprints, result: Dict[str, any]):
+        from .models import db, EmailTemplate, TicketTemplateRecommendation
+        if row is None:
+            row = TicketTemplateRecommendation(ticket_id=ticket_id)
+            db.session.add(row)
+        template = None
+        if result.get('recommended_template'):
+            template = EmailTemplate.query.filter_by(name=result['recommended_template']).first()
+        row.template_id = template.id if template else None
+        row.confidence_score = result.get('confidence')
+        row.ai_reasoning = result.get('reasoning')
+        row.ticket_fingerprint, row.catalog_fingerprint = fingerprints
+        row.result_json = json.dumps(result)
+        row.created_at = datetime.utcnow()
+        db.session.commit()
+
+    def enqueue(self, ticket_id: int) -> bool:
+        """Queue a ticket for background pre-warming; returns False if disabled or already queued"""
+        if not RECOMMENDATION_PREWARM:
+            return False
+        with self.lock:
+            if ticket_id in self.queued:
+                return False
+            self.queued.add(ticket_id)
+            self._ensure_started()
+        self.queue.put(ticket_id)
+        return True
+
+    def enqueue_open(self, limit: int = RECOMMENDATION_PREWARM_LIMIT) -> int:
+        """Queue open tickets (newest first) whose stored recommendation is missing or stale"""
+        from .categorization_queue import PENDING_CATEGORY
+        from .models import db, Ticket, TicketTemplateRecommendation
+        if not RECOMMENDATION_PREWARM:
+            return 0
+        tickets = Ticket.query.filter(Ticket.status != 'Closed',
+                                      db.or_(Ticket.category.is_(None), Ticket.category != PENDING_CATEGORY)) \
+            .order_by(Ticket.id.desc()).limit(limit).all()
+        if not tickets:
+            return 0
+        # Fingerprints of each ticket's latest stored recommendation, in one query (ascending ids, so the latest wins)
+        stored = {}
+        for ticket_id, has_result, ticket_print, catalog_print in db.session.query(
+                TicketTemplateRecommendation.ticket_id, TicketTemplateRecommendation.result_json.isnot(None),
+                TicketTemplateRecommendation.ticket_fingerprint, TicketTemplateRecommendation.catalog_fingerprint) \
+                .filter(TicketTemplateRecommendation.ticket_id.in_([ticket.id for ticket in tickets]),
+                        TicketTemplateRecommendation.is_user_selected == False) \
+                .order_by(TicketTemplateRecommendation.id):
+            stored[ticket_id] = (ticket_print, catalog_print) if has_result else None
+        catalog = catalog_fingerprint()
+        queued = 0
+        for ticket in tickets:
+            current = stored.get(ticket.id) == (
+                ticket_fingerprint(ticket.subject, ticket.description, ticket.category), catalog)
+            if not current and self.enqueue(ticket.id):
+                queued += 1
+        return queued
+
+    def get_status(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats, pending=len(self.queued))
+
+    def _ensure_started(self):
+        """Start the pre-warm worker on first use (caller holds the lock)"""
+        if self.thread:
+            return
+        if self.app is None:
+            self.app = current_app._get_current_object()
+        self.thread = threading.Thread(target=self._worker, name="template-recommender", daemon=True)
+        self.thread.start()
+
+    def _worker(self):
+        from .models import Ticket
+        while True:
+            ticket_id = self.queue.get()
+            try:
+                with self.app.app_context():
+                    ticket = Ticket.query.get(ticket_id)
+                    if ticket is not None:
+                        result = self.get_for_ticket(ticket)
+                        if not result['cached'] and not result.get('failed'):
+                            with self.lock:
+                                self.stats['prewarmed'] += 1
+            except Exception as e:
+                logging.error(f"Pre-warming template recommendation for ticket {ticket_id} failed: {e}")
+            finally:
+                with self.lock:
+                    self.queued.discard(ticket_id)
+                self.queue.task_done()
+
+
+# Global template recommendation service
+template_recommendations = TemplateRecommendationService()
@@ -0,0 +1,156 @@
+"""
+Text chunking for TeBSTrack
+Splits knowledge documents on structural boundaries into token-sized, optionally overlapping chunks
+"""
+
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+# Default chunk size and overlap, measured with estimate_tokens
+CHUNK_MAX_TOKENS = int(os.getenv('KB_CHUNK_MAX_TOKENS', 250))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('KB_CHUNK_OVERLAP_TOKENS', 25))
+
+# Words count as one token plus one per further 6 characters; punctuation marks count as one each
+_TOKEN_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+# Markdown headings, numbered headings ("2.1 Door access") and short ALL CAPS lines
+_HEADING_PATTERN = re.compile(
+    r"^[ \t]*(?:#{1,6}[ \t]+\S.*|\d+(?:\.\d+)*[.)]?[ \t]+[A-Z].{0,80}|[A-Z][A-Z0-9 &/,()'-]{2,60})[ \t]*$",
+    re.MULTILINE
+)
+
+# Boundaries tried, in order, when a piece is larger than one chunk
+_SPLIT_PATTERNS = [
+    re.compile(r"\n[ \t]*\n\s*"),      # paragraphs
+    re.compile(r"\n\s*"),              # lines
+    re.compile(r"(?<=[.!?;:])\s+"),    # sentences
+    re.compile(r"\s+"),                # words
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Offline estimate of the LLM token count of a piece of text"""
+    return sum(1 + (len(piece) - 1) // 6 for piece in _TOKEN_PIECE_PATTERN.findall(text))
+
+
+def _trim(text: str, start: int, end: int) -> Tuple[int, int]:
+    """Shrink a span so it neither starts nor ends with whitespace"""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+class TextChunker:
+    """
+    Structure-aware chunker. Text is split at headings, then paragraphs, lines,
+    sentences and words only where a piece would not fit in one chunk, and the
+    pieces are packed greedily from the start of the document. Chunks are exact
+    slices of the input, so the same text always yields the same boundaries and
+    an edit only moves the chunks from the edit onwards.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None):
+        self.max_tokens = max(1, max_tokens if max_tokens is not None else CHUNK_MAX_TOKENS)
+        overlap_tokens = overlap_tokens if overlap_tokens is not None else CHUNK_OVERLAP_TOKENS
+        # Overlap must leave room for new content in every chunk
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+
+    def split(self, text: str) -> List[str]:
+        """Split text into chunk strings"""
+        return [chunk['text'] for chunk in self.split_with_offsets(text)]
+
+    def split_with_offsets(self, text: str) -> List[Dict[str, any]]:
+        """
+        Split text into chunks
+        Returns: [{text: str, start: int, end: int, tokens: int}] where text == source[start:end]
+        """
+        if not text or not text.strip():
+            return []
+
+        units = self._units(text)
+        chunks = []
+        current = []  # (start, end, tokens, is_heading)
+        current_tokens = 0
+
+        for unit in units:
+            start, end, tokens, is_heading = unit
+            # Prefer to start a new chunk at a heading once the current one is reasonably full
+            starts_section = is_heading and current_tokens >= self.max_tokens // 2
+            if current and (current_tokens + tokens > self.max_tokens or starts_section):
+                chunks.append(self._make_chunk(text, current, current_tokens))
+                current = self._overlap(current) if not starts_section else []
+                current_tokens = sum(item[2] for item in current)
+                # Drop overlap from the front until the new unit fits
+                while current and current_tokens + tokens > self.max_tokens:
+                    current_tokens -= current.pop(0)[2]
+            current.append(unit)
+            current_tokens += tokens
+
+        if current:
+            chunks.append(self._make_chunk(text, current, current_tokens))
+        return chunks
+
+    def _overlap(self, units: List[Tuple[int, int, int, bool]]) -> List[Tuple[int, int, int, bool]]:
+        """Trailing units of a finished chunk that fit in the overlap budget"""
+        carried = []
+        budget = self.overlap_tokens
+        for unit in reversed(units):
+            if unit[2] > budget:
+                break
+            carried.append(unit)
+            budget -= unit[2]
+        carried.reverse()
+        return carried
+
+    @staticmethod
+    def _make_chunk(text: str, units: List[Tuple[int, int, int, bool]], tokens: int) -> Dict[str, any]:
+        start, end = units[0][0], units[-1][1]
+        return {'text': text[start:end], 'start': start, 'end': end, 'tokens': tokens}
+
+    def _units(self, text: str) -> List[Tuple[int, int, int, bool]]:
+        """Break text into (start, end, tokens, is_heading) units that each fit in one chunk"""
+        section_starts = [0] + [match.start() for match in _HEADING_PATTERN.finditer(text) if match.start() > 0]
+        section_starts.append(len(text))
+
+        units = []
+        for section_start, section_end in zip(section_starts, section_starts[1:]):
+            start, end = _trim(text, section_start, section_end)
+            if start < end:
+                first = len(units)
+                self._split_span(text, start, end, 0, units)
+                units[first] = units[first][:3] + (True,)
+        return units
+
+    def _split_span(self, text: str, start: int, end: int, level: int, units: List) -> None:
+        """Append the span as one unit if it fits, otherwise split it at the next boundary level"""
+        tokens = estimate_tokens(text[start:end])
+        if tokens <= self.max_tokens:
+            units.append((start, end, tokens, False))
+            return
+
+        if level >= len(_SPLIT_PATTERNS):
+            # A single enormous "word" (e.g. an encoded blob): cut by estimated characters
+            step = max(1, (end - start) * self.max_tokens // tokens)
+            for piece_start in range(start, end, step):
+                piece_end = min(piece_start + step, end)
+                units.append((piece_start, piece_end, estimate_tokens(text[piece_start:piece_end]), False))
+            return
+
+        piece_start = start
+        for match in _SPLIT_PATTERNS[level].finditer(text, start, end):
+            self._split_piece(text, piece_start, match.start(), level, units)
+            piece_start = match.end()
+        self._split_piece(text, piece_start, end, level, units)
+
+    def _split_piece(self, text: str, start: int, end: int, level: int, units: List) -> None:
+        start, end = _trim(text, start, end)
+        if start < end:
+            self._split_span(text, start, end, level + 1, units)
+
+
+def chunk_text(text: str, max_tokens: Optional[int] = None, overlap_tokens: Optional[int] = None) -> List[str]:
+    """Split text into token-sized chunks with the default chunker settings"""
+    return TextChunker(max_tokens, overlap_tokens).split(text)
@@ -0,0 +1,139 @@
+"""
+Ticket search for TeBSTrack
+Handles finding tickets by the text of their subject, description and email thread through the FTS5 indexes,
+ranked with bm25 and shown with highlighted snippets, limited to the tickets the user may see; falls back to
+LIKE when FTS5 is not available
+"""
+
+import os
+import re
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+from markupsafe import Markup, escape
+
+# Tickets per page of search results
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+
+# bm25 column weights: a hit in a subject counts for more than one in a description or body
+SUBJECT_WEIGHT = 5.0
+TEXT_WEIGHT = 1.0
+# Words around a hit shown in a snippet
+SNIPPET_WORDS = 16
+
+# Markers FTS5 puts around hits; they cannot occur in the text, so they survive escaping and become <mark>
+_HIT_START, _HIT_END = '\x02', '\x03'
+
+# One search result: the ticket, a snippet of its own text and of its best matching email (either may be None)
+SearchHit = namedtuple('SearchHit', ['ticket', 'snippet', 'message_snippet', 'message_id'])
+
+
+def _highlight(snippet: Optional[str]) -> Optional[Markup]:
+    if not snippet:
+        return None
+    html = str(escape(snippet.replace('\n', ' ')))
+    return Markup(html.replace(_HIT_START, '<mark>').replace(_HIT_END, '</mark>'))
+
+
+def _visible(query, user):
+    """Infra users only see unassigned tickets and their own, as on the tickets page"""
+    from .models import db, Ticket
+    if user.role == 'infra':
+        query = query.filter(db.or_(Ticket.assigned_to == None, Ticket.assigned_to == user.id))
+    return query
+
+
+def _ranked_ticket_ids(query_text: str):
+    """Subquery of (ticket_id, score) for every ticket or email matching, best (lowest) score first per row"""
+    from .models import db
+    hits = db.text(f"""
+        SELECT rowid AS ticket_id, bm25(ticket_fts, {SUBJECT_WEIGHT}, {TEXT_WEIGHT}) AS score
+        FROM ticket_fts WHERE ticket_fts MATCH :q
+        UNION ALL
+        SELECT email_message.ticket_id, bm25(email_message_fts, {SUBJECT_WEIGHT}, {TEXT_WEIGHT})
+        FROM email_message_fts JOIN email_message ON email_message.id = email_message_fts.rowid
+        WHERE email_message_fts MATCH :q AND email_message.ticket_id IS NOT NULL
+    """).bindparams(q=query_text)
+    return hits.columns(ticket_id=db.Integer, score=db.Float).subquery('hits')
+
+
+def _snippets(query_text: str, ticket_ids: List[int]) -> Dict[int, Dict[str, any]]:
+    """Highlighted snippets for a page of tickets: their own text and their best matching email"""
+    from .models import db
+    if not ticket_ids:
+        return {}
+    snippets = {ticket_id: {} for ticket_id in ticket_ids}
+    ids = db.bindparam('ids', ticket_ids, expanding=True)
+    snippet_args = f"'{_HIT_START}', '{_HIT_END}', '…', {SNIPPET_WORDS}"
+    rows = db.session.execute(db.text(f"""
+        SELECT rowid, snippet(ticket_fts, -1, {snippet_args})
+        FROM ticket_fts WHERE ticket_fts MATCH :q AND rowid IN :ids
+    """).bindparams(ids, q=query_text))
+    for ticket_id, snippet in rows:
+        snippets[ticket_id]['snippet'] = _highlight(snippet)
+    rows = db.session.execute(db.text(f"""
+        SELECT email_message.ticket_id, email_message.id, snippet(email_message_fts, -1, {snippet_args})
+        FROM email_message_fts JOIN email_message ON email_message.id = email_message_fts.rowid
+        WHERE email_message_fts MATCH :q AND email_message.ticket_id IN :ids
+        ORDER BY bm25(email_message_fts, {SUBJECT_WEIGHT}, {TEXT_WEIGHT})
+    """).bindparams(ids, q=query_text))
+    for ticket_id, message_id, snippet in rows:
+        # Rows come best first, so the first email seen for a ticket is the one shown
+        snippets[ticket_id].setdefault('message_id', message_id)
+        snippets[ticket_id].setdefault('message_snippet', _highlight(snippet))
+    return snippets
+
+
+def _contains_all(words: List[str], *columns):
+    """Every word appears somewhere in these columns of one row"""
+    from .models import db
+    text = db.func.coalesce(columns[0], '')
+    for column in columns[1:]:
+        text = text + ' ' + db.func.coalesce(column, '')
+    return db.and_(*[text.ilike(f"%{word}%") for word in words])
+
+
+def _like_search(text: str, user, limit: int, offset: int):
+    """
+    Tickets whose own text, or one of whose emails, contains every word, newest first (without FTS5).
+    Like the FTS5 query, all the words must be in the same row, the ticket or a single email; unlike it,
+    words are not stemmed, so "teams" does not find "team".
+    """
+    from .models import db, Ticket, EmailMessage
+    words = re.findall(r'\w+', text)
+    in_messages = db.select(EmailMessage.ticket_id).where(_contains_all(words, EmailMessage.subject, EmailMessage.body))
+    query = _visible(Ticket.query, user).filter(db.or_(
+        _contains_all(words, Ticket.subject, Ticket.description), Ticket.id.in_(in_messages)))
+    return query.order_by(Ticket.created_at.desc(), Ticket.id.desc()).offset(offset).limit(limit + 1).all()
+
+
+def search_tickets(text: str, user, page: int = 1, page_size: int = SEARCH_PAGE_SIZE) -> Dict[str, any]:
+    """
+    One page of tickets matching the text in their subject, description or emails, best match first
+    Returns: {'hits' (list of SearchHit), 'has_next', 'ranked' (False for the LIKE fallback)}
+    """
+    from .models import db, Ticket
+    from .search_index import match_query, ticket_text_search, message_text_search
+    query_text = match_query(text)
+    if query_text is None:
+        return {'hits': [], 'has_next': False, 'ranked': True}
+    offset = (max(page, 1) - 1) * page_size
+
+    if not (ticket_text_search.exists() and message_text_search.exists()):
+        tickets = _like_search(text, user, page_size, offset)
+        hits = [SearchHit(ticket, None, None, None) for ticket in tickets[:page_size]]
+        return {'hits': hits, 'has_next': len(tickets) > page_size, 'ranked': False}
+
+    hits = _ranked_ticket_ids(query_text)
+    score = db.func.min(hits.c.score)
+    # A ticket ranks by its best hit, whether in its own text or in one of its emails
+    rows = _visible(db.session.query(Ticket).join(hits, hits.c.ticket_id == Ticket.id), user) \
+        .group_by(Ticket.id).order_by(score, Ticket.id.desc()).offset(offset).limit(page_size + 1).all()
+    tickets = rows[:page_size]
+    snippets = _snippets(query_text, [ticket.id for ticket in tickets])
+    results = [
+        SearchHit(ticket, snippets[ticket.id].get('snippet'), snippets[ticket.id].get('message_snippet'),
+                  snippets[ticket.id].get('message_id'))
+        for ticket in tickets
+    ]
+    return {'hits': results, 'has_next': len(rows) > page_size, 'ranked': True}
@@ -0,0 +1,165 @@
+"""
+Prompt token budgets for TeBSTrack
+Handles capping each prompt section (email body, question, knowledge context) at an estimated token allowance,
+truncating long emails to their head, their tail and the lines that mention errors
+"""
+
+import logging
+import os
+import re
+from typing import Dict, List, Tuple
+
+from .text_chunker import estimate_tokens
+
+# Per-section allowances in estimated tokens; email bodies and questions are the only unbounded inputs
+BODY_MAX_TOKENS = int(os.getenv('AI_BODY_MAX_TOKENS', 1500))
+BATCH_BODY_MAX_TOKENS = int(os.getenv('AI_BATCH_BODY_MAX_TOKENS', 500))
+QUESTION_MAX_TOKENS = int(os.getenv('AI_QUESTION_MAX_TOKENS', 500))
+KNOWLEDGE_MAX_TOKENS = int(os.getenv('AI_KNOWLEDGE_MAX_TOKENS', 6000))
+SUBJECT_MAX_TOKENS = 100
+
+# Share of a truncated section kept from the start and the end; the rest goes to error lines from the middle
+HEAD_SHARE = 0.5
+TAIL_SHARE = 0.2
+
+# Lines worth keeping from the middle of a long email (pasted logs, stack traces, bounce messages)
+ERROR_LINE_PATTERN = re.compile(
+    r"error|exception|fail|fatal|denied|refused|time[d ]?out|unable|cannot|can't|traceback|critical|"
+    r"not working|unreachable|\b(?:http|status|code)\s*[45]\d\d\b|0x[0-9a-f]{4,}",
+    re.IGNORECASE
+)
+
+OMITTED_MARKER = "[... {count} lines omitted ...]"
+MARKER_TOKENS = estimate_tokens(OMITTED_MARKER.format(count=99999))
+
+
+def _split_units(text: str, max_unit_tokens: int) -> List[Tuple[str, int]]:
+    """Lines with their token estimates; lines longer than max_unit_tokens are cut at word boundaries"""
+    units = []
+    for line in text.splitlines():
+        tokens = estimate_tokens(line)
+        if tokens <= max_unit_tokens:
+            units.append((line, tokens))
+            continue
+        # A single enormous "word" (base64, minified data) is cut by length (about 6 characters a token)
+        step = max_unit_tokens * 6
+        words = []
+        for word in line.split(' '):
+            words.extend(word[i:i + step] for i in range(0, len(word), step))
+        piece, piece_tokens = [], 0
+        for word in words:
+            word_tokens = estimate_tokens(word)
+            if piece and piece_tokens + word_tokens > max_unit_tokens:
+                units.append((' '.join(piece), piece_tokens))
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += word_tokens
+        if piece:
+            units.append((' '.join(piece), piece_tokens))
+    return units
+
+
+def truncate_text(text: str, max_tokens: int, head_only: bool = False) -> str:
+    """
+    Shorten text to about max_tokens estimated tokens. Keeps the beginning, the end and
+    (unless head_only) lines from the middle that look like errors, marking each gap.
+    Text within the allowance is returned unchanged.
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= MARKER_TOKENS:
+        return ''
+
+    units = _split_units(text, max(20, max_tokens // 4))
+    keep = [False] * len(units)
+    available = max_tokens - MARKER_TOKENS  # the gap after the head always needs a marker
+
+    def take(index, budget):
+        if keep[index] or units[index][1] > budget:
+            return 0
+        keep[index] = True
+        return units[index][1]
+
+    # Head
+    head_budget = available if head_only else int(available * HEAD_SHARE)
+    used = 0
+    head_end = 0
+    while head_end < len(units) and used + units[head_end][1] <= head_budget:
+        used += take(head_end, head_budget - used)
+        head_end += 1
+
+    if not head_only:
+        # Tail
+        tail_budget = int(available * TAIL_SHARE)
+        tail_used = 0
+        tail_start = len(units)
+        while tail_start - 1 >= head_end and tail_used + units[tail_start - 1][1] <= tail_budget:
+            tail_start -= 1
+            tail_used += take(tail_start, tail_budget - tail_used)
+        used += tail_used
+
+        # Error lines from the middle, each possibly opening another gap
+        for index in range(head_end, tail_start):
+            cost = units[index][1] + MARKER_TOKENS
+            if used + cost <= available and ERROR_LINE_PATTERN.search(units[index][0]):
+                keep[index] = True
+                used += cost
+
+        # Give whatever is left back to the head
+        while head_end < tail_start and not keep[head_end] and used + units[head_end][1] <= available:
+            used += take(head_end, available - used)
+            head_end += 1
+
+    output = []
+    omitted = 0
+    for (line, _), kept in zip(units, keep):
+        if kept:
+            if omitted:
+                output.append(OMITTED_MARKER.format(count=omitted))
+                omitted = 0
+            output.append(line)
+        else:
+            omitted += 1
+    if omitted:
+        output.append(OMITTED_MARKER.format(count=omitted))
+    return '\n'.join(output)
+
+
+class TokenBudget:
+    """Section allowances for one prompt, recording what each section used before and after truncation"""
+
+    def __init__(self, name: str, **allowances: int):
+        self.name = name
+        self.allowances = allowances
+        self.sections = {}  # section -> [original tokens, fitted tokens, tokens allowed]
+
+    def fit(self, section: str, text: str, head_only: bool = False) -> str:
+        """Truncate text to the section's allowance (sections may be fitted several times, e.g. one body per ticket)"""
+        limit = self.allowances[section]
+        text = text or ''
+        original = estimate_tokens(text)
+        fitted = text if original <= limit else truncate_text(text, limit, head_only)
+        usage = self.sections.setdefault(section, [0, 0, 0])
+        usage[0] += original
+        usage[1] += original if fitted is text else estimate_tokens(fitted)
+        usage[2] += limit
+        return fitted
+
+    @property
+    def used(self) -> int:
+        return sum(fitted for _, fitted, _ in self.sections.values())
+
+    def summary(self) -> Dict[str, any]:
+        return {
+            'prompt': self.name,
+            'tokens': self.used,
+            'allowed': sum(allowed for _, _, allowed in self.sections.values()),
+            'truncated': {section: {'from': original, 'to': fitted}
+                          for section, (original, fitted, _) in self.sections.items() if fitted < original},
+        }
+
+    def log(self) -> None:
+        summary = self.summary()
+        truncated = ', '.join(f"{section} {change['from']:,}->{change['to']:,}" for section, change in summary['truncated'].items())
+        logging.info(f"Prompt budget [{self.name}]: {summary['tokens']:,}/{summary['allowed']:,} estimated tokens in budgeted sections"
+                     + (f", truncated {truncated}" if truncated else ""))
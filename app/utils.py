@@ -1,8 +1,13 @@
 # Utility functions for TeBSTrack (email parsing, LLM classification, etc.)
 
 def classify_ticket(text):
-    # Placeholder for LLM-based or rule-based classification
+    # Offline classification with the local model (see app/local_classifier.py)
     # Return category and urgency
-    return "Other Request", "Normal"
+    from .local_classifier import get_local_classifier
+    classifier = get_local_classifier()
+    if classifier is None:
+        return "Other request", "Medium"
+    prediction = classifier.predict(text, "")
+    return prediction['category'], prediction['urgency']
 
 # Add more helpers as needed (e.g., email thread extraction, audit logging)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+Archive old audit log entries for TeBSTrack
+
+Moves Log entries older than the retention period into gzipped monthly files under
+instance/audit_archive (or AUDIT_ARCHIVE_DIR) and frees the space they used.
+
+Usage:
+    python archive_audit_logs.py [--days 180] [--chunk-size 1000] [--enable-incremental-vacuum]
+"""
+
+import argparse
+import sys
+import os
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import create_app
+from app.audit_archive import (audit_retention, enable_incremental_vacuum, archived_months,
+                               AUDIT_RETENTION_DAYS, AUDIT_ARCHIVE_CHUNK_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--days', type=int, default=AUDIT_RETENTION_DAYS, help='archive entries older than this many days (0 keeps everything)')
+    parser.add_argument('--chunk-size', type=int, default=AUDIT_ARCHIVE_CHUNK_SIZE, help='entries moved per transaction')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='switch the database to auto_vacuum=INCREMENTAL first (one full VACUUM; stop the app while it runs)')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.enable_incremental_vacuum:
+            if enable_incremental_vacuum():
+                print("✅ Database switched to incremental vacuum")
+            else:
+                print("Database already uses incremental vacuum")
+        if args.days <= 0:
+            # Same meaning as AUDIT_RETENTION_DAYS=0
+            print("Retention is off (--days 0 keeps everything); nothing archived")
+            return
+        result = audit_retention.run(retention_days=args.days, chunk_size=args.chunk_size)
+        print(f"✅ Archived {result['archived']} audit log entries older than {args.days} days "
+              f"(freed {result['vacuumed_pages']} pages)")
+        months = archived_months()
+        if months:
+            print(f"Archived months: {', '.join(months)}")
+
+
+if __name__ == '__main__':
+    main()
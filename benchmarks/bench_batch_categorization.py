@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark: batched vs. one-request-per-ticket categorization
+
+Compares the prompt tokens and request count needed to categorize the sample
+tickets one at a time against categorize_tickets_batch. Pass --live to also
+send the real requests (uses OPENAI_API_KEY and costs tokens).
+
+Usage:
+    python benchmarks/bench_batch_categorization.py [--dir app/knowledge] [--batch-size 10] [--live]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ai_service import TeBSTrackAI
+from app.knowledge_library import KnowledgeLibrary
+from app.text_chunker import estimate_tokens
+from bench_knowledge_retrieval import CATEGORIES, SAMPLE_TICKETS, URGENCY_LEVELS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default='app/knowledge', help='knowledge directory to index')
+    parser.add_argument('--batch-size', type=int, default=10, help='tickets per batched request')
+    parser.add_argument('--live', action='store_true', help='also send the requests to OpenAI')
+    args = parser.parse_args()
+
+    # Skip __init__ so the benchmark needs neither a database nor an API key
+    ai = TeBSTrackAI.__new__(TeBSTrackAI)
+    ai.model = "gpt-4o-mini"
+    ai.knowledge_base = ""
+    ai.knowledge_library = KnowledgeLibrary(args.dir)
+    ai._rebuild_knowledge_index()
+    ai.get_available_categories = lambda: CATEGORIES
+
+    tickets = [{'subject': subject, 'body': body, 'sender': 'user@example.com'} for subject, body in SAMPLE_TICKETS]
+
+    def message_tokens(messages):
+        return sum(estimate_tokens(m['content']) for m in messages)
+
+    single_tokens = sum(
+        message_tokens(ai._build_categorization_messages(t['subject'], t['body'], t['sender'], CATEGORIES, URGENCY_LEVELS))
+        for t in tickets
+    )
+    batches = [tickets[i:i + args.batch_size] for i in range(0, len(tickets), args.batch_size)]
+    batch_tokens = sum(
+        message_tokens(ai._build_batch_categorization_messages(batch, CATEGORIES, URGENCY_LEVELS))
+        for batch in batches
+    )
+
+    print(f"{len(tickets)} tickets, batch size {args.batch_size}\n")
+    print(f"[one request per ticket]  requests={len(tickets)}  est. prompt tokens={single_tokens:,}")
+    print(f"[batched]                 requests={len(batches)}  est. prompt tokens={batch_tokens:,}")
+    print(f"\nPrompt token reduction: {(1 - batch_tokens / single_tokens) * 100:.1f}%  "
+          f"round trips: {len(tickets)} -> {len(batches)}")
+
+    if args.live:
+        from app.llm_backend import ChatBackend
+        ai.backend = ChatBackend('openai', ai.model, api_key=os.getenv('OPENAI_API_KEY'))
+        ai.client = ai.backend.client
+        start = time.perf_counter()
+        single = [ai.request_categorization(t['subject'], t['body'], t['sender']) for t in tickets]
+        single_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        batched = ai.categorize_tickets_batch(tickets, args.batch_size)
+        batch_seconds = time.perf_counter() - start
+        agreement = sum(1 for a, b in zip(single, batched) if b and a.get('category') == b.get('category'))
+        print(f"\nLive: per-ticket {single_seconds:.1f}s, batched {batch_seconds:.1f}s, "
+              f"category agreement {agreement}/{len(tickets)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark: chatbot intent matching speed and accuracy
+
+Compares the compiled intent matcher (app/intent_matcher.py) with the previous
+keyword-list scans on a labelled set of chat messages (one JSON object per line
+with message, needs_ticket_details, is_casual and fields). Reports the time per
+message and, for each implementation, how often it agrees with the labels and
+which questions it answers from ticket fields without calling the AI. A
+question answered locally that should have gone to the AI counts as a wrong
+direct answer.
+
+Usage:
+    python benchmarks/bench_intent_matcher.py [--messages benchmarks/data/chat_intents.jsonl] [--repeat 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.intent_matcher import analyze_intent
+
+DEFAULT_MESSAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'chat_intents.jsonl')
+
+
+def legacy_analyze(user_message):
+    """The keyword-list scans and direct-answer checks the matcher replaced"""
+    message_lower = user_message.lower().strip()
+    casual_phrases = [
+        'hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening',
+        'thanks', 'thank you', 'bye', 'goodbye', 'how are you', 'how are you?',
+        'how\'s it going', 'how is it going', 'what\'s up', 'whats up',
+        'nice to meet you', 'pleased to meet you', 'good to see you'
+    ]
+    explicit_ticket_keywords = [
+        'about this ticket', 'current ticket', 'this ticket', 'ticket details',
+        'tell me about', 'explain this', 'describe this', 'summary of this',
+        'what is this ticket', 'ticket summary', 'ticket information'
+    ]
+    definite_ticket_keywords = [
+        'status', 'category', 'urgency', 'assigned', 'created', 'sender',
+        'next steps', 'what should', 'how to resolve', 'solution', 'fix', 'resolve',
+        'when was this', 'when did this', 'what date', 'creation date', 'reported',
+        'issue occur', 'this happen', 'this reported',
+        'who requested', 'who sent', 'who created', 'who is the sender', 'from who',
+        'who made this', 'who submitted', 'who opened', 'who filed', 'created by',
+        'requested by', 'sent by', 'submitted by', 'opened by', 'filed by'
+    ]
+    contextual_questions = [
+        'what', 'who', 'when', 'where', 'why', 'how', 'explain', 'show me', 'tell me more'
+    ]
+    if any(keyword in message_lower for keyword in explicit_ticket_keywords):
+        intent = {'needs_ticket_details': True, 'is_casual': False}
+    elif any(keyword in message_lower for keyword in definite_ticket_keywords):
+        intent = {'needs_ticket_details': True, 'is_casual': False}
+    elif any(phrase in message_lower for phrase in casual_phrases):
+        intent = {'needs_ticket_details': False, 'is_casual': True}
+    elif any(word in message_lower for word in contextual_questions):
+        if len(message_lower.split()) <= 4 and not any(keyword in message_lower for keyword in definite_ticket_keywords):
+            intent = {'needs_ticket_details': False, 'is_casual': False}
+        else:
+            intent = {'needs_ticket_details': True, 'is_casual': False}
+    else:
+        intent = {'needs_ticket_details': False, 'is_casual': False}
+
+    fields = []
+    if intent['needs_ticket_details']:
+        message_lower = user_message.lower()
+        if 'status?' == message_lower.strip() or ('status' in message_lower and len(message_lower.split()) <= 3):
+            fields = ['status']
+        elif 'category?' == message_lower.strip() or ('category' in message_lower and len(message_lower.split()) <= 3):
+            fields = ['category']
+        elif 'urgency?' == message_lower.strip() or ('urgency' in message_lower and len(message_lower.split()) <= 3):
+            fields = ['urgency']
+        elif any(word in message_lower for word in ['when', 'date', 'created', 'received', 'reported', 'occurred', 'happen']) and ('this' in message_lower or 'ticket' in message_lower or 'issue' in message_lower):
+            fields = ['created']
+        elif any(word in message_lower for word in ['who', 'sender', 'from']) and any(word in message_lower for word in ['requested', 'sent', 'created', 'mail', 'request', 'ticket']):
+            fields = ['sender']
+    return dict(intent, fields=fields)
+
+
+def evaluate(name, analyze, examples, repeat, verbose):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for example in examples:
+            analyze(example['message'])
+    per_message_us = (time.perf_counter() - start) / (repeat * len(examples)) * 1e6
+
+    casual_ok = ticket_ok = fields_ok = 0
+    answered = answered_right = should_answer = wrong_direct = 0
+    for example in examples:
+        result = analyze(example['message'])
+        casual_ok += result['is_casual'] == example['is_casual']
+        ticket_ok += result['needs_ticket_details'] == example['needs_ticket_details']
+        fields_ok += result['fields'] == example['fields']
+        should_answer += bool(example['fields'])
+        if result['fields']:
+            answered += 1
+            answered_right += result['fields'] == example['fields']
+            wrong_direct += not example['fields']
+        if verbose and (result['fields'] != example['fields'] or result['needs_ticket_details'] != example['needs_ticket_details']):
+            print(f"    {name}: {example['message']!r} -> ticket={result['needs_ticket_details']} fields={result['fields']} "
+                  f"(expected ticket={example['needs_ticket_details']} fields={example['fields']})")
+
+    total = len(examples)
+    print(f"{name}")
+    print(f"  time per message:         {per_message_us:.1f} us")
+    print(f"  casual detected right:    {casual_ok}/{total} ({casual_ok / total:.0%})")
+    print(f"  needs-ticket right:       {ticket_ok}/{total} ({ticket_ok / total:.0%})")
+    print(f"  direct answer right:      {fields_ok}/{total} ({fields_ok / total:.0%})")
+    print(f"  answered without the AI:  {answered_right}/{should_answer} field questions answered correctly, "
+          f"{answered - answered_right} answered wrongly ({wrong_direct} of them should have gone to the AI)")
+    return per_message_us
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', default=DEFAULT_MESSAGES, help='labelled messages (JSON lines)')
+    parser.add_argument('--repeat', type=int, default=2000, help='passes over the messages for timing')
+    parser.add_argument('--verbose', action='store_true', help='list every disagreement with the labels')
+    args = parser.parse_args()
+
+    with open(args.messages, encoding='utf-8') as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+    print(f"{len(examples)} labelled messages, {args.repeat} timing passes\n")
+
+    legacy_us = evaluate('Keyword lists (previous)', legacy_analyze, examples, args.repeat, args.verbose)
+    compiled_us = evaluate('Compiled matcher', analyze_intent, examples, args.repeat, args.verbose)
+    print(f"\nSpeedup: {legacy_us / compiled_us:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
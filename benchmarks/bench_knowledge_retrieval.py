@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark: retrieved knowledge base chunks vs. inlining the whole document
+
+Compares categorization prompt size and build latency between the legacy
+full-document prompt (KB_RETRIEVAL_TOP_K=0) and BM25 retrieval of the top-k
+chunks. Pass --live to also time real OpenAI round trips (uses OPENAI_API_KEY
+and costs tokens).
+
+Usage:
+    python benchmarks/bench_knowledge_retrieval.py [--dir app/knowledge] [--top-k 3] [--live 5]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import ai_service as ai_module
+from app.ai_service import TeBSTrackAI
+from app.knowledge_library import KnowledgeLibrary
+from app.text_chunker import estimate_tokens
+
+SAMPLE_TICKETS = [
+    ("VPN account request", "Hi team, please create a FortiClient VPN account for our new joiner starting Monday."),
+    ("Door access card expired", "My door access card stopped working this morning, can you extend it?"),
+    ("Spam calls on office phone", "We keep getting spam calls on extension 282 since yesterday."),
+    ("Printer not working", "The secured printer on level 3 is not releasing my print jobs."),
+    ("Laptop battery swollen", "My laptop battery is bulging and the touchpad no longer clicks."),
+    ("Rename telephone display", "Please rename the display name on the desk phone for our new intern."),
+    ("Guest WiFi password", "What is the guest WiFi password for visitors tomorrow?"),
+    ("M365 license for new hire", "Need a Microsoft 365 license and mailbox for a new employee."),
+    ("Server provisioning", "Requesting a new Windows server VM for the staging environment."),
+    ("SVN repository access", "Please grant me read access to the project SVN repository."),
+]
+
+CATEGORIES = [
+    "SVN & VPN", "Server request", "Joiners and Exit", "Laptop Hardware Issue", "TMS",
+    "Application Access Requests", "M365", "DevOps", "Other request",
+]
+URGENCY_LEVELS = ["Low", "Medium", "High", "Urgent"]
+
+
+def prompt_text(messages):
+    return "\n".join(m['content'] for m in messages)
+
+
+def build_prompts(ai, top_k):
+    """Build one categorization request (messages) per sample ticket, returning (prompts, seconds per prompt)"""
+    ai_module.KB_RETRIEVAL_TOP_K = top_k
+    prompts = []
+    timings = []
+    for subject, body in SAMPLE_TICKETS:
+        start = time.perf_counter()
+        prompts.append(ai._build_categorization_messages(subject, body, "user@example.com", CATEGORIES, URGENCY_LEVELS))
+        timings.append(time.perf_counter() - start)
+    return prompts, timings
+
+
+def time_live_calls(ai, prompts, count):
+    """Send categorization requests to OpenAI and return (latencies, prompt_tokens)"""
+    latencies = []
+    prompt_tokens = []
+    for messages in prompts[:count]:
+        start = time.perf_counter()
+        response = ai.client.chat.completions.create(
+            model=ai.model,
+            messages=messages,
+            temperature=0.3,
+            response_format={"type": "json_object"}
+        )
+        latencies.append(time.perf_counter() - start)
+        prompt_tokens.append(response.usage.prompt_tokens)
+    return latencies, prompt_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default='app/knowledge', help='knowledge directory to index')
+    parser.add_argument('--top-k', type=int, default=3, help='chunks injected per prompt')
+    parser.add_argument('--live', type=int, default=0, metavar='N', help='also time N real OpenAI calls per mode')
+    args = parser.parse_args()
+
+    # Skip __init__ so the benchmark needs neither a database nor an API key
+    ai = TeBSTrackAI.__new__(TeBSTrackAI)
+    ai.model = "gpt-4o-mini"
+    ai.knowledge_base = ""
+    ai.knowledge_library = KnowledgeLibrary(args.dir)
+
+    start = time.perf_counter()
+    ai._rebuild_knowledge_index()
+    load_seconds = time.perf_counter() - start
+    if not ai.knowledge_library.documents:
+        sys.exit(f"No knowledge documents found in {args.dir}")
+
+    for doc in ai.knowledge_library.sources():
+        print(f"Document: {doc['source']} ({doc['characters']:,} chars, {doc['chunks']} chunks)")
+    print(f"Load + index: {load_seconds * 1000:.1f} ms (cached extractions are reused across runs)\n")
+
+    results = {}
+    for label, top_k in (("full document", 0), (f"top-{args.top_k} retrieval", args.top_k)):
+        prompts, timings = build_prompts(ai, top_k)
+        sizes = [len(prompt_text(p)) for p in prompts]
+        results[label] = prompts
+        print(f"[{label}]")
+        print(f"  prompt chars   mean={statistics.mean(sizes):,.0f}  max={max(sizes):,}")
+        print(f"  est. tokens    mean={statistics.mean(estimate_tokens(prompt_text(p)) for p in prompts):,.0f}")
+        print(f"  build latency  mean={statistics.mean(timings) * 1e6:,.0f} us  max={max(timings) * 1e6:,.0f} us")
+
+    full_mean = statistics.mean(len(prompt_text(p)) for p in results["full document"])
+    retrieved_mean = statistics.mean(len(prompt_text(p)) for p in results[f"top-{args.top_k} retrieval"])
+    print(f"\nPrompt size reduction: {(1 - retrieved_mean / full_mean) * 100:.1f}%")
+
+    if args.live:
+        import openai
+        ai.client = openai.OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        print(f"\nLive OpenAI round trips ({args.live} per mode):")
+        for label, prompts in results.items():
+            latencies, tokens = time_live_calls(ai, prompts, args.live)
+            print(f"  [{label}] latency mean={statistics.mean(latencies):.2f}s  "
+                  f"prompt_tokens mean={statistics.mean(tokens):,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+Load test: AI categorization, template recommendation and chatbot throughput
+
+Starts the mock LLM server in-process, points the AI service at it, and
+fires concurrent requests through the real TeBSTrackAI code paths (prompt
+building, knowledge retrieval, database lookups, response parsing). No
+OpenAI tokens are spent; streamed chatbot replies also report time to first
+token, and every scenario reports how much of its prompts a provider's prefix
+cache would reuse. Uses the application database for categories and
+templates.
+
+Usage:
+    python benchmarks/bench_llm_throughput.py [--requests 200] [--concurrency 16] [--latency-ms 300] [--error-rate 0.05]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_knowledge_retrieval import SAMPLE_TICKETS
+from mock_llm_server import MockLLMServer
+
+SCENARIOS = {
+    'categorize': lambda ai, subject, body: ai.categorize_ticket(subject, body, "user@example.com"),
+    'recommend': lambda ai, subject, body: ai.recommend_email_template(subject, body, None),
+    'chatbot': lambda ai, subject, body: ai.chatbot_response(
+        "How should I handle this request?",
+        {'id': 1, 'subject': subject, 'description': body, 'sender': 'user@example.com', 'category': 'Other request'}),
+    'chatbot_stream': lambda ai, subject, body: ai.chatbot_response_stream(
+        "How should I handle this request?",
+        {'id': 1, 'subject': subject, 'description': body, 'sender': 'user@example.com', 'category': 'Other request'}),
+}
+
+
+def run_scenario(app, ai, scenario, requests, concurrency):
+    """Return (wall seconds, per-request latencies, time-to-first-token latencies for streamed scenarios)"""
+    call = SCENARIOS[scenario]
+
+    def one(i):
+        subject, body = SAMPLE_TICKETS[i % len(SAMPLE_TICKETS)]
+        with app.app_context():
+            start = time.perf_counter()
+            result = call(ai, subject, f"{body} (request {i})")
+            first = None
+            if isinstance(result, Iterator):
+                for _ in result:
+                    if first is None:
+                        first = time.perf_counter() - start
+            return time.perf_counter() - start, first
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    first_tokens = sorted(f for _, f in results if f is not None)
+    return time.perf_counter() - start, [total for total, _ in results], first_tokens
+
+
+def _percentiles(values):
+    return (f"p50={statistics.median(values) * 1000:,.0f} ms  "
+            f"p95={values[int(len(values) * 0.95) - 1] * 1000:,.0f} ms  max={values[-1] * 1000:,.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent callers')
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='mock server mean latency')
+    parser.add_argument('--jitter-ms', type=float, default=100.0, help='mock server latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of mock requests that fail')
+    parser.add_argument('--error-status', type=int, default=429, help='HTTP status of injected failures')
+    parser.add_argument('--token-ms', type=float, default=20.0, help='mock server delay between streamed chunks')
+    parser.add_argument('--top-k', type=int, default=None,
+                        help='knowledge chunks per prompt (0 sends the whole document, making it part of the cached prefix)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset of ' + ', '.join(SCENARIOS))
+    args = parser.parse_args()
+
+    server = MockLLMServer(port=0, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           error_rate=args.error_rate, error_status=args.error_status,
+                           token_ms=args.token_ms).start()
+    os.environ['LLM_BACKEND'] = 'mock'
+    os.environ['LLM_BASE_URL'] = server.base_url
+
+    from app import create_app
+    from app import ai_service as ai_module
+    from app import local_classifier
+    from app.ai_service import TeBSTrackAI
+    from app.chatbot_cache import chatbot_cache
+    from app.llm_backend import ChatBackend
+
+    # Every request should reach the (mock) LLM
+    local_classifier.CONFIDENCE_THRESHOLD = 2.0
+    chatbot_cache.max_entries = 0
+    if args.top_k is not None:
+        ai_module.KB_RETRIEVAL_TOP_K = args.top_k
+
+    app = create_app()
+    with app.app_context():
+        ai = TeBSTrackAI()
+    # Explicitly use the mock even if the database selects another backend
+    ai.backend = ChatBackend('mock', 'mock-model', base_url=server.base_url)
+    ai.client = ai.backend.client
+
+    print(f"Mock LLM at {server.base_url}: latency {args.latency_ms:g}±{args.jitter_ms:g} ms, "
+          f"error rate {args.error_rate:.0%} (HTTP {args.error_status})")
+    print(f"{args.requests} requests per scenario, concurrency {args.concurrency}\n")
+
+    try:
+        for scenario in args.scenarios.split(','):
+            before = dict(server.stats)
+            wall, latencies, first_tokens = run_scenario(app, ai, scenario.strip(), args.requests, args.concurrency)
+            latencies.sort()
+            upstream = server.stats['requests'] - before['requests']
+            errors = server.stats['errors'] - before['errors']
+            prompt_tokens = server.stats['prompt_tokens'] - before['prompt_tokens']
+            cached_tokens = server.stats['cached_tokens'] - before['cached_tokens']
+            print(f"[{scenario}]")
+            print(f"  throughput   {len(latencies) / wall:,.1f} req/s  ({wall:.2f}s wall)")
+            print(f"  latency      {_percentiles(latencies)}")
+            if first_tokens:
+                print(f"  first token  {_percentiles(first_tokens)}")
+            print(f"  upstream     {upstream} LLM calls, {errors} injected errors")
+            if prompt_tokens:
+                print(f"  prompt cache {cached_tokens:,} of {prompt_tokens:,} prompt tokens cached "
+                      f"({cached_tokens / prompt_tokens:.0%}, simulated prefix caching)")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
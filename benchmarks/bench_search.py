@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark: FTS5 ticket search vs. LIKE scans
+
+Builds a throwaway SQLite database with synthetic tickets and email threads
+(500k messages by default), creates the full-text indexes the app uses, and
+times search_tickets() with FTS5 against the LIKE fallback for the same
+queries, for an admin and an infra user. Also reports the cost the index
+triggers add to inserting new emails.
+
+Usage:
+    python benchmarks/bench_search.py [--messages 500000] [--per-ticket 10] [--repeat 5] [--keep PATH]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+
+WORDS = (
+    "printer vpn account password reset laptop battery wifi guest license mailbox server access door card "
+    "phone extension display monitor keyboard mouse network outage slow email attachment calendar meeting "
+    "teams install software update error crash login locked expired request approval urgent level office "
+    "screen docking station cable adapter backup restore folder share permission drive storage quota"
+).split()
+FILLER = (
+    "hi team please could you help with the issue since this morning thanks regards we have tried again "
+    "it still does not work and it is affecting our work kindly advise on next steps"
+).split()
+QUERIES = ["printer", "vpn password", "docking station cable", "mailbox quota", "teams meeting crash", "backu"]
+
+
+def sentence(rng, words):
+    text = rng.sample(WORDS, 3) + rng.choices(FILLER, k=words)
+    rng.shuffle(text)
+    return ' '.join(text)
+
+
+def populate(db, messages, per_ticket, seed=42):
+    """Insert synthetic tickets and their email threads in bulk (before the indexes exist)"""
+    rng = random.Random(seed)
+    tickets = max(messages // per_ticket, 1)
+    ticket_rows, message_rows = [], []
+    for ticket_id in range(1, tickets + 1):
+        ticket_rows.append({
+            'id': ticket_id, 'subject': ' '.join(rng.sample(WORDS, 4)), 'description': sentence(rng, 30),
+            'sender': f'user{ticket_id % 500}@example.com', 'status': 'Open',
+            # Half unassigned, the rest spread over users 1-10
+            'assigned_to': None if ticket_id % 2 else ticket_id % 10 + 1,
+        })
+    for message_id in range(1, messages + 1):
+        ticket = ticket_rows[min((message_id - 1) // per_ticket, tickets - 1)]
+        message_rows.append({
+            'id': message_id, 'ticket_id': ticket['id'], 'subject': f"Re: {ticket['subject']}",
+            'body': sentence(rng, 40), 'sender': 'someone@example.com',
+        })
+    from app.models import Ticket, EmailMessage
+    with db.engine.begin() as connection:
+        for start in range(0, len(ticket_rows), 10000):
+            connection.execute(db.insert(Ticket), ticket_rows[start:start + 10000])
+        for start in range(0, len(message_rows), 10000):
+            connection.execute(db.insert(EmailMessage), message_rows[start:start + 10000])
+    return tickets
+
+
+def time_queries(search, user, repeat):
+    timings = {}
+    for text in QUERIES:
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            result = search(text, user)
+            samples.append(time.perf_counter() - started)
+        timings[text] = (statistics.median(samples), len(result))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500000, help='synthetic email messages to generate')
+    parser.add_argument('--per-ticket', type=int, default=10, help='messages per ticket thread')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per query (the median is reported)')
+    parser.add_argument('--keep', metavar='PATH', help='write the database here and keep it, instead of a temp file')
+    args = parser.parse_args()
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(prefix='tebstrack-search-'), 'bench.db')
+    if os.path.exists(path):
+        os.remove(path)
+    config.Config.SQLALCHEMY_DATABASE_URI = f'sqlite:///{os.path.abspath(path)}'
+    config.Config.SECRET_KEY = config.Config.SECRET_KEY or 'benchmark'
+
+    from app import create_app
+    from app.models import db
+    from app.search_index import ensure_search_indexes, ticket_text_search, message_text_search
+    from app.ticket_search import search_tickets, _like_search
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        tickets = populate(db, args.messages, args.per_ticket)
+        print(f"Generated {tickets:,} tickets and {args.messages:,} messages in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        ensure_search_indexes()
+        if not (ticket_text_search.exists() and message_text_search.exists()):
+            print("SQLite FTS5 is not available here; nothing to compare")
+            return
+        print(f"Built full-text indexes in {time.perf_counter() - started:.1f}s "
+              f"(database {os.path.getsize(path) / 1e6:,.0f} MB)\n")
+
+        users = {'admin': SimpleNamespace(id=1, role='admin'), 'infra': SimpleNamespace(id=2, role='infra')}
+        modes = {
+            'FTS5 (ranked)': lambda text, user: search_tickets(text, user)['hits'],
+            'LIKE fallback': lambda text, user: _like_search(text, user, 20, 0)[:20],
+        }
+        for role, user in users.items():
+            print(f"[{role}]")
+            results = {label: time_queries(search, user, args.repeat) for label, search in modes.items()}
+            for text in QUERIES:
+                fts_seconds, fts_hits = results['FTS5 (ranked)'][text]
+                like_seconds, like_hits = results['LIKE fallback'][text]
+                print(f"  {text!r:26} fts={fts_seconds * 1000:8.1f} ms ({fts_hits:2} hits)  "
+                      f"like={like_seconds * 1000:9.1f} ms ({like_hits:2} hits)  x{like_seconds / fts_seconds:,.0f}")
+            print()
+
+        from app.models import EmailMessage
+        rng = random.Random(7)
+        rows = [{'ticket_id': rng.randint(1, tickets), 'subject': 'Re: follow up', 'body': sentence(rng, 40)}
+                for _ in range(1000)]
+        started = time.perf_counter()
+        with db.engine.begin() as connection:
+            for row in rows:
+                connection.execute(db.insert(EmailMessage), row)
+        print(f"Inserting 1,000 emails with index triggers: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    if not args.keep:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
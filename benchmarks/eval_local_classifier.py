@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""
+Evaluation: local ticket classifier accuracy, LLM escalation rate and latency
+
+Runs k-fold cross-validation of the TF-IDF + softmax regression classifier on
+labelled tickets (from the database, or a CSV with subject, body, category and
+urgency columns). For each confidence threshold it reports how many tickets
+would skip the LLM and how accurate those local answers are. Pass --save to
+train on all examples and install the model the app uses.
+
+Usage:
+    python benchmarks/eval_local_classifier.py [--csv tickets.csv] [--folds 5] [--save]
+"""
+
+import argparse
+import csv
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import local_classifier
+from app.local_classifier import LocalTicketClassifier
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95]
+
+
+def load_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [
+            {'subject': row['subject'], 'body': row.get('body', ''), 'category': row['category'],
+             'urgency': row['urgency'], 'weight': float(row.get('weight') or 1.0)}
+            for row in csv.DictReader(f)
+        ]
+
+
+def load_database():
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        return local_classifier.load_training_examples()
+
+
+def cross_validate(examples, folds):
+    """Return [(example, prediction)] with each prediction made by a model that never saw the example"""
+    shuffled = list(examples)
+    random.Random(0).shuffle(shuffled)
+    results = []
+    train_seconds = []
+    for fold in range(folds):
+        test = shuffled[fold::folds]
+        train = [e for i, e in enumerate(shuffled) if i % folds != fold]
+        start = time.perf_counter()
+        model = LocalTicketClassifier.train(train)
+        train_seconds.append(time.perf_counter() - start)
+        results.extend((e, model.predict(e['subject'], e['body'])) for e in test)
+    return results, train_seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--csv', help='labelled tickets CSV (default: the application database)')
+    parser.add_argument('--folds', type=int, default=5, help='cross-validation folds')
+    parser.add_argument('--save', action='store_true', help=f'train on everything and save to {local_classifier.MODEL_PATH}')
+    args = parser.parse_args()
+
+    examples = load_csv(args.csv) if args.csv else load_database()
+    categories = sorted({e['category'] for e in examples})
+    print(f"{len(examples)} labelled tickets, {len(categories)} categories")
+    if len(examples) < max(args.folds, local_classifier.MIN_TRAINING_EXAMPLES):
+        sys.exit(f"Need at least {max(args.folds, local_classifier.MIN_TRAINING_EXAMPLES)} labelled tickets to evaluate")
+
+    results, train_seconds = cross_validate(examples, args.folds)
+    category_accuracy = statistics.mean(p['category'] == e['category'] for e, p in results)
+    urgency_accuracy = statistics.mean(p['urgency'] == e['urgency'] for e, p in results)
+    print(f"\n{args.folds}-fold cross-validation (training {statistics.mean(train_seconds):.2f}s per fold)")
+    print(f"  category accuracy  {category_accuracy:.1%}")
+    print(f"  urgency accuracy   {urgency_accuracy:.1%}")
+
+    print("\n  threshold  handled locally  local accuracy")
+    for threshold in THRESHOLDS:
+        confident = [(e, p) for e, p in results if p['confidence'] >= threshold]
+        accuracy = statistics.mean(p['category'] == e['category'] for e, p in confident) if confident else 0.0
+        marker = '  <- LOCAL_CLASSIFIER_THRESHOLD' if threshold == local_classifier.CONFIDENCE_THRESHOLD else ''
+        print(f"  {threshold:>9.2f}  {len(confident) / len(results):>15.1%}  {accuracy:>14.1%}{marker}")
+
+    model = LocalTicketClassifier.train(examples)
+    timings = []
+    for e in examples * max(1, 2000 // len(examples)):
+        start = time.perf_counter()
+        model.predict(e['subject'], e['body'])
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    print(f"\nPrediction latency: mean={statistics.mean(timings) * 1e6:.0f} us  "
+          f"p95={timings[int(len(timings) * 0.95)] * 1e6:.0f} us  ({len(timings)} predictions)")
+
+    if args.save:
+        model.save(local_classifier.MODEL_PATH)
+        print(f"\nModel saved to {local_classifier.MODEL_PATH}")
+
+
+if __name__ == "__main__":
+    main()
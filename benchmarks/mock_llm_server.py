@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+"""
+OpenAI-compatible mock chat completion server for offline load testing
+
+Answers POST /v1/chat/completions with deterministic responses shaped like
+the ones TeBSTrack expects (categorization, batched categorization, template
+recommendation, action steps and free-text chatbot replies, streamed or not).
+Usage blocks report cached prompt tokens as a provider with prefix caching would.
+Latency and error injection are configurable. Point the app at it by choosing
+"Local mock server" under Settings > AI Backend (or LLM_BACKEND=mock).
+
+Usage:
+    python benchmarks/mock_llm_server.py [--port 8089] [--latency-ms 300] [--jitter-ms 100] [--error-rate 0.05] [--error-status 429] [--token-ms 20]
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Simulated provider prompt caching: prompts of at least 1024 tokens reuse any previously
+# seen prefix in 128-token blocks (tokens approximated as 4 characters)
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_CHARS = 128 * 4
+CACHE_MAX_PREFIXES = 100000
+
+
+def _pick(options, key):
+    """Deterministically choose an option from the prompt text"""
+    if not options:
+        return None
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    return options[int.from_bytes(digest[:4], 'big') % len(options)]
+
+
+def _section(prompt, heading):
+    """Text following a 'HEADING:' line up to the next blank line"""
+    match = re.search(rf"{re.escape(heading)}:\n(.*?)(?:\n\s*\n|$)", prompt, re.S)
+    return match.group(1).strip() if match else ""
+
+
+def _json_section(prompt, heading):
+    """A pretty-printed JSON object following a 'HEADING:' line"""
+    start = prompt.find(f"{heading}:\n")
+    if start < 0:
+        return {}
+    try:
+        value, _ = json.JSONDecoder().raw_decode(prompt[start + len(heading) + 2:])
+        return value if isinstance(value, dict) else {}
+    except ValueError:
+        return {}
+
+
+def build_reply(messages, json_mode):
+    """Deterministic reply content for a chat request"""
+    prompt = "\n\n".join(str(m.get('content', '')) for m in messages)
+    categories = [c.strip() for c in _section(prompt, 'AVAILABLE CATEGORIES').split(',') if c.strip()]
+    urgencies = ["Low", "Medium", "High", "Urgent"]
+
+    if 'Analyze each of these' in prompt and categories:
+        tickets = re.findall(r"\[Ticket (\d+)\]\n(.*?)(?=\n\n\[Ticket \d+\]|\Z)", prompt, re.S)
+        return json.dumps({"results": [
+            {"ticket": int(number), "category": _pick(categories, text), "urgency": _pick(urgencies, text + 'u'),
+             "confidence": 0.9, "reasoning": "Mock batched categorization"}
+            for number, text in tickets
+        ]})
+    if categories:
+        return json.dumps({"category": _pick(categories, prompt), "urgency": _pick(urgencies, prompt + 'u'),
+                           "confidence": 0.9, "reasoning": "Mock categorization"})
+    if 'AVAILABLE EMAIL TEMPLATES' in prompt:
+        names = list(_json_section(prompt, 'AVAILABLE EMAIL TEMPLATES'))
+        name = _pick(names, prompt)
+        return json.dumps({"recommended_template": name, "confidence": 0.85 if name else 0.0,
+                           "reasoning": "Mock template recommendation", "alternative_templates": names[:2],
+                           "template_match_score": 0.85 if name else 0.0})
+    if 'AVAILABLE TEMPLATES' in prompt:
+        names = list(_json_section(prompt, 'AVAILABLE TEMPLATES'))
+        name = _pick(names, prompt)
+        return json.dumps({"template_name": name, "confidence": 0.85 if name else 0.0,
+                           "reasoning": "Mock template recommendation", "recommended": bool(name)})
+    if '"action_steps"' in prompt:
+        return json.dumps({"action_steps": [
+            {"order": i, "title": f"Mock step {i}", "description": f"Mock action step {i}", "type": "manual", "is_automated": False}
+            for i in range(1, 4)
+        ]})
+    if json_mode:
+        return json.dumps({"result": "mock", "confidence": 0.5})
+    return f"Mock assistant reply (ref {hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8]}). " \
+           "Check the knowledge base section for this request and follow the documented steps."
+
+
+class MockLLMServer:
+    """Threaded mock server; use start()/stop() in-process or run this file"""
+
+    def __init__(self, host='127.0.0.1', port=8089, latency_ms=300.0, jitter_ms=100.0,
+                 error_rate=0.0, error_status=429, seed=0, token_ms=0.0):
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'prompt_tokens': 0, 'cached_tokens': 0}
+        self.prefixes = set()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _draw(self):
+        """(delay seconds, inject error) for the next request; seeded so runs are repeatable"""
+        with self.lock:
+            self.stats['requests'] += 1
+            delay = max(0.0, self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            fail = self.random.random() < self.error_rate
+            if fail:
+                self.stats['errors'] += 1
+            return delay, fail
+
+    def cached_tokens(self, messages):
+        """Prompt tokens served from the simulated prefix cache, remembering this prompt's prefixes"""
+        text = "".join(f"{m.get('role', '')}\n{m.get('content', '')}\n" for m in messages)
+        digest = hashlib.sha256()
+        blocks = []
+        for start in range(0, len(text) - CACHE_BLOCK_CHARS + 1, CACHE_BLOCK_CHARS):
+            digest.update(text[start:start + CACHE_BLOCK_CHARS].encode('utf-8'))
+            blocks.append(digest.copy().digest())
+        with self.lock:
+            hits = 0
+            for block in blocks:
+                if block not in self.prefixes:
+                    break
+                hits += 1
+            if len(self.prefixes) > CACHE_MAX_PREFIXES:
+                self.prefixes.clear()
+            self.prefixes.update(blocks)
+            cached = hits * CACHE_BLOCK_CHARS // 4 if len(text) // 4 >= CACHE_MIN_TOKENS else 0
+            cached = cached if cached >= CACHE_MIN_TOKENS else 0
+            self.stats['prompt_tokens'] += len(text) // 4
+            self.stats['cached_tokens'] += cached
+            return cached
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip('/').endswith('/models'):
+                    self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "Not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self._send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+                    return
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send_json(404, {"error": {"message": "Not found"}})
+                    return
+
+                delay, fail = server._draw()
+                time.sleep(delay)
+                if fail:
+                    error_type = 'rate_limit_exceeded' if server.error_status == 429 else 'server_error'
+                    self._send_json(server.error_status, {"error": {"message": "Injected mock failure", "type": error_type}})
+                    return
+
+                json_mode = (request.get('response_format') or {}).get('type') == 'json_object'
+                content = build_reply(request.get('messages', []), json_mode)
+                model = request.get('model', 'mock-model')
+                completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+                prompt_tokens = sum(len(str(m.get('content', ''))) for m in request.get('messages', [])) // 4
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                         "total_tokens": prompt_tokens + len(content) // 4,
+                         "prompt_tokens_details": {"cached_tokens": min(prompt_tokens, server.cached_tokens(request.get('messages', [])))}}
+                if request.get('stream'):
+                    include_usage = (request.get('stream_options') or {}).get('include_usage')
+                    self._stream(completion_id, model, content, usage if include_usage else None)
+                    return
+                # A non-streamed reply arrives once the whole completion has been "generated"
+                time.sleep(server.token_ms * len(re.findall(r"\S+\s*", content)) / 1000)
+                self._send_json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": usage,
+                })
+
+            def _stream(self, completion_id, model, content, usage=None):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                pieces = re.findall(r"\S+\s*", content) or [content]
+                for index, piece in enumerate(pieces + [None]):
+                    if index and server.token_ms:
+                        time.sleep(server.token_ms / 1000)
+                    delta = {"content": piece} if piece is not None else {}
+                    if index == 0:
+                        delta["role"] = "assistant"
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [{"index": 0, "delta": delta,
+                                                          "finish_reason": None if piece is not None else "stop"}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                if usage:
+                    chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                             "model": model, "choices": [], "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=300.0, help='mean response latency')
+    parser.add_argument('--jitter-ms', type=float, default=100.0, help='uniform +/- latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests that fail')
+    parser.add_argument('--error-status', type=int, default=429, help='HTTP status of injected failures (429 or 5xx)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for latency jitter and error injection')
+    parser.add_argument('--token-ms', type=float, default=0.0, help='delay between streamed chunks')
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate, args.error_status,
+                           args.seed, args.token_ms)
+    print(f"Mock LLM server on {server.base_url} (latency {args.latency_ms:g}±{args.jitter_ms:g} ms, "
+          f"error rate {args.error_rate:.0%} as HTTP {args.error_status})")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
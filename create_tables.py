@@ -12,6 +12,7 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Import the Flask app and database
 from app import create_app, db
+from app.models import add_missing_columns, add_missing_indexes
 
 def create_tables():
     """Create all database tables"""
@@ -20,6 +21,8 @@ def create_tables():
     with app.app_context():
         # Create all tables
         db.create_all()
+        add_missing_columns()
+        add_missing_indexes()
         print("✅ Database tables created successfully!")
         
         # Print created tables
@@ -2,9 +2,11 @@
 """Initialize database tables"""
 
 from run import app
-from app.models import db
+from app.models import db, add_missing_columns, add_missing_indexes
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        add_missing_columns()
+        add_missing_indexes()
         print('Database tables created successfully')
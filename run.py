@@ -1,11 +1,13 @@
 from app import create_app
-from app.models import db
+from app.models import db, add_missing_columns, add_missing_indexes
 
 app = create_app()
 
 # Initialize the database
 with app.app_context():
     db.create_all()
+    add_missing_columns()
+    add_missing_indexes()
     print("Database created.")
 
 if __name__ == '__main__':